@@ -1,7 +1,7 @@
 from django.contrib import admin
 from .models import (
     UserKeyPair, Conversation, ConversationMember, 
-    Message, MessageReceipt, TypingIndicator
+    Message, MessageArchive, TypingIndicator
 )
 
 
@@ -15,7 +15,7 @@ class UserKeyPairAdmin(admin.ModelAdmin):
 class ConversationMemberInline(admin.TabularInline):
     model = ConversationMember
     extra = 0
-    readonly_fields = ('joined_at',)
+    readonly_fields = ('joined_at', 'last_delivered_seq', 'last_read_seq')
 
 
 @admin.register(Conversation)
@@ -33,15 +33,15 @@ class ConversationAdmin(admin.ModelAdmin):
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ('uuid', 'conversation', 'sender', 'message_type', 'created_at', 'is_deleted')
+    list_display = ('uuid', 'conversation', 'seq', 'sender', 'message_type', 'created_at', 'is_deleted')
     list_filter = ('message_type', 'is_deleted', 'created_at')
     search_fields = ('uuid', 'sender__username')
-    readonly_fields = ('uuid', 'created_at', 'edited_at')
+    readonly_fields = ('uuid', 'seq', 'created_at', 'edited_at')
     
     # Note: Le contenu est chiffré, on ne peut pas le lire
     fieldsets = (
         ('Informations', {
-            'fields': ('uuid', 'conversation', 'sender', 'message_type', 'reply_to')
+            'fields': ('uuid', 'conversation', 'seq', 'sender', 'message_type', 'reply_to')
         }),
         ('Contenu E2EE', {
             'fields': ('encrypted_content', 'encrypted_metadata', 'encrypted_file'),
@@ -53,10 +53,11 @@ class MessageAdmin(admin.ModelAdmin):
     )
 
 
-@admin.register(MessageReceipt)
-class MessageReceiptAdmin(admin.ModelAdmin):
-    list_display = ('message', 'user', 'receipt_type', 'timestamp')
-    list_filter = ('receipt_type', 'timestamp')
+@admin.register(MessageArchive)
+class MessageArchiveAdmin(admin.ModelAdmin):
+    list_display = ('conversation', 'month', 'seq_min', 'seq_max', 'count', 'path')
+    list_filter = ('month',)
+    readonly_fields = ('conversation', 'month', 'path', 'offset', 'length', 'seq_min', 'seq_max', 'count', 'created_at')
 
 
 @admin.register(TypingIndicator)
@@ -1,7 +1,17 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
     verbose_name = 'Chat E2EE'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        backend = getattr(settings, 'CHANNEL_LAYERS', {}).get('default', {}).get('BACKEND')
+        if backend == 'chat.layers.ShardedPubSubChannelLayer':
+            # Internes de channels_redis vérifiés au démarrage, pas au premier message
+            from .layers import check_channels_redis
+            check_channels_redis()
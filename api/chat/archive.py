@@ -0,0 +1,165 @@
+"""
+Ondes Chat - Archives froides de l'historique
+
+archive_messages exporte chaque mois antérieur au seuil dans un fichier
+AAAA-MM.bin du stockage privé `chat_archive` (STORAGES, hors de l'arbre
+média public; les archives antérieures, sous chat/archive/ du stockage
+média, restent lisibles et référencées pour media_gc): un bloc gzip par
+conversation, contenant la liste msgpack de ses messages (format
+serialize_message, charges en octets bruts). MessageArchive indexe les
+blocs (conversation, mois, offset, longueur, intervalle de seq): relire
+l'historique d'une conversation ne décompresse que ses propres blocs.
+
+Les lignes exportées quittent ensuite la base (partition détachée sous
+PostgreSQL, DELETE par intervalle ailleurs). get_messages (WebSocket et
+REST) complète une page trop courte avec les archives, par seq
+décroissant; les messages archivés portent `archived: true`. Les
+pièces jointes restent dans le stockage mais ne sont plus servies.
+"""
+import gzip
+import tempfile
+
+import msgpack
+from django.core.files import File
+from django.core.files.storage import default_storage, storages
+from django.db import connection, transaction
+
+from . import partitions
+from .models import Conversation, ConversationMember, Message, MessageArchive
+from .sync import serialize_message
+
+LEGACY_PREFIX = 'chat/archive/'
+
+
+def archive_storage(path=''):
+    """Stockage d'une archive (les anciennes sont dans le stockage média)"""
+    if path.startswith(LEGACY_PREFIX):
+        return default_storage
+    return storages['chat_archive']
+
+
+def archive_record(message):
+    """Message tel qu'archivé (les pièces jointes ne suivent pas)"""
+    record = serialize_message(message)
+    record['conversation_id'] = message.conversation_id
+    record['encrypted_file'] = None
+    record['archived'] = True
+    return record
+
+
+def _pack(records):
+    return gzip.compress(msgpack.packb(records, use_bin_type=True))
+
+
+def export_month(month, dry_run=False):
+    """
+    Exporte puis retire les messages d'un mois.
+
+    Returns:
+        (messages exportés, conversations)
+    """
+    start, end = partitions.month_bounds(month)
+    rows = Message.objects.filter(
+        created_at__gte=start, created_at__lt=end
+    ).select_related('sender', 'reply_to').order_by('conversation_id', 'seq')
+    if dry_run:
+        return rows.count(), rows.values('conversation_id').distinct().count()
+
+    entries = []
+    with tempfile.TemporaryFile() as tmp:
+        current, records = None, []
+
+        def flush():
+            if not records:
+                return
+            block = _pack(records)
+            entries.append(MessageArchive(
+                conversation_id=current, month=month, path='',
+                offset=tmp.tell(), length=len(block),
+                seq_min=records[0]['seq'], seq_max=records[-1]['seq'], count=len(records),
+            ))
+            tmp.write(block)
+
+        for message in rows.iterator(chunk_size=2000):
+            if message.conversation_id != current:
+                flush()
+                current, records = message.conversation_id, []
+            records.append(archive_record(message))
+        flush()
+        if not entries:
+            return 0, 0
+
+        tmp.seek(0)
+        path = archive_storage().save(f'{month:%Y-%m}.bin', File(tmp))
+
+    for entry in entries:
+        entry.path = path
+    with transaction.atomic():
+        MessageArchive.objects.bulk_create(entries)
+        archived_ids = Message.objects.filter(created_at__gte=start, created_at__lt=end).values('id')
+        Conversation.objects.filter(last_message_id__in=archived_ids).update(last_message=None)
+        ConversationMember.objects.filter(last_read_message_id__in=archived_ids).update(last_read_message=None)
+        if month in partitions.list_partitions():
+            partitions.drop_partition(month)
+        else:
+            # Sans cascade Django: les réponses gardent leur reply_to. Bornes
+            # au format de la colonne (texte sous SQLite, comparé tel quel)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM "{partitions.TABLE}" WHERE created_at >= %s AND created_at < %s',
+                    [connection.ops.adapt_datetimefield_value(value) for value in (start, end)]
+                )
+    return sum(entry.count for entry in entries), len(entries)
+
+
+# ========== LECTURE ==========
+
+def read_entry(entry):
+    """Messages d'un bloc (un seul bloc lu et décompressé)"""
+    with archive_storage(entry.path).open(entry.path, 'rb') as f:
+        f.seek(entry.offset)
+        block = f.read(entry.length)
+    return msgpack.unpackb(gzip.decompress(block), raw=False)
+
+
+def archived_messages(conversation_id, before_seq=None, limit=50):
+    """
+    Messages archivés d'une conversation, seq < before_seq, les plus
+    récents d'abord lus; renvoyés par seq croissant.
+    """
+    entries = MessageArchive.objects.filter(conversation_id=conversation_id)
+    if before_seq is not None:
+        entries = entries.filter(seq_min__lt=before_seq)
+
+    result = []
+    for entry in entries.order_by('-seq_max'):
+        records = [
+            r for r in read_entry(entry)
+            if before_seq is None or r['seq'] < before_seq
+        ]
+        result = records + result
+        if len(result) >= limit:
+            break
+    return result[-limit:] if limit else []
+
+
+def rest_record(record, conversation_id, members):
+    """Message archivé au format de MessageSerializer"""
+    receipts = Message(seq=record['seq'], sender_id=record['sender_id']).receipt_status(members)
+    return {**record, 'conversation': conversation_id, 'receipts': receipts}
+
+
+def fill_page(conversation_id, page, limit, before_seq=None):
+    """
+    Complète une page d'historique (seq croissant) trop courte avec les
+    archives antérieures à son premier message (ou à before_seq si la
+    page est vide).
+    """
+    if len(page) >= limit:
+        return page
+    if page:
+        before_seq = page[0]['seq']
+    if not MessageArchive.objects.filter(conversation_id=conversation_id).exists():
+        return page
+    return archived_messages(conversation_id, before_seq, limit - len(page)) + page
+
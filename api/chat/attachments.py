@@ -0,0 +1,150 @@
+"""
+Ondes Chat - Pièces jointes chiffrées
+
+Envoi: le client crée le message (type image / video / audio / file) puis
+envoie le fichier chiffré brut (application/octet-stream, pas de
+multipart) sur PUT /api/chat/messages/<uuid>/attachment/. Le corps est
+recopié vers le stockage par blocs, sans être chargé en mémoire, et
+plafonné à CHAT_ATTACHMENT_MAX_SIZE.
+
+Téléchargement: GET sur la même URL, réservé aux membres de la
+conversation.
+- CHAT_ATTACHMENT_ACCEL_PREFIX défini (production): réponse vide avec
+  X-Accel-Redirect, nginx sert le fichier (Range, reprise) depuis une
+  location `internal`;
+- stockage S3: redirection vers une URL signée de courte durée;
+- sinon (développement): Python sert le fichier, Range compris.
+"""
+import io
+import os
+import re
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.urls import reverse
+
+CHUNK_SIZE = 64 * 1024
+ATTACHMENT_TYPES = ('image', 'video', 'audio', 'file')
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+def max_size():
+    return getattr(settings, 'CHAT_ATTACHMENT_MAX_SIZE', 500 * 1024 * 1024)
+
+
+def download_path(message_uuid):
+    return reverse('chat-attachment', kwargs={'message_uuid': message_uuid})
+
+
+def storage_name(message):
+    """Nom relatif à upload_to: un dossier par conversation"""
+    return f"{message.conversation.uuid}/{message.uuid}.bin"
+
+
+class UploadStream(io.RawIOBase):
+    """Corps de la requête lu par blocs, taille plafonnée"""
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.limit = limit
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        chunk = self.stream.read(CHUNK_SIZE if size is None or size < 0 else size)
+        self.size += len(chunk)
+        if self.size > self.limit:
+            raise AttachmentTooLarge()
+        return chunk
+
+
+# ========== TÉLÉCHARGEMENT ==========
+
+def parse_range(header, size):
+    """
+    En-tête Range (une seule plage) → (début, fin incluse).
+
+    Returns:
+        None sans Range exploitable (réponse complète), ValueError si la
+        plage est hors du fichier (416).
+    """
+    match = _RANGE.match(header or '')
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # bytes=-N: les N derniers octets
+        start, end = max(0, size - int(end)), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def _iter_file(file, start, length):
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve(request, field_file):
+    """Réponse de téléchargement d'un fichier chiffré (voir docstring du module)"""
+    storage = field_file.storage
+    accel_prefix = getattr(settings, 'CHAT_ATTACHMENT_ACCEL_PREFIX', '')
+    if accel_prefix:
+        response = HttpResponse(content_type='application/octet-stream')
+        response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + field_file.name
+        response['X-Accel-Buffering'] = 'no'
+        response['Cache-Control'] = 'private, max-age=0'
+        return response
+
+    try:
+        storage.path(field_file.name)
+    except NotImplementedError:
+        # Stockage objet: URL signée, le bucket gère Range lui-même
+        from storages.backends.s3 import S3Storage
+        signer = S3Storage(
+            querystring_auth=True,
+            querystring_expire=getattr(settings, 'CHAT_ATTACHMENT_URL_TTL', 300)
+        )
+        return redirect(signer.url(field_file.name))
+
+    size = storage.size(field_file.name)
+    try:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+    response = StreamingHttpResponse(
+        _iter_file(storage.open(field_file.name, 'rb'), start, length),
+        status=206 if byte_range else 200,
+        content_type='application/octet-stream'
+    )
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'private, max-age=0'
+    response['Content-Disposition'] = f'attachment; filename="{os.path.basename(field_file.name)}"'
+    return response
@@ -0,0 +1,64 @@
+"""
+Ondes Chat - Mises à jour regroupées de la liste des conversations
+
+Un envoi ne fait que réserver son seq (UPDATE ... RETURNING, qui avance
+aussi updated_at) et insérer le message. Le dernier message et les
+compteurs de non-lus de la conversation sont mis à jour ensuite, une fois
+par fenêtre CHAT_LIST_REFRESH_WINDOW pour toutes les conversations
+actives du processus (Conversation.count_messages): chaque membre ne
+compte que les messages arrivés depuis le dernier passage
+(Conversation.counted_seq). Un flush perdu est rattrapé au prochain
+envoi ou passage sur la conversation.
+"""
+import asyncio
+import logging
+import threading
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_pending = set()
+_lock = threading.Lock()
+_task = None
+
+
+def refresh_window():
+    return getattr(settings, 'CHAT_LIST_REFRESH_WINDOW', 1.0)
+
+
+def mark(conversation_id):
+    with _lock:
+        _pending.add(conversation_id)
+
+
+def has_pending():
+    return bool(_pending)
+
+
+def flush():
+    from .models import Conversation
+
+    with _lock:
+        conversation_ids = list(_pending)
+        _pending.clear()
+    if conversation_ids:
+        Conversation.count_messages(conversation_ids)
+    return len(conversation_ids)
+
+
+async def _flush_later():
+    await asyncio.sleep(refresh_window())
+    try:
+        await database_sync_to_async(flush)()
+    except Exception as e:
+        logger.error(f"Error refreshing conversation counters: {e}")
+
+
+async def schedule():
+    """Programme un flush s'il n'y en a pas déjà un en attente"""
+    global _task
+    loop = asyncio.get_running_loop()
+    if _task is None or _task.done() or _task.get_loop() is not loop:
+        _task = asyncio.create_task(_flush_later())
@@ -0,0 +1,126 @@
+"""
+Ondes Chat - Protocole binaire et charges chiffrées
+
+Le contenu chiffré circule en octets bruts (nonce || ciphertext || tag):
+en base, sur le channel layer (msgpack côté channels_redis) et vers les
+clients binaires. Le base64 n'est produit qu'en bordure, pour les
+clients JSON et l'API REST.
+
+Négociation par connexion, via le sous-protocole WebSocket
+(`ondes.msgpack.v1`, `ondes.cbor.v1`) ou `?format=msgpack|cbor`.
+Sans négociation, le protocole JSON historique est conservé.
+"""
+import base64
+import binascii
+
+import msgpack
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+FORMAT_JSON = 'json'
+FORMAT_MSGPACK = 'msgpack'
+FORMAT_CBOR = 'cbor'
+
+SUBPROTOCOLS = {
+    'ondes.msgpack.v1': FORMAT_MSGPACK,
+    'ondes.cbor.v1': FORMAT_CBOR,
+}
+
+
+def available_formats():
+    formats = {FORMAT_JSON, FORMAT_MSGPACK}
+    if cbor2 is not None:
+        formats.add(FORMAT_CBOR)
+    return formats
+
+
+def negotiate(subprotocols, requested=None):
+    """
+    Format de trames d'une connexion.
+
+    Args:
+        subprotocols: sous-protocoles proposés par le client (scope)
+        requested: format demandé en query string (?format=)
+
+    Returns:
+        (format, sous-protocole à accepter ou None)
+    """
+    formats = available_formats()
+    for subprotocol in subprotocols or []:
+        fmt = SUBPROTOCOLS.get(subprotocol)
+        if fmt in formats:
+            return fmt, subprotocol
+    if requested in formats:
+        return requested, None
+    return FORMAT_JSON, None
+
+
+def encode_frame(fmt, content):
+    if fmt == FORMAT_CBOR:
+        return cbor2.dumps(content)
+    return msgpack.packb(content, use_bin_type=True)
+
+
+def decode_frame(fmt, data):
+    if fmt == FORMAT_CBOR:
+        return cbor2.loads(data)
+    return msgpack.unpackb(data, raw=False)
+
+
+# ========== CHARGES CHIFFRÉES ==========
+
+def to_bytes(value):
+    """Charge reçue (octets, ou base64 d'un client JSON) → octets"""
+    if value is None:
+        return b''
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value)
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("Encrypted payload must be base64 or binary")
+
+
+def split_payload(value):
+    """
+    Répartition stockée (octets, texte): le base64 valide part en binaire,
+    toute autre valeur reste en texte telle quelle.
+    """
+    if not value:
+        return None, ''
+    try:
+        blob = to_bytes(value)
+    except ValueError:
+        return None, value
+    # Base64 non canonique: le réencodage ne redonnerait pas la valeur reçue
+    if isinstance(value, str) and to_text(blob) != value:
+        return None, value
+    return blob, ''
+
+
+def stored_payload(blob, text):
+    """Charge stockée: octets (binaire) ou texte (ligne pas encore migrée)"""
+    if blob is not None:
+        return bytes(blob)
+    return text
+
+
+def to_text(value):
+    """Représentation JSON d'une charge (base64)"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode('ascii')
+    return value or ''
+
+
+def for_json(content):
+    """Remplace récursivement les octets par leur base64 (clients JSON)"""
+    if isinstance(content, dict):
+        return {key: for_json(value) for key, value in content.items()}
+    if isinstance(content, (list, tuple)):
+        return [for_json(value) for value in content]
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        return to_text(content)
+    return content
@@ -5,19 +5,39 @@ Architecture:
 1. ChatConsumer: Gère les connexions WebSocket et le routage des messages
 2. Tous les messages transitent chiffrés E2EE
 3. Le serveur ne fait que relayer, il ne peut pas lire le contenu
+4. Trames JSON (historique) ou binaires msgpack/CBOR, négociées par
+   connexion (chat/codec.py)
+5. Les événements diffusés passent par une file d'envoi bornée
+   (chat/outbound.py), regroupés en trames tableau avec ?batch=1
+6. ?warm=N: conversations récentes, derniers messages et clés publiques
+   dans la trame connection_established (chat/warmup.py)
 """
 
+import asyncio
 import json
 import logging
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db.models import Max, Subquery
 from django.utils import timezone
-from rest_framework.authtoken.models import Token
 
+from store.authentication import authenticate_token
+from . import archive, bumps, codec, keys, membership, metrics, presence, typing_state, warmup
+from .sync import serialize_message, sync_conversations
+from .receipts import ReceiptCoalescer, parse_receipt
+from .outbound import OutboundQueue, QueueOverflow, TransportBackpressure, CLOSE_SLOW_CONSUMER
+from .ratelimit import (
+    ConnectionLimiter, admission, CLOSE_TRY_AGAIN, CLOSE_RATE_LIMITED, UNKNOWN_ACTION
+)
+from .fanout import (
+    MODE_CONVERSATION, routing_mode, connection_groups,
+    conversation_group, broadcast
+)
 from .models import (
     Conversation, ConversationMember, Message, 
-    MessageReceipt, TypingIndicator, UserKeyPair
+    TypingIndicator, UserKeyPair
 )
 
 logger = logging.getLogger(__name__)
@@ -30,10 +50,13 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
     Actions supportées:
     - send_message: Envoyer un message chiffré
     - typing: Indicateur de frappe
-    - read_receipt: Accusé de lecture
+    - read_receipt: Accusé de lecture (watermark par membre)
     - join_conversation: Rejoindre une conversation
     - leave_conversation: Quitter une conversation
     - get_messages: Récupérer l'historique
+    - sync: Rattraper les changements depuis un seq par conversation
+    - get_presence: Présence de plusieurs utilisateurs
+    - heartbeat: Maintenir la présence de la connexion
     - edit_message: Modifier un message
     - delete_message: Supprimer un message
     """
@@ -42,6 +65,15 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         super().__init__(*args, **kwargs)
         self.user = None
         self.conversations = set()  # UUIDs des conversations actives
+        self.conversation_ids = {}  # uuid -> id (cache de la connexion)
+        self.groups_joined = []
+        self.routing_mode = routing_mode()
+        self.receipts = ReceiptCoalescer(self.send_receipt_update)
+        self.frame_format = codec.FORMAT_JSON
+        self.outbound = None
+        self.limiter = ConnectionLimiter()
+        self.admitted = False
+        self.heartbeat = None
     
     async def connect(self):
         """Connexion WebSocket avec authentification par token"""
@@ -49,99 +81,190 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         query_string = self.scope.get('query_string', b'').decode()
         params = dict(param.split('=') for param in query_string.split('&') if '=' in param)
         token_key = params.get('token')
+        self.frame_format, subprotocol = codec.negotiate(
+            self.scope.get('subprotocols'), params.get('format')
+        )
         
         if not token_key:
             logger.warning("Chat connection rejected: No token provided")
             await self.close(code=4001)
             return
         
-        # Valider le token
+        # Valider le token (cache partagé): une connexion anonyme ne
+        # consomme pas le budget d'admission des utilisateurs
         self.user = await self.get_user_from_token(token_key)
         if not self.user:
             logger.warning(f"Chat connection rejected: Invalid token")
             await self.close(code=4001)
             return
         
-        # Accepter la connexion
-        await self.accept()
+        # Admission sous charge
+        retry_after = admission.admit()
+        if retry_after:
+            logger.warning(f"Chat connection rejected: admission (retry in {retry_after}s)")
+            await self.accept(subprotocol=subprotocol)
+            await self.send_json({'type': 'retry', 'retry_after': retry_after})
+            await self.close(code=CLOSE_TRY_AGAIN)
+            return
+        self.admitted = True
+        
+        # Accepter la connexion (format de trames négocié)
+        await self.accept(subprotocol=subprotocol)
         
-        # Rejoindre le groupe personnel de l'utilisateur pour les notifications
-        await self.channel_layer.group_add(
-            f"user_{self.user.id}",
-            self.channel_name
+        # File d'envoi des événements diffusés, réglée sur le tampon du socket
+        batching = params.get('batch') in ('1', 'true')
+        self.outbound = OutboundQueue(
+            self.send_json, batching=batching,
+            backpressure=TransportBackpressure.attach(self.scope.get('server_send'))
         )
+        self.outbound.start()
         
-        # Charger et rejoindre toutes les conversations de l'utilisateur
+        # Groupe personnel (notifications, fan-out en mode "user") et,
+        # en mode "conversation", un groupe par conversation
         conversations = await self.get_user_conversations()
-        for conv_uuid in conversations:
-            self.conversations.add(conv_uuid)
-            await self.channel_layer.group_add(
-                f"chat_{conv_uuid}",
-                self.channel_name
-            )
+        self.conversations.update(conversations)
+        self.groups_joined = connection_groups(self.user.id, conversations, self.routing_mode)
+        for group in self.groups_joined:
+            await self.channel_layer.group_add(group, self.channel_name)
+        
+        # Présence (une entrée par appareil) puis messages manqués hors ligne
+        await presence.touch(self.user.id, self.channel_name)
+        self.heartbeat = asyncio.create_task(self.presence_heartbeat())
+        missed = await presence.pop_offline(self.user.id)
+        
+        # ?warm=N: conversations récentes, messages et clés dans la même trame
+        warm_count = warmup.parse_warm(params.get('warm'))
+        warm = await self.get_warm_start(warm_count) if warm_count else None
         
         logger.info(f"Chat connected: {self.user.username} (joined {len(conversations)} conversations)")
         
         # Envoyer confirmation
-        await self.send_json({
+        established = {
             'type': 'connection_established',
             'user_id': self.user.id,
             'username': self.user.username,
-            'conversations_joined': list(conversations)
-        })
+            'conversations_joined': list(conversations),
+            'format': self.frame_format,
+            'batch': batching,
+            # {conversation_uuid: dernier seq manqué}, à rattraper avec `sync`
+            'missed': missed,
+        }
+        if warm is not None:
+            established['warm'] = warm
+        await self.send_json(established)
     
     async def disconnect(self, code):
         """Déconnexion propre"""
+        if self.admitted:
+            admission.release()
+            self.admitted = False
+        
         if self.user:
-            # Quitter le groupe personnel
-            await self.channel_layer.group_discard(
-                f"user_{self.user.id}",
-                self.channel_name
-            )
+            # Accusés de lecture encore en attente de regroupement
+            await self.receipts.close()
             
-            # Quitter toutes les conversations
-            for conv_uuid in self.conversations:
-                await self.channel_layer.group_discard(
-                    f"chat_{conv_uuid}",
-                    self.channel_name
-                )
+            if self.heartbeat:
+                self.heartbeat.cancel()
+            await presence.leave(self.user.id, self.channel_name)
+            
+            # Recalculs de liste en attente (arrêt du serveur compris)
+            if bumps.has_pending():
+                await database_sync_to_async(bumps.flush)()
+            
+            # Socket fermée: les événements en file sont abandonnés
+            if self.outbound:
+                await self.outbound.close(flush=False)
+            
+            # Quitter le groupe personnel et les conversations
+            for group in self.groups_joined:
+                await self.channel_layer.group_discard(group, self.channel_name)
             
-            # Nettoyer les indicateurs de frappe
-            await self.clear_typing_indicators()
+            # Les indicateurs de frappe expirent d'eux-mêmes (chat/typing_state.py)
+            if getattr(settings, 'CHAT_TYPING_PERSIST', False):
+                await self.clear_typing_indicators()
             
-            logger.info(f"Chat disconnected: {self.user.username}")
+            stats = self.outbound.stats if self.outbound else {}
+            if stats.get('dropped'):
+                metrics.incr('chat_ws_outbound_dropped_total', stats['dropped'])
+            logger.info(f"Chat disconnected: {self.user.username} (outbound {stats})")
+    
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        """Trames binaires (msgpack/CBOR) si négociées, JSON sinon"""
+        if bytes_data is not None and self.frame_format != codec.FORMAT_JSON:
+            try:
+                content = codec.decode_frame(self.frame_format, bytes_data)
+            except Exception:
+                await self.send_error("Invalid binary frame")
+                return
+            await self.receive_json(content)
+            return
+        await super().receive(text_data=text_data, bytes_data=bytes_data, **kwargs)
+    
+    async def send_json(self, content, close=False):
+        """Les charges chiffrées (octets) sont envoyées en base64 aux clients JSON"""
+        if self.frame_format == codec.FORMAT_JSON:
+            await super().send_json(codec.for_json(content), close=close)
+        else:
+            await self.send(bytes_data=codec.encode_frame(self.frame_format, content), close=close)
     
     async def receive_json(self, content):
         """Recevoir et router les messages JSON"""
-        action = content.get('action')
-        data = content.get('data', {})
+        action = content.get('action') if isinstance(content, dict) else None
+        data = content.get('data', {}) if action else {}
         
-        if not action:
+        if not action or not isinstance(action, str):
             await self.send_error("Missing 'action' field")
             return
+        if not isinstance(data, dict):
+            await self.send_error("'data' must be an object")
+            return
+        
+        handler = self.handlers.get(action)
         
-        # Router vers le handler approprié
-        handlers = {
+        # Débit par connexion et par action; les actions inconnues partagent
+        # un seau et un label (pas de libellé arbitraire dans les métriques)
+        retry_after = self.limiter.check(action if handler else UNKNOWN_ACTION)
+        if retry_after:
+            if self.limiter.exhausted():
+                logger.warning(f"Chat connection closed: {self.user.username} exceeded rate limits")
+                await self.close(code=CLOSE_RATE_LIMITED)
+                return
+            await self.send_json({
+                'type': 'error',
+                'code': 'rate_limited',
+                'action': action,
+                'retry_after': round(retry_after, 2),
+                'message': f"Rate limit exceeded for {action}",
+            })
+            return
+        
+        if not handler:
+            await self.send_error("Unknown action")
+            return
+        try:
+            await handler(data)
+        except Exception:
+            # Détail dans les logs seulement
+            logger.exception(f"Error handling {action}")
+            await self.send_error("Internal error")
+    
+    @property
+    def handlers(self):
+        """Actions client → handlers"""
+        return {
             'send_message': self.handle_send_message,
             'typing': self.handle_typing,
             'read_receipt': self.handle_read_receipt,
             'delivered_receipt': self.handle_delivered_receipt,
             'join_conversation': self.handle_join_conversation,
             'get_messages': self.handle_get_messages,
+            'sync': self.handle_sync,
             'edit_message': self.handle_edit_message,
             'delete_message': self.handle_delete_message,
             'get_public_keys': self.handle_get_public_keys,
+            'get_presence': self.handle_get_presence,
+            'heartbeat': self.handle_heartbeat,
         }
-        
-        handler = handlers.get(action)
-        if handler:
-            try:
-                await handler(data)
-            except Exception as e:
-                logger.error(f"Error handling {action}: {e}")
-                await self.send_error(f"Error: {str(e)}")
-        else:
-            await self.send_error(f"Unknown action: {action}")
     
     # ========== MESSAGE HANDLERS ==========
     
@@ -164,11 +287,7 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                 await self.send_error("Not a member of this conversation")
                 return
             # Rejoindre le groupe WebSocket pour cette conversation
-            self.conversations.add(conv_uuid)
-            await self.channel_layer.group_add(
-                f"chat_{conv_uuid}",
-                self.channel_name
-            )
+            await self.join_conversation_group(conv_uuid)
             logger.info(f"User {self.user.username} joined chat_{conv_uuid}")
         
         # Créer le message
@@ -183,20 +302,24 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         if not message:
             await self.send_error("Failed to create message")
             return
+        await bumps.schedule()
         
         # Diffuser le message à tous les membres de la conversation
-        await self.channel_layer.group_send(
-            f"chat_{conv_uuid}",
+        await broadcast(
+            self.channel_layer,
+            conv_uuid,
             {
                 'type': 'chat_message',
                 'message': {
                     'uuid': str(message['uuid']),
+                    'seq': message['seq'],
                     'conversation_uuid': conv_uuid,
                     'sender_id': self.user.id,
                     'sender_username': self.user.username,
                     'message_type': message_type,
-                    'encrypted_content': encrypted_content,
-                    'encrypted_metadata': encrypted_metadata,
+                    # Octets bruts sur le channel layer, base64 pour les clients JSON
+                    'encrypted_content': message['encrypted_content'],
+                    'encrypted_metadata': message['encrypted_metadata'],
                     'reply_to_uuid': reply_to_uuid,
                     'created_at': message['created_at'],
                 }
@@ -214,11 +337,16 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         if conv_uuid not in self.conversations:
             return
         
-        await self.update_typing_indicator(conv_uuid, is_typing)
+        # État éphémère (cache + TTL), frappes répétées regroupées
+        if not await typing_state.update(conv_uuid, self.user.id, is_typing):
+            return
+        if getattr(settings, 'CHAT_TYPING_PERSIST', False):
+            await self.update_typing_indicator(conv_uuid, is_typing)
         
         # Diffuser à la conversation
-        await self.channel_layer.group_send(
-            f"chat_{conv_uuid}",
+        await broadcast(
+            self.channel_layer,
+            conv_uuid,
             {
                 'type': 'typing_indicator',
                 'data': {
@@ -226,42 +354,58 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                     'user_id': self.user.id,
                     'username': self.user.username,
                     'is_typing': is_typing,
+                    'expires_in': typing_state.typing_ttl(),
                 }
             }
         )
     
     async def handle_read_receipt(self, data):
-        """Marquer des messages comme lus"""
-        message_uuids = data.get('message_uuids', [])
-        
-        if not message_uuids:
+        """
+        Marquer des messages comme lus.
+        Accepte `message_uuids` ou `conversation_uuid` + `seq` (lu jusqu'à seq).
+        """
+        try:
+            message_uuids, conv_uuid, seq = parse_receipt(data)
+        except ValueError as e:
+            await self.send_error(str(e))
             return
+        if not message_uuids and not (conv_uuid and seq):
+            return
+        
+        receipts = await self.mark_messages_read(message_uuids, conv_uuid, seq)
         
-        receipts = await self.mark_messages_read(message_uuids)
-        
-        # Notifier les expéditeurs
-        for receipt in receipts:
-            await self.channel_layer.group_send(
-                f"user_{receipt['sender_id']}",
-                {
-                    'type': 'receipt_update',
-                    'data': {
-                        'message_uuid': receipt['message_uuid'],
-                        'user_id': self.user.id,
-                        'receipt_type': 'read',
-                        'timestamp': receipt['timestamp'],
-                    }
+        # Notifier les expéditeurs: un événement par (expéditeur, conversation),
+        # rafales regroupées sur CHAT_RECEIPT_COALESCE_WINDOW
+        await self.receipts.add(receipts)
+    
+    async def send_receipt_update(self, sender_id, data):
+        """Envoyer un accusé de lecture agrégé à un expéditeur"""
+        await self.channel_layer.group_send(
+            f"user_{sender_id}",
+            {
+                'type': 'receipt_update',
+                'data': {
+                    'conversation_uuid': data['conversation_uuid'],
+                    'user_id': self.user.id,
+                    'receipt_type': 'read',
+                    'seq': data['seq'],
+                    'message_uuids': data['message_uuids'],
+                    'timestamp': data['timestamp'],
                 }
-            )
+            }
+        )
     
     async def handle_delivered_receipt(self, data):
-        """Marquer des messages comme délivrés"""
-        message_uuids = data.get('message_uuids', [])
-        
-        if not message_uuids:
+        """Marquer des messages comme délivrés (`message_uuids` ou `conversation_uuid` + `seq`)"""
+        try:
+            message_uuids, conv_uuid, seq = parse_receipt(data)
+        except ValueError as e:
+            await self.send_error(str(e))
+            return
+        if not message_uuids and not (conv_uuid and seq):
             return
         
-        await self.mark_messages_delivered(message_uuids)
+        await self.mark_messages_delivered(message_uuids, conv_uuid, seq)
     
     async def handle_join_conversation(self, data):
         """Rejoindre une conversation spécifique"""
@@ -278,11 +422,7 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             return
         
         if conv_uuid not in self.conversations:
-            self.conversations.add(conv_uuid)
-            await self.channel_layer.group_add(
-                f"chat_{conv_uuid}",
-                self.channel_name
-            )
+            await self.join_conversation_group(conv_uuid)
         
         # Récupérer les infos de la conversation
         conv_info = await self.get_conversation_info(conv_uuid)
@@ -297,6 +437,7 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         conv_uuid = data.get('conversation_uuid')
         limit = min(data.get('limit', 50), 100)
         before_uuid = data.get('before_uuid')
+        before_seq = data.get('before_seq')
         
         if not conv_uuid:
             await self.send_error("conversation_uuid required")
@@ -308,7 +449,7 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                 await self.send_error("Not a member of this conversation")
                 return
         
-        messages = await self.get_messages(conv_uuid, limit, before_uuid)
+        messages = await self.get_messages(conv_uuid, limit, before_uuid, before_seq)
         
         await self.send_json({
             'type': 'messages_history',
@@ -316,6 +457,25 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             'messages': messages
         })
     
+    async def handle_sync(self, data):
+        """Changements manqués depuis {conversation_uuid: last_seq}"""
+        cursors = data.get('conversations')
+        
+        if not isinstance(cursors, dict) or not cursors:
+            await self.send_error("conversations required")
+            return
+        
+        try:
+            result = await self.sync_conversations(cursors, data.get('limit', 200))
+        except ValueError as e:
+            await self.send_error(str(e))
+            return
+        
+        await self.send_json({
+            'type': 'sync',
+            'conversations': result
+        })
+    
     async def handle_edit_message(self, data):
         """Modifier un message existant"""
         message_uuid = data.get('message_uuid')
@@ -332,13 +492,17 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             return
         
         # Diffuser la modification
-        await self.channel_layer.group_send(
-            f"chat_{result['conversation_uuid']}",
+        await broadcast(
+            self.channel_layer,
+            result['conversation_uuid'],
             {
                 'type': 'message_edited',
                 'data': {
                     'message_uuid': message_uuid,
-                    'encrypted_content': encrypted_content,
+                    'conversation_uuid': result['conversation_uuid'],
+                    'seq': result['seq'],
+                    'change_seq': result['change_seq'],
+                    'encrypted_content': result['encrypted_content'],
                     'edited_at': result['edited_at'],
                 }
             }
@@ -359,36 +523,91 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             return
         
         # Diffuser la suppression
-        await self.channel_layer.group_send(
-            f"chat_{result['conversation_uuid']}",
+        await broadcast(
+            self.channel_layer,
+            result['conversation_uuid'],
             {
                 'type': 'message_deleted',
                 'data': {
                     'message_uuid': message_uuid,
+                    'conversation_uuid': result['conversation_uuid'],
+                    'seq': result['seq'],
+                    'change_seq': result['change_seq'],
                 }
             }
         )
     
     async def handle_get_public_keys(self, data):
-        """Récupérer les clés publiques des utilisateurs"""
+        """
+        Récupérer les clés publiques des utilisateurs.
+        Avec `known` ({user_id: version}), seules les clés plus récentes.
+        """
+        if data.get('known') is not None:
+            try:
+                known = keys.parse_known(data['known'])
+            except ValueError as e:
+                await self.send_error(str(e))
+                return
+            result = await database_sync_to_async(keys.changed_keys)(known)
+            await self.send_json({'type': 'public_keys', **result})
+            return
+        
         user_ids = data.get('user_ids', [])
         
         if not user_ids:
-            await self.send_error("user_ids required")
+            await self.send_error("user_ids or known required")
             return
         
-        keys = await self.get_public_keys(user_ids)
+        public_keys = await self.get_public_keys(user_ids)
         
         await self.send_json({
             'type': 'public_keys',
-            'keys': keys
+            'keys': public_keys
         })
     
+    async def handle_get_presence(self, data):
+        """Présence de plusieurs utilisateurs (membres d'une conversation commune)"""
+        user_ids = data.get('user_ids', [])
+        
+        if not user_ids or not isinstance(user_ids, list):
+            await self.send_error("user_ids required")
+            return
+        try:
+            user_ids = [int(uid) for uid in user_ids[:200]]
+        except (TypeError, ValueError):
+            await self.send_error("Invalid user_ids")
+            return
+        
+        user_ids = await database_sync_to_async(presence.visible_to)(self.user, user_ids)
+        result = await presence.get_presence(user_ids)
+        
+        await self.send_json({
+            'type': 'presence',
+            'presence': {str(uid): state for uid, state in result.items()}
+        })
+    
+    async def handle_heartbeat(self, data):
+        """Heartbeat client (en plus de celui du serveur)"""
+        await presence.touch(self.user.id, self.channel_name)
+        await self.send_json({'type': 'heartbeat_ack'})
+    
+    async def presence_heartbeat(self):
+        """Rafraîchit la présence de la connexion tant qu'elle vit"""
+        while True:
+            await asyncio.sleep(presence.heartbeat_interval())
+            try:
+                await presence.touch(self.user.id, self.channel_name)
+            except Exception as e:
+                logger.error(f"Presence heartbeat failed: {e}")
+    
     # ========== BROADCAST HANDLERS ==========
     
     async def chat_message(self, event):
         """Recevoir un message de la conversation"""
-        await self.send_json({
+        # Mode "user": le fan-out ne vise que les membres, la conversation
+        # devient active sans join explicite
+        self.conversations.add(event['message']['conversation_uuid'])
+        await self.enqueue({
             'type': 'new_message',
             'message': event['message']
         })
@@ -397,35 +616,64 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         """Recevoir un indicateur de frappe"""
         # Ne pas s'envoyer à soi-même
         if event['data']['user_id'] != self.user.id:
-            await self.send_json({
+            # Écarté en premier si le client ne suit pas
+            await self.enqueue({
                 'type': 'typing',
                 'data': event['data']
-            })
+            }, droppable=True)
     
     async def receipt_update(self, event):
         """Recevoir une mise à jour d'accusé de réception"""
-        await self.send_json({
+        await self.enqueue({
             'type': 'receipt',
             'data': event['data']
         })
     
     async def message_edited(self, event):
         """Recevoir une modification de message"""
-        await self.send_json({
+        await self.enqueue({
             'type': 'message_edited',
             'data': event['data']
         })
     
+    async def key_rotated(self, event):
+        """Clé publique d'un contact renouvelée"""
+        await self.enqueue({
+            'type': 'key_rotated',
+            'data': event['data']
+        })
+    
+    async def attachment_ready(self, event):
+        """Pièce jointe d'un message disponible au téléchargement"""
+        await self.enqueue({
+            'type': 'attachment_ready',
+            'data': event['data']
+        })
+    
     async def message_deleted(self, event):
         """Recevoir une suppression de message"""
-        await self.send_json({
+        await self.enqueue({
             'type': 'message_deleted',
             'data': event['data']
         })
     
+    async def membership_revoked(self, event):
+        """Retiré d'une conversation: l'oublier sur cette connexion"""
+        conv_uuid = event['conversation_uuid']
+        self.conversations.discard(conv_uuid)
+        self.conversation_ids.pop(conv_uuid, None)
+        group = conversation_group(conv_uuid)
+        if group in self.groups_joined:
+            self.groups_joined.remove(group)
+            await self.channel_layer.group_discard(group, self.channel_name)
+        await self.enqueue({
+            'type': 'membership_revoked',
+            'data': {'conversation_uuid': conv_uuid}
+        })
+    
     async def conversation_update(self, event):
         """Recevoir une mise à jour de conversation"""
-        await self.send_json({
+        await self.enqueue({
             'type': 'conversation_update',
             'data': event['data']
         })
@@ -434,58 +682,73 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
     
     @database_sync_to_async
     def get_user_from_token(self, token_key):
-        """Valider un token et retourner l'utilisateur"""
-        try:
-            token = Token.objects.select_related('user').get(key=token_key)
-            return token.user
-        except Token.DoesNotExist:
+        """Valider un token (cache partagé avec l'authentification REST)"""
+        found = authenticate_token(token_key)
+        if found is None or not found[0].is_active:
             return None
+        return found[0]
     
     @database_sync_to_async
     def get_user_conversations(self):
         """Récupérer toutes les conversations de l'utilisateur"""
         memberships = ConversationMember.objects.filter(
             user=self.user
-        ).select_related('conversation')
-        return [str(m.conversation.uuid) for m in memberships]
+        ).values_list('conversation__uuid', 'conversation_id')
+        self.conversation_ids.update((str(uuid), conv_id) for uuid, conv_id in memberships)
+        return list(self.conversation_ids)
+    
+    @database_sync_to_async
+    def get_warm_start(self, conversations):
+        return warmup.warm_start(self.user, conversations)
     
     @database_sync_to_async
     def check_membership(self, conv_uuid):
-        """Vérifier si l'utilisateur est membre de la conversation"""
-        return ConversationMember.objects.filter(
-            conversation__uuid=conv_uuid,
-            user=self.user
-        ).exists()
+        """Vérifier si l'utilisateur est membre de la conversation (annuaire en cache)"""
+        entry = membership.get_entry(conv_uuid)
+        if not entry or self.user.id not in entry['members']:
+            return False
+        self.conversation_ids[str(conv_uuid)] = entry['id']
+        return True
+    
+    def conversation_id(self, conv_uuid):
+        """Id d'une conversation (cache de la connexion, puis annuaire)"""
+        conv_id = self.conversation_ids.get(str(conv_uuid))
+        if conv_id is None:
+            entry = membership.get_entry(conv_uuid)
+            if entry is None:
+                raise Conversation.DoesNotExist(f"Conversation {conv_uuid} not found")
+            conv_id = self.conversation_ids[str(conv_uuid)] = entry['id']
+        return conv_id
     
     @database_sync_to_async
     def create_message(self, conv_uuid, encrypted_content, message_type, 
                        encrypted_metadata, reply_to_uuid):
         """Créer un nouveau message"""
         try:
-            conversation = Conversation.objects.get(uuid=conv_uuid)
+            conv_id = self.conversation_id(conv_uuid)
             
-            reply_to = None
+            reply_to_id = None
             if reply_to_uuid:
-                try:
-                    reply_to = Message.objects.get(uuid=reply_to_uuid)
-                except Message.DoesNotExist:
-                    pass
+                reply_to_id = Message.objects.filter(
+                    uuid=reply_to_uuid, conversation_id=conv_id
+                ).values_list('id', flat=True).first()
             
-            message = Message.objects.create(
-                conversation=conversation,
+            # Numéro de séquence (+ updated_at) puis INSERT; dernier message
+            # et non-lus sont comptés par lots (chat/bumps.py)
+            message = Message.create_next(
+                conv_id,
+                deferred=True,
                 sender=self.user,
                 message_type=message_type,
-                encrypted_content=encrypted_content,
-                encrypted_metadata=encrypted_metadata,
-                reply_to=reply_to
+                reply_to_id=reply_to_id,
+                **Message.payload_fields(encrypted_content, encrypted_metadata)
             )
             
-            # Mettre à jour la conversation
-            conversation.updated_at = timezone.now()
-            conversation.save(update_fields=['updated_at'])
-            
             return {
                 'uuid': str(message.uuid),
+                'seq': message.seq,
+                'encrypted_content': message.content,
+                'encrypted_metadata': message.metadata,
                 'created_at': message.created_at.isoformat()
             }
         except Exception as e:
@@ -493,33 +756,34 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             return None
     
     @database_sync_to_async
-    def get_messages(self, conv_uuid, limit, before_uuid):
-        """Récupérer les messages d'une conversation"""
+    def get_messages(self, conv_uuid, limit, before_uuid=None, before_seq=None):
+        """Récupérer les messages d'une conversation (pagination par seq, puis archives)"""
+        conv_id = self.conversation_id(conv_uuid)
         queryset = Message.objects.filter(
-            conversation__uuid=conv_uuid
+            conversation_id=conv_id
         ).select_related('sender', 'reply_to')
         
-        if before_uuid:
-            try:
-                before_msg = Message.objects.get(uuid=before_uuid)
-                queryset = queryset.filter(created_at__lt=before_msg.created_at)
-            except Message.DoesNotExist:
-                pass
+        if before_seq:
+            queryset = queryset.filter(seq__lt=before_seq)
+        elif before_uuid:
+            # Ancien curseur: résolu en sous-requête, sans aller-retour
+            queryset = queryset.filter(seq__lt=Subquery(
+                Message.objects.filter(
+                    uuid=before_uuid, conversation__uuid=conv_uuid
+                ).values('seq')[:1]
+            ))
         
-        messages = queryset.order_by('-created_at')[:limit]
+        messages = queryset.order_by('-seq')[:limit]
+        page = [serialize_message(m) for m in reversed(list(messages))]
         
-        return [{
-            'uuid': str(m.uuid),
-            'sender_id': m.sender.id if m.sender else None,
-            'sender_username': m.sender.username if m.sender else 'System',
-            'message_type': m.message_type,
-            'encrypted_content': m.encrypted_content if not m.is_deleted else '',
-            'encrypted_metadata': m.encrypted_metadata,
-            'reply_to_uuid': str(m.reply_to.uuid) if m.reply_to else None,
-            'created_at': m.created_at.isoformat(),
-            'edited_at': m.edited_at.isoformat() if m.edited_at else None,
-            'is_deleted': m.is_deleted,
-        } for m in reversed(list(messages))]
+        # Ancien curseur introuvable (message archivé): pas de suite connue
+        if before_uuid and not before_seq and not page:
+            return page
+        return archive.fill_page(conv_id, page, limit, before_seq)
+    
+    @database_sync_to_async
+    def sync_conversations(self, cursors, limit):
+        return sync_conversations(self.user, cursors, limit)
     
     @database_sync_to_async
     def get_conversation_info(self, conv_uuid):
@@ -550,13 +814,16 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
     def edit_message(self, message_uuid, encrypted_content):
         """Modifier un message"""
         try:
-            message = Message.objects.get(uuid=message_uuid, sender=self.user)
-            message.encrypted_content = encrypted_content
-            message.edited_at = timezone.now()
-            message.save(update_fields=['encrypted_content', 'edited_at'])
+            message = Message.objects.select_related('conversation').get(
+                uuid=message_uuid, sender=self.user
+            )
+            message.edit(encrypted_content)
             
             return {
                 'conversation_uuid': str(message.conversation.uuid),
+                'seq': message.seq,
+                'change_seq': message.change_seq,
+                'encrypted_content': message.content,
                 'edited_at': message.edited_at.isoformat()
             }
         except Message.DoesNotExist:
@@ -566,68 +833,85 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
     def delete_message(self, message_uuid):
         """Supprimer un message (soft delete)"""
         try:
-            message = Message.objects.get(uuid=message_uuid, sender=self.user)
+            message = Message.objects.select_related('conversation').get(
+                uuid=message_uuid, sender=self.user
+            )
             conv_uuid = str(message.conversation.uuid)
             message.soft_delete()
-            return {'conversation_uuid': conv_uuid}
+            return {
+                'conversation_uuid': conv_uuid,
+                'seq': message.seq,
+                'change_seq': message.change_seq,
+            }
         except Message.DoesNotExist:
             return None
     
+    def receipt_targets(self, message_uuids, conv_uuid, seq):
+        """
+        Watermarks visés par un accusé:
+        {conversation_id: (seq, ancien last_read_seq, conversation_uuid)}.
+        Limité aux conversations dont l'utilisateur est membre.
+        """
+        memberships = ConversationMember.objects.filter(user=self.user)
+        targets = {}
+        if message_uuids:
+            rows = Message.objects.filter(
+                uuid__in=message_uuids,
+                conversation__members__user=self.user
+            ).values('conversation_id').annotate(max_seq=Max('seq'))
+            targets = {row['conversation_id']: row['max_seq'] for row in rows}
+            memberships = memberships.filter(conversation_id__in=targets)
+        else:
+            memberships = memberships.filter(conversation__uuid=conv_uuid)
+        
+        result = {}
+        rows = memberships.values('conversation_id', 'conversation__uuid', 'conversation__last_seq', 'last_read_seq')
+        for m in rows:
+            conv_id = m['conversation_id']
+            target = targets.get(conv_id) if message_uuids else int(seq)
+            result[conv_id] = (
+                min(target, m['conversation__last_seq']),
+                m['last_read_seq'],
+                str(m['conversation__uuid']),
+            )
+        return result
+    
     @database_sync_to_async
-    def mark_messages_read(self, message_uuids):
-        """Marquer des messages comme lus (batch optimisé)"""
-        messages = list(
-            Message.objects.filter(uuid__in=message_uuids)
-            .exclude(sender=self.user)
-            .select_related('sender')
-        )
-        
-        # Find messages that don't already have a read receipt
-        existing = set(
-            MessageReceipt.objects.filter(
-                message__in=messages,
-                user=self.user,
-                receipt_type='read'
-            ).values_list('message_id', flat=True)
-        )
-        
-        now = timezone.now()
-        new_receipts = []
+    def mark_messages_read(self, message_uuids, conv_uuid=None, seq=None):
+        """
+        Avancer le watermark de lecture (un UPDATE par conversation).
+        Retourne un accusé par (expéditeur, conversation) pour les messages
+        nouvellement lus.
+        """
+        now = timezone.now().isoformat()
         result = []
-        for msg in messages:
-            if msg.id not in existing and msg.sender:
-                new_receipts.append(MessageReceipt(
-                    message=msg,
-                    user=self.user,
-                    receipt_type='read',
-                    timestamp=now
-                ))
-                result.append({
-                    'message_uuid': str(msg.uuid),
-                    'sender_id': msg.sender.id,
-                    'timestamp': now.isoformat()
-                })
-        
-        if new_receipts:
-            MessageReceipt.objects.bulk_create(new_receipts, ignore_conflicts=True)
-        
+        targets = self.receipt_targets(message_uuids, conv_uuid, seq)
+        for conv_id, (read_seq, previous, conv_uuid) in targets.items():
+            if not ConversationMember.advance_watermarks(conv_id, self.user.id, read_seq=read_seq):
+                continue
+            newly_read = Message.objects.filter(
+                conversation_id=conv_id,
+                seq__gt=previous,
+                seq__lte=read_seq,
+                sender__isnull=False
+            ).exclude(sender=self.user).values_list('sender_id', 'uuid')
+            by_sender = {}
+            for sender_id, uuid in newly_read:
+                by_sender.setdefault(sender_id, []).append(str(uuid))
+            result.extend({
+                'sender_id': sender_id,
+                'conversation_uuid': conv_uuid,
+                'seq': read_seq,
+                'message_uuids': uuids,
+                'timestamp': now
+            } for sender_id, uuids in by_sender.items())
         return result
     
     @database_sync_to_async
-    def mark_messages_delivered(self, message_uuids):
-        """Marquer des messages comme délivrés"""
-        for uuid_str in message_uuids:
-            try:
-                message = Message.objects.get(uuid=uuid_str)
-                if message.sender and message.sender.id != self.user.id:
-                    MessageReceipt.objects.get_or_create(
-                        message=message,
-                        user=self.user,
-                        receipt_type='delivered',
-                        defaults={'timestamp': timezone.now()}
-                    )
-            except Message.DoesNotExist:
-                continue
+    def mark_messages_delivered(self, message_uuids, conv_uuid=None, seq=None):
+        """Avancer le watermark de réception"""
+        for conv_id, (delivered_seq, _, _) in self.receipt_targets(message_uuids, conv_uuid, seq).items():
+            ConversationMember.advance_watermarks(conv_id, self.user.id, delivered_seq=delivered_seq)
     
     @database_sync_to_async
     def update_typing_indicator(self, conv_uuid, is_typing):
@@ -665,6 +949,40 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
     
     # ========== HELPERS ==========
     
+    async def join_conversation_group(self, conv_uuid):
+        """Activer une conversation (et rejoindre son groupe en mode "conversation")"""
+        self.conversations.add(conv_uuid)
+        if self.routing_mode == MODE_CONVERSATION:
+            group = conversation_group(conv_uuid)
+            self.groups_joined.append(group)
+            await self.channel_layer.group_add(group, self.channel_name)
+    
+    async def enqueue(self, content, droppable=False):
+        """Mettre un événement diffusé dans la file d'envoi"""
+        if self.outbound is None or self.outbound.writer is None:
+            return
+        try:
+            self.outbound.put(content, droppable)
+        except QueueOverflow:
+            await self.close_slow_consumer()
+    
+    async def close_slow_consumer(self):
+        """File pleine: indice de reprise puis fermeture"""
+        cursors = self.outbound.resume_cursors()
+        logger.warning(
+            f"Chat slow consumer: {self.user.username} "
+            f"(depth {self.outbound.depth}, outbound {self.outbound.stats})"
+        )
+        await self.outbound.close(flush=False)
+        metrics.incr('chat_ws_slow_consumer_closed_total')
+        await self.send_json({
+            'type': 'resume',
+            'reason': 'slow_consumer',
+            'action': 'sync',
+            'conversations': cursors,
+        })
+        await self.close(code=CLOSE_SLOW_CONSUMER)
+    
     async def send_error(self, message):
         """Envoyer une erreur au client"""
         await self.send_json({
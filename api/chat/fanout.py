@@ -0,0 +1,80 @@
+"""
+Ondes Chat - Routage des événements temps réel
+
+Deux modes (settings.CHAT_ROUTING_MODE):
+- "conversation": chaque connexion rejoint user_<id> puis un groupe
+  chat_<uuid> par conversation. Un envoi = un group_send, mais une
+  (re)connexion coûte O(conversations) opérations sur le channel layer.
+- "user": chaque connexion ne rejoint que user_<id>. Un événement de
+  conversation est envoyé aux groupes user_<id> de ses membres, lus dans
+  l'annuaire des conversations en cache (chat/membership.py).
+  Connexion en O(1).
+
+Avec CHAT_PRESENCE_FANOUT (désactivé par défaut), seuls les membres en ligne sont servis (dans
+les deux modes, un group_send vers une conversation sans membre connecté
+est évité); les nouveaux messages des membres hors ligne vont dans la
+file hors ligne (chat/presence.py).
+"""
+import asyncio
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from . import membership, presence
+
+logger = logging.getLogger(__name__)
+
+MODE_CONVERSATION = 'conversation'
+MODE_USER = 'user'
+
+
+def routing_mode():
+    return getattr(settings, 'CHAT_ROUTING_MODE', MODE_CONVERSATION)
+
+
+def user_group(user_id):
+    return f"user_{user_id}"
+
+
+def conversation_group(conv_uuid):
+    return f"chat_{conv_uuid}"
+
+
+def connection_groups(user_id, conv_uuids, mode=None):
+    """Groupes à rejoindre à la connexion"""
+    groups = [user_group(user_id)]
+    if (mode or routing_mode()) == MODE_CONVERSATION:
+        groups += [conversation_group(uuid) for uuid in conv_uuids]
+    return groups
+
+
+# ========== ENVOI ==========
+
+def presence_fanout():
+    return getattr(settings, 'CHAT_PRESENCE_FANOUT', False)
+
+
+async def broadcast(channel_layer, conv_uuid, event, mode=None):
+    """Diffuser un événement à tous les membres connectés d'une conversation"""
+    mode = mode or routing_mode()
+    if mode == MODE_CONVERSATION and not presence_fanout():
+        await channel_layer.group_send(conversation_group(conv_uuid), event)
+        return
+
+    member_ids = await database_sync_to_async(membership.member_ids)(conv_uuid)
+    if presence_fanout():
+        member_ids, offline = await presence.split_online(member_ids)
+        if offline and event['type'] == 'chat_message':
+            await presence.enqueue_offline(offline, str(conv_uuid), event['message']['seq'])
+        if not member_ids:
+            return
+
+    if mode == MODE_CONVERSATION:
+        await channel_layer.group_send(conversation_group(conv_uuid), event)
+        return
+
+    await asyncio.gather(*(
+        channel_layer.group_send(user_group(user_id), event)
+        for user_id in member_ids
+    ))
@@ -0,0 +1,120 @@
+"""
+Ondes Chat - Annuaire versionné des clés publiques
+
+Chaque rotation incrémente UserKeyPair.version. Le client garde les clés
+en cache sans expiration et n'envoie que les versions connues
+({user_id: version}); l'annuaire ne renvoie que les clés plus récentes
+et les utilisateurs sans clé. Les réponses en lot portent un ETag
+(If-None-Match → 304).
+
+À chaque rotation, les contacts en ligne de l'utilisateur (membres d'une
+conversation commune) reçoivent `key_rotated` sur leur groupe user_<id>;
+les autres rattrapent par l'annuaire à la reconnexion.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from . import presence
+from .fanout import presence_fanout, user_group
+from .models import ConversationMember, UserKeyPair
+
+logger = logging.getLogger(__name__)
+
+MAX_USERS = 500
+
+
+def key_record(keypair):
+    return {
+        'user_id': keypair.user_id,
+        'public_key': keypair.public_key,
+        'key_signature': keypair.key_signature,
+        'version': keypair.version,
+        'rotated_at': keypair.rotated_at.isoformat(),
+    }
+
+
+def parse_known(known):
+    """{user_id: version} (clés JSON en texte) → {int: int}; ValueError si invalide"""
+    if not isinstance(known, dict) or not known:
+        raise ValueError("known required")
+    if len(known) > MAX_USERS:
+        raise ValueError(f"At most {MAX_USERS} users per request")
+    try:
+        return {int(user_id): int(version or 0) for user_id, version in known.items()}
+    except (TypeError, ValueError):
+        raise ValueError("Invalid known versions")
+
+
+def changed_keys(known):
+    """
+    Clés plus récentes que les versions connues, en une requête.
+
+    Args:
+        known: {user_id: version connue} (0 = aucune)
+
+    Returns:
+        {'keys': [clés nouvelles ou modifiées], 'missing': [user_ids sans clé]}
+    """
+    keypairs = UserKeyPair.objects.filter(user_id__in=list(known))
+    found = set()
+    keys = []
+    for keypair in keypairs:
+        found.add(keypair.user_id)
+        if keypair.version > known[keypair.user_id]:
+            keys.append(key_record(keypair))
+    keys.sort(key=lambda k: k['user_id'])
+    return {'keys': keys, 'missing': sorted(set(known) - found)}
+
+
+def etag(payload):
+    """ETag faible d'une réponse en lot"""
+    digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(request, tag):
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    return tag in [value.strip() for value in header.split(',')] or header.strip() == '*'
+
+
+# ========== ROTATION ==========
+
+def contact_ids(user_id):
+    """Utilisateurs qui partagent au moins une conversation avec user_id"""
+    return list(
+        ConversationMember.objects.filter(
+            conversation__members__user_id=user_id
+        ).exclude(user_id=user_id).values_list('user_id', flat=True).distinct()
+    )
+
+
+async def _push(layer, user_ids, event):
+    if presence_fanout():
+        user_ids, _ = await presence.split_online(user_ids)
+    await asyncio.gather(*(
+        layer.group_send(user_group(user_id), event)
+        for user_id in user_ids
+    ))
+
+
+def notify_rotation(keypair_id):
+    """Envoie `key_rotated` aux contacts (appelé après commit)"""
+    layer = get_channel_layer()
+    keypair = UserKeyPair.objects.filter(pk=keypair_id).first()
+    if layer is None or keypair is None:
+        return
+    contacts = contact_ids(keypair.user_id)
+    if not contacts:
+        return
+    try:
+        async_to_sync(_push)(layer, contacts, {
+            'type': 'key_rotated',
+            'data': key_record(keypair),
+        })
+    except Exception as e:
+        logger.error(f"Error notifying key rotation: {e}")
@@ -0,0 +1,532 @@
+"""
+Ondes Chat - Channel layers
+
+ShardedPubSubChannelLayer (CHANNEL_LAYER_BACKEND=pubsub) remplace
+RedisChannelLayer, où chaque canal est une liste Redis et un group_send
+coûte une écriture par membre, par le pub/sub: un group_send est un seul
+PUBLISH, que Redis remet une fois à chaque processus abonné au groupe.
+Ni capacité ni expiration: un client déconnecté perd les événements et
+les rattrape par `sync`.
+
+Avec plusieurs hôtes (CHANNEL_REDIS_URLS), chaque groupe ou canal est
+attribué à un hôte par un anneau de hachage cohérent (points virtuels)
+au lieu du modulo de channels_redis: ajouter un hôte ne déplace qu'~1/N
+des groupes et l'ordre des hôtes est indifférent. Pendant un déploiement
+progressif, anciens et nouveaux processus s'accordent donc sur la
+plupart des groupes.
+
+PostgresChannelLayer (CHANNEL_LAYER_BACKEND=postgres) sert les
+déploiements sans Redis: même modèle que le pub/sub, sur LISTEN/NOTIFY
+de la base Django (voir la section dédiée plus bas).
+"""
+import asyncio
+import base64
+import bisect
+import hashlib
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import channels_redis.utils
+import msgpack
+from channels.layers import BaseChannelLayer
+from channels_redis.pubsub import RedisPubSubChannelLayer, RedisPubSubLoopLayer
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+VIRTUAL_NODES = 160
+
+
+def _point(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+def host_name(host):
+    """Identité stable d'un hôte (kwargs de decode_hosts)"""
+    return host.get('address') or ','.join(f'{k}={v}' for k, v in sorted(host.items()))
+
+
+class HashRing:
+    """Anneau de hachage cohérent: nom → indice de nœud"""
+
+    def __init__(self, nodes, virtual_nodes=VIRTUAL_NODES):
+        points = sorted(
+            (_point(f'{node}#{i}'), index)
+            for index, node in enumerate(nodes)
+            for i in range(virtual_nodes)
+        )
+        self._points = [point for point, _ in points]
+        self._nodes = [index for _, index in points]
+
+    def node(self, name):
+        i = bisect.bisect(self._points, _point(name)) % len(self._points)
+        return self._nodes[i]
+
+
+def check_channels_redis():
+    """
+    Les couches ShardedPubSub* reposent sur des internes de channels_redis
+    4.2 (RedisPubSubLoopLayer._get_shard, ._shards, shard.host,
+    channels_redis.utils._wrap_close, ._layers/_args/_kwargs de la couche).
+    Une version qui les renomme doit échouer au démarrage, pas router en
+    silence vers le mauvais hôte.
+    """
+    missing = []
+    if not callable(getattr(RedisPubSubLoopLayer, '_get_shard', None)):
+        missing.append('RedisPubSubLoopLayer._get_shard')
+    if not callable(getattr(channels_redis.utils, '_wrap_close', None)):
+        missing.append('channels_redis.utils._wrap_close')
+    probe = RedisPubSubLoopLayer(hosts=['redis://localhost:6379'])  # n'ouvre aucune connexion
+    shards = getattr(probe, '_shards', None)
+    if not isinstance(shards, list):
+        missing.append('RedisPubSubLoopLayer._shards')
+    elif not shards or not isinstance(getattr(shards[0], 'host', None), dict):
+        missing.append('RedisSingleShardConnection.host')
+    layer = RedisPubSubChannelLayer()
+    for name in ('_layers', '_args', '_kwargs'):
+        if name not in vars(layer):
+            missing.append(f'RedisPubSubChannelLayer.{name}')
+    if missing:
+        raise ImproperlyConfigured(
+            "ShardedPubSubChannelLayer is incompatible with the installed channels_redis "
+            f"(missing: {', '.join(missing)}); pin channels-redis==4.2.0 or use CHANNEL_LAYER_BACKEND=core"
+        )
+
+
+class ShardedPubSubLoopLayer(RedisPubSubLoopLayer):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._ring = HashRing([host_name(shard.host) for shard in self._shards])
+
+    def _get_shard(self, channel_or_group_name):
+        if len(self._shards) == 1:
+            return self._shards[0]
+        return self._shards[self._ring.node(channel_or_group_name)]
+
+
+class ShardedPubSubChannelLayer(RedisPubSubChannelLayer):
+    """RedisPubSubChannelLayer dont les hôtes sont choisis par HashRing"""
+
+    def __init__(self, *args, **kwargs):
+        check_channels_redis()
+        super().__init__(*args, **kwargs)
+
+    def _get_layer(self):
+        loop = asyncio.get_running_loop()
+        layer = self._layers.get(loop)
+        if layer is None:
+            layer = ShardedPubSubLoopLayer(*self._args, **self._kwargs, channel_layer=self)
+            self._layers[loop] = layer
+            channels_redis.utils._wrap_close(self, loop)
+        return layer
+
+
+# ========== POSTGRESQL LISTEN/NOTIFY ==========
+#
+# Chaque boucle asyncio d'un processus ouvre deux connexions psycopg2
+# (autocommit):
+# - écoute: LISTEN sur son canal de processus (messages adressés à ses
+#   canaux) et sur un canal par groupe dont il a des membres, lue par la
+#   boucle asyncio (add_reader) sans thread;
+# - envoi: pg_notify groupés en une requête par lot, dans un thread
+#   dédié (psycopg2 est bloquant).
+# NOTIFY limite la charge à 8000 octets: au-delà, le message passe par
+# la table non journalisée chat_layer_overflow (migration 0013) et la
+# notification n'en porte que l'identifiant. Les lignes de plus de
+# `expiry` secondes sont supprimées avec le lot d'envoi suivant.
+# Messages perdus si un processus est déconnecté de la base: les clients
+# rattrapent par `sync`.
+
+OVERFLOW_TABLE = 'chat_layer_overflow'
+NOTIFY_MAX_PAYLOAD = 7900
+MAX_BATCH = 200
+
+
+def pg_channel(prefix, kind, name):
+    """Nom de canal PostgreSQL (identifiant de 63 octets au plus)"""
+    return f"{prefix}_{kind}_{hashlib.md5(name.encode()).hexdigest()}"
+
+
+class PostgresLoopLayer:
+    """État d'une boucle asyncio: connexions, canaux locaux, groupes écoutés"""
+
+    def __init__(self, channel_layer, database='default', prefix='asgi', expiry=60):
+        self.channel_layer = channel_layer
+        self.database = database
+        self.prefix = prefix
+        self.expiry = expiry
+        self.client_id = uuid.uuid4().hex
+        self.process_channel = pg_channel(prefix, 'p', self.client_id)
+
+        self.channels = {}  # canal -> asyncio.Queue
+        self.groups = {}  # canal PostgreSQL -> {canaux}
+        self._listening = set()
+        self._listener = None
+        self._listen_lock = asyncio.Lock()
+        self._inbox = asyncio.Queue()
+        self._dispatcher = None
+
+        self._sender = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pg-layer')
+        self._pending = []
+        self._flushing = None
+        self._last_cleanup = 0
+
+    # ---------- Connexions ----------
+
+    def _connect(self):
+        import psycopg2
+        from django.db import connections
+
+        wrapper = connections[self.database]
+        if wrapper.vendor != 'postgresql':
+            raise ImproperlyConfigured("PostgresChannelLayer requires a PostgreSQL database")
+        params = wrapper.get_connection_params()
+        params.pop('cursor_factory', None)
+        conn = psycopg2.connect(**params)
+        conn.autocommit = True
+        return conn
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _execute(self, conn, sql):
+        with conn.cursor() as cursor:
+            cursor.execute(sql)
+
+    async def _listen(self, name, listen=True):
+        """LISTEN / UNLISTEN sur la connexion d'écoute (ouverte au besoin)"""
+        loop = asyncio.get_running_loop()
+        async with self._listen_lock:
+            if listen == (name in self._listening):
+                return
+            if not listen and name in self.groups:
+                return  # groupe rejoint entre-temps
+            if self._listener is None:
+                self._listener = await self._run(self._connect)
+                loop.add_reader(self._listener.fileno(), self._on_readable)
+                if self._dispatcher is None:
+                    self._dispatcher = asyncio.ensure_future(self._dispatch())
+            # La boucle ne lit pas la connexion pendant la commande; les
+            # notifications reçues entre-temps sont relevées juste après
+            fd = self._listener.fileno()
+            loop.remove_reader(fd)
+            try:
+                await self._run(self._execute, self._listener, f'{"LISTEN" if listen else "UNLISTEN"} "{name}"')
+            finally:
+                loop.add_reader(fd, self._on_readable)
+                self._on_readable()
+            if listen:
+                self._listening.add(name)
+            else:
+                self._listening.discard(name)
+
+    def _on_readable(self):
+        listener = self._listener
+        if listener is None:
+            return
+        try:
+            listener.poll()
+        except Exception as e:
+            logger.error(f"Channel layer listener lost: {e}")
+            asyncio.get_running_loop().remove_reader(listener.fileno())
+            asyncio.ensure_future(self._restart_listener(listener))
+            return
+        while listener.notifies:
+            notify = listener.notifies.pop(0)
+            self._inbox.put_nowait((notify.channel, notify.payload))
+
+    async def _restart_listener(self, broken):
+        async with self._listen_lock:
+            if self._listener is not broken:
+                return
+            self._listener = None
+            names, self._listening = set(self._listening), set()
+            try:
+                broken.close()
+            except Exception:
+                pass
+        while True:
+            try:
+                for name in names:
+                    if name == self.process_channel or name in self.groups:
+                        await self._listen(name)
+                return
+            except Exception as e:
+                logger.error(f"Channel layer listener reconnect failed: {e}")
+                await asyncio.sleep(1)
+
+    # ---------- Réception ----------
+
+    def _fetch_overflow(self, overflow_ids):
+        """{id: charge} des messages débordés encore présents"""
+        with self._sender_connection().cursor() as cursor:
+            cursor.execute(f'SELECT id, payload FROM "{OVERFLOW_TABLE}" WHERE id = ANY(%s)', [overflow_ids])
+            return {row[0]: bytes(row[1]) for row in cursor.fetchall()}
+
+    def _route(self, name, payload):
+        """(files destinataires, corps) d'une notification"""
+        if name == self.process_channel:
+            channel, _, body = payload.partition('|')
+            targets = [channel]
+        else:
+            body = payload
+            targets = list(self.groups.get(name, ()))
+        return [self.channels[c] for c in targets if c in self.channels], body
+
+    async def _dispatch(self):
+        """
+        Notifications → files des canaux, dans l'ordre d'arrivée. Les
+        notifications déjà reçues sont traitées par lot: leurs messages
+        débordés sont relus en une seule requête.
+        """
+        while True:
+            batch = [await self._inbox.get()]
+            while not self._inbox.empty() and len(batch) < MAX_BATCH:
+                batch.append(self._inbox.get_nowait())
+            routed = [(queues, body) for queues, body in map(lambda item: self._route(*item), batch) if queues]
+            overflow_ids = [int(body[1:]) for _, body in routed if body.startswith('@')]
+            overflow = {}
+            if overflow_ids:
+                try:
+                    overflow = await self._run(self._fetch_overflow, overflow_ids)
+                except Exception as e:
+                    logger.error(f"Channel layer overflow fetch error: {e}")
+            for queues, body in routed:
+                try:
+                    if body.startswith('@'):
+                        data = overflow.get(int(body[1:]))
+                        if data is None:
+                            continue  # expiré
+                    else:
+                        data = base64.b64decode(body)
+                    message = self.channel_layer.deserialize(data)
+                except Exception as e:
+                    logger.error(f"Channel layer dispatch error: {e}")
+                    continue
+                for queue in queues:
+                    # File pleine: le message est abandonné, comme un group_send
+                    # vers un canal plein de RedisChannelLayer
+                    if not queue.full():
+                        queue.put_nowait(message)
+
+    async def new_channel(self, prefix='specific.'):
+        await self._listen(self.process_channel)
+        channel = f"{prefix}{self.client_id}!{uuid.uuid4().hex}"
+        self.channels[channel] = asyncio.Queue(maxsize=self.channel_layer.get_capacity(channel))
+        return channel
+
+    async def receive(self, channel):
+        queue = self.channels.get(channel)
+        if queue is None:
+            raise RuntimeError("receive() is only possible on channels created by this process")
+        try:
+            return await queue.get()
+        except asyncio.CancelledError:
+            # Consommateur arrêté: le canal et ses groupes sont libérés
+            self.channels.pop(channel, None)
+            for name, members in list(self.groups.items()):
+                members.discard(channel)
+                if not members:
+                    del self.groups[name]
+                    asyncio.ensure_future(self._listen(name, listen=False))
+            raise
+
+    # ---------- Envoi ----------
+
+    def _sender_connection(self):
+        if self._sender is None or self._sender.closed:
+            self._sender = self._connect()
+        return self._sender
+
+    def _send_batch(self, statements):
+        """
+        Un aller-retour pour tout le lot. Une requête multiple est une seule
+        transaction: si une instruction échoue, rien n'est envoyé et chaque
+        instruction est rejouée seule, pour que l'erreur n'atteigne que la
+        sienne.
+
+        Returns:
+            [None ou exception] par instruction
+        """
+        try:
+            with self._sender_connection().cursor() as cursor:
+                cursor.execute('; '.join(
+                    cursor.mogrify(sql, params).decode() for sql, params in statements
+                ))
+            return [None] * len(statements)
+        except Exception as e:
+            if len(statements) == 1:
+                return [e]
+        results = []
+        for sql, params in statements:
+            try:
+                with self._sender_connection().cursor() as cursor:
+                    cursor.execute(sql, params)
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+        return results
+
+    async def _flush_pending(self):
+        try:
+            while self._pending:
+                batch, self._pending = self._pending[:MAX_BATCH], self._pending[MAX_BATCH:]
+                statements = [statement for statement, _ in batch]
+                if time.monotonic() - self._last_cleanup > self.expiry:
+                    self._last_cleanup = time.monotonic()
+                    statements.append((
+                        f'DELETE FROM "{OVERFLOW_TABLE}" WHERE created_at < now() - make_interval(secs => %s)',
+                        [self.expiry]
+                    ))
+                try:
+                    results = await self._run(self._send_batch, statements)
+                except Exception as e:
+                    results = [e] * len(statements)
+                for (_, future), error in zip(batch, results):
+                    if future.done():
+                        continue
+                    if error is None:
+                        future.set_result(None)
+                    else:
+                        future.set_exception(error)
+        finally:
+            self._flushing = None
+
+    async def _notify(self, name, message, channel=''):
+        """pg_notify mis en lot: une requête pour tous les envois en attente"""
+        import psycopg2
+
+        data = self.channel_layer.serialize(message)
+        head = f'{channel}|' if channel else ''
+        body = base64.b64encode(data).decode()
+        if len(head) + len(body) <= NOTIFY_MAX_PAYLOAD:
+            statement = ('SELECT pg_notify(%s, %s)', [name, head + body])
+        else:
+            statement = (
+                f'WITH m AS (INSERT INTO "{OVERFLOW_TABLE}" (payload) VALUES (%s) RETURNING id) '
+                f"SELECT pg_notify(%s, %s || '@' || m.id) FROM m",
+                [psycopg2.Binary(data), name, head]
+            )
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((statement, future))
+        if self._flushing is None:
+            self._flushing = asyncio.ensure_future(self._flush_pending())
+        await future
+
+    async def send(self, channel, message):
+        if '!' not in channel:
+            raise ValueError("PostgresChannelLayer only supports process-specific channels")
+        client_id = channel.split('!', 1)[0].rsplit('.', 1)[-1]
+        await self._notify(pg_channel(self.prefix, 'p', client_id), message, channel)
+
+    # ---------- Groupes ----------
+
+    async def group_add(self, group, channel):
+        if channel not in self.channels:
+            raise RuntimeError("group_add() is only possible on channels created by this process")
+        name = pg_channel(self.prefix, 'g', group)
+        self.groups.setdefault(name, set()).add(channel)
+        await self._listen(name)
+
+    async def group_discard(self, group, channel):
+        name = pg_channel(self.prefix, 'g', group)
+        members = self.groups.get(name)
+        if members is None:
+            return
+        members.discard(channel)
+        if not members:
+            del self.groups[name]
+            await self._listen(name, listen=False)
+
+    async def group_send(self, group, message):
+        await self._notify(pg_channel(self.prefix, 'g', group), message)
+
+    async def flush(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        if self._listener is not None:
+            asyncio.get_running_loop().remove_reader(self._listener.fileno())
+            self._listener.close()
+            self._listener = None
+        if self._sender is not None:
+            await self._run(self._sender.close)
+            self._sender = None
+        self.channels.clear()
+        self.groups.clear()
+        self._listening.clear()
+
+    def close(self):
+        """Libère les connexions d'une boucle déjà fermée"""
+        for conn in (self._listener, self._sender):
+            if conn is not None:
+                conn.close()
+        self._listener = self._sender = None
+        self._executor.shutdown(wait=False)
+
+
+class PostgresChannelLayer(BaseChannelLayer):
+    """
+    Channel layer multi-processus sur LISTEN/NOTIFY de la base Django.
+    Un PostgresLoopLayer (connexions, files) par boucle asyncio; ceux des
+    boucles fermées (async_to_sync) sont libérés à l'appel suivant.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, database='default', prefix='asgi', expiry=60, capacity=100,
+                 channel_capacity=None):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.database = database
+        self.prefix = prefix
+        self._layers = {}
+
+    def serialize(self, message):
+        return msgpack.packb(message, use_bin_type=True)
+
+    def deserialize(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+    def _get_layer(self):
+        for loop in [loop for loop in self._layers if loop.is_closed()]:
+            self._layers.pop(loop).close()
+        loop = asyncio.get_running_loop()
+        layer = self._layers.get(loop)
+        if layer is None:
+            layer = PostgresLoopLayer(self, self.database, self.prefix, self.expiry)
+            self._layers[loop] = layer
+        return layer
+
+    async def new_channel(self, prefix='specific.'):
+        return await self._get_layer().new_channel(prefix)
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.valid_channel_name(channel)
+        await self._get_layer().send(channel, message)
+
+    async def receive(self, channel):
+        self.valid_channel_name(channel)
+        return await self._get_layer().receive(channel)
+
+    async def group_add(self, group, channel):
+        self.valid_group_name(group)
+        self.valid_channel_name(channel)
+        await self._get_layer().group_add(group, channel)
+
+    async def group_discard(self, group, channel):
+        self.valid_group_name(group)
+        self.valid_channel_name(channel)
+        await self._get_layer().group_discard(group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.valid_group_name(group)
+        await self._get_layer().group_send(group, message)
+
+    async def flush(self):
+        await self._get_layer().flush()
@@ -0,0 +1,36 @@
+"""
+Outils communs aux commandes bench_chat_* (chat/management/commands)
+"""
+from contextlib import contextmanager
+
+
+def percentile(values, pct):
+    """Percentile `pct` (0-100) par rang, sans interpolation"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+@contextmanager
+def count_redis_round_trips(counter):
+    """Compte les commandes Redis (un pipeline = un aller-retour)"""
+    try:
+        from redis.asyncio.client import Redis, Pipeline
+    except ImportError:
+        yield
+        return
+
+    execute_command, execute = Redis.execute_command, Pipeline.execute
+
+    async def counted_command(self, *args, **kwargs):
+        counter['redis'] += 1
+        return await execute_command(self, *args, **kwargs)
+
+    async def counted_pipeline(self, *args, **kwargs):
+        counter['redis'] += 1
+        return await execute(self, *args, **kwargs)
+
+    Redis.execute_command, Pipeline.execute = counted_command, counted_pipeline
+    try:
+        yield
+    finally:
+        Redis.execute_command, Pipeline.execute = execute_command, execute
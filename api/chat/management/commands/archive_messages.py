@@ -0,0 +1,59 @@
+"""
+archive_messages — Exporte l'historique ancien vers le stockage froid.
+
+Chaque mois antérieur à --before (par défaut CHAT_ARCHIVE_AFTER_MONTHS
+mois avant le mois courant) est exporté dans AAAA-MM.bin du stockage
+privé `chat_archive`, indexé par MessageArchive, puis retiré de la base
+(partition supprimée sous PostgreSQL). Un mois à la fois: la commande peut être interrompue
+puis relancée.
+
+Usage:
+    python manage.py archive_messages --dry-run
+    python manage.py archive_messages --before 2025-01
+"""
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from chat import archive, partitions
+from chat.models import Message
+
+
+class Command(BaseCommand):
+    help = "Archive les messages des mois anciens (export puis suppression)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help="Premier mois conservé (AAAA-MM)")
+        parser.add_argument('--dry-run', action='store_true', help="Compter sans écrire")
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                cutoff = datetime.datetime.strptime(options['before'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError("--before attend AAAA-MM")
+        else:
+            cutoff = partitions.add_months(
+                partitions.month_start(timezone.now()),
+                -getattr(settings, 'CHAT_ARCHIVE_AFTER_MONTHS', 12)
+            )
+
+        oldest = Message.objects.aggregate(oldest=Min('created_at'))['oldest']
+        if oldest is None:
+            self.stdout.write("Aucun message")
+            return
+
+        month = partitions.month_start(oldest.astimezone(datetime.timezone.utc))
+        total = 0
+        while month < cutoff:
+            count, conversations = archive.export_month(month, dry_run=options['dry_run'])
+            if count:
+                self.stdout.write(f"  {month:%Y-%m}: {count} messages, {conversations} conversations")
+            total += count
+            month = partitions.add_months(month, 1)
+
+        verb = "à archiver" if options['dry_run'] else "archivés"
+        self.stdout.write(self.style.SUCCESS(f"{total} messages {verb} (avant {cutoff:%Y-%m})"))
@@ -0,0 +1,251 @@
+"""
+bench_chat_layers — Compare les channel layers sur le fan-out de groupe.
+
+Pour chaque taille de conversation (--sizes, 2 / 50 / 500 membres par
+défaut), abonne autant de canaux répartis sur --processes instances du
+layer (un processus Daphne chacune), puis mesure:
+- latence: chaque group_send attend la réception par le dernier membre
+  (p50 / p95 / p99);
+- débit: --messages envois enchaînés sans attendre, jusqu'à réception de
+  tout par tous les membres (envois/s et remises/s);
+- allers-retours Redis côté client et, via INFO, CPU et commandes
+  consommés par Redis (somme sur tous les hôtes).
+
+Layers (--layer, tous ceux disponibles par défaut):
+- memory: InMemoryChannelLayer, un seul processus (référence);
+- core: channels_redis.core.RedisChannelLayer, une liste par canal;
+- pubsub: chat.layers.ShardedPubSubChannelLayer, un PUBLISH par envoi,
+  hôtes répartis par hachage cohérent;
+- postgres: chat.layers.PostgresChannelLayer, LISTEN/NOTIFY sur la base
+  configurée (PostgreSQL, migration 0013 appliquée).
+
+Hôtes Redis: --redis-url (répétable, CHANNEL_REDIS_URLS / REDIS_URL par
+défaut) ou --spawn N pour lancer N redis-server locaux sur des ports
+libres. Le préfixe `bench` isole les données de l'application.
+
+Usage:
+    python manage.py bench_chat_layers --spawn 2
+    python manage.py bench_chat_layers --redis-url redis://localhost:6379 --redis-url redis://localhost:6380
+    python manage.py bench_chat_layers --layer postgres --sizes 2,500 --messages 500 --processes 8
+"""
+import asyncio
+import logging
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import tempfile
+import time
+import uuid
+from collections import Counter
+
+import redis
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from chat.layers import PostgresChannelLayer, ShardedPubSubChannelLayer
+from chat.management.bench_utils import count_redis_round_trips, percentile
+
+PREFIX = 'bench'
+LAYERS = ['memory', 'core', 'pubsub', 'postgres']
+REDIS_LAYERS = ('core', 'pubsub')
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def redis_stats(urls):
+    """(CPU Redis en secondes, commandes traitées) cumulés, None si INFO indisponible"""
+    cpu = commands = 0
+    for url in urls:
+        client = redis.Redis.from_url(url)
+        try:
+            info = client.info()
+        except redis.ResponseError:
+            return None
+        finally:
+            client.close()
+        cpu += info['used_cpu_sys'] + info['used_cpu_user']
+        commands += info['total_commands_processed']
+    return cpu, commands
+
+
+class Command(BaseCommand):
+    help = "Benchmark du fan-out de groupe: mémoire, Redis (listes / pub/sub) et PostgreSQL"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--layer', choices=LAYERS + ['all'], default='all')
+        parser.add_argument('--redis-url', action='append', default=[],
+                            help="Hôte Redis (répétable)")
+        parser.add_argument('--spawn', type=int, default=0, help="Lancer N redis-server locaux")
+        parser.add_argument('--sizes', default='2,50,500', help="Membres par conversation")
+        parser.add_argument('--messages', type=int, default=200, help="group_send par taille et par phase")
+        parser.add_argument('--processes', type=int, default=4,
+                            help="Instances du layer (processus simulés)")
+        parser.add_argument('--payload', type=int, default=256, help="Octets par message")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError("--sizes attend des entiers séparés par des virgules")
+
+        servers = []
+        urls = options['redis_url']
+        if options['spawn']:
+            servers = self.spawn(options['spawn'])
+            urls = [url for url, _, _ in servers]
+        elif not urls:
+            urls = [url for url in os.environ.get(
+                'CHANNEL_REDIS_URLS', os.environ.get('REDIS_URL', '')
+            ).split(',') if url]
+
+        available = {
+            'memory': True,
+            'core': bool(urls),
+            'pubsub': bool(urls),
+            'postgres': connection.vendor == 'postgresql',
+        }
+        if options['layer'] == 'all':
+            layers = [name for name in LAYERS if available[name]]
+            skipped = [name for name in LAYERS if not available[name]]
+        else:
+            layers, skipped = [options['layer']], []
+            if not available[options['layer']]:
+                raise CommandError(
+                    f"--layer {options['layer']}: "
+                    + ("base PostgreSQL requise" if options['layer'] == 'postgres'
+                       else "--redis-url, --spawn, CHANNEL_REDIS_URLS ou REDIS_URL requis")
+                )
+
+        logging.getLogger('channels_redis').setLevel(logging.WARNING)
+        self.stdout.write(
+            f"{len(urls)} hôte(s) Redis, {options['processes']} processus, "
+            f"{options['messages']} envois de {options['payload']} octets par taille et par phase"
+        )
+        if skipped:
+            self.stdout.write(f"Ignorés (non configurés): {', '.join(skipped)}")
+        try:
+            for name in layers:
+                self.stdout.write(self.style.MIGRATE_HEADING(f"\nLayer {name}"))
+                for size in sizes:
+                    results = asyncio.run(self.run(name, urls, size, options))
+                    self.report(name, size, results, options['messages'])
+        finally:
+            for _, process, directory in servers:
+                process.terminate()
+                process.wait()
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def spawn(self, count):
+        binary = shutil.which('redis-server')
+        if binary is None:
+            raise CommandError("--spawn nécessite redis-server dans le PATH")
+        servers = []
+        for _ in range(count):
+            port = _free_port()
+            directory = tempfile.mkdtemp(prefix='bench-redis-')
+            process = subprocess.Popen(
+                [binary, '--port', str(port), '--save', '', '--appendonly', 'no', '--dir', directory],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            url = f'redis://127.0.0.1:{port}'
+            servers.append((url, process, directory))
+            client = redis.Redis.from_url(url)
+            for _ in range(50):
+                try:
+                    client.ping()
+                    break
+                except redis.ConnectionError:
+                    time.sleep(0.1)
+            else:
+                raise CommandError(f"redis-server ne répond pas sur le port {port}")
+            client.close()
+        return servers
+
+    def make_layers(self, name, urls, options):
+        # Chaque membre doit pouvoir garder toute la phase de débit en file
+        capacity = max(100, options['messages'])
+        if name == 'memory':
+            # Un seul processus par construction
+            return [InMemoryChannelLayer(capacity=capacity)]
+        instances = []
+        for _ in range(options['processes']):
+            if name == 'core':
+                from channels_redis.core import RedisChannelLayer
+                instances.append(RedisChannelLayer(hosts=urls, prefix=PREFIX, capacity=capacity))
+            elif name == 'pubsub':
+                instances.append(ShardedPubSubChannelLayer(hosts=urls, prefix=PREFIX))
+            else:
+                instances.append(PostgresChannelLayer(prefix=PREFIX, capacity=capacity))
+        return instances
+
+    async def run(self, name, urls, size, options):
+        instances = self.make_layers(name, urls, options)
+        group = f'bench_{size}_{uuid.uuid4().hex[:8]}'
+        members = []
+        for i in range(size):
+            layer = instances[i % len(instances)]
+            channel = await layer.new_channel()
+            await layer.group_add(group, channel)
+            members.append((layer, channel))
+
+        sender = instances[0]
+        messages = options['messages']
+        payload = b'x' * options['payload']
+
+        def event(seq):
+            return {'type': 'chat_message', 'message': {'seq': seq, 'encrypted_content': payload}}
+
+        async def drain(layer, channel, count):
+            for _ in range(count):
+                await layer.receive(channel)
+
+        latencies, counter = [], Counter()
+        stats = redis_stats(urls) if name in REDIS_LAYERS else None
+        with count_redis_round_trips(counter):
+            for seq in range(messages):
+                start = time.perf_counter()
+                receives = asyncio.gather(*(layer.receive(channel) for layer, channel in members))
+                await sender.group_send(group, event(seq))
+                await asyncio.wait_for(receives, timeout=10)
+                latencies.append((time.perf_counter() - start) * 1000)
+        if stats:
+            stats = (stats, redis_stats(urls))
+
+        start = time.perf_counter()
+        receivers = asyncio.gather(*(drain(layer, channel, messages) for layer, channel in members))
+        for seq in range(messages):
+            await sender.group_send(group, event(seq))
+        await asyncio.wait_for(receivers, timeout=60)
+        elapsed = time.perf_counter() - start
+
+        for layer, channel in members:
+            await layer.group_discard(group, channel)
+        for layer in instances:
+            await layer.flush()
+        return latencies, counter['redis'], stats, elapsed
+
+    def report(self, name, size, results, messages):
+        latencies, round_trips, stats, elapsed = results
+        line = (
+            f"  {size:>4} membres  p50 {statistics.median(latencies):7.2f} ms  "
+            f"p95 {percentile(latencies, 95):7.2f} ms  p99 {percentile(latencies, 99):7.2f} ms  "
+            f"débit {messages / elapsed:8.0f} envois/s {messages * size / elapsed:9.0f} remises/s"
+        )
+        if name in REDIS_LAYERS:
+            line += f"  allers-retours/envoi {round_trips / messages:5.1f}"
+            if stats:
+                (cpu_before, commands_before), (cpu_after, commands_after) = stats
+                line += (
+                    f"  CPU Redis/envoi {(cpu_after - cpu_before) / messages * 1e6:7.1f} µs"
+                    f"  commandes/envoi {(commands_after - commands_before) / messages:6.1f}"
+                )
+            else:
+                line += "  CPU Redis n/d (INFO indisponible)"
+        self.stdout.write(line)
@@ -0,0 +1,442 @@
+"""
+bench_chat_load — Test de charge du chat avec des clients WebSocket simulés.
+
+Crée N utilisateurs de test (loadtest_<i>) répartis dans des conversations
+privées et des groupes, les connecte puis leur fait jouer pendant
+--duration secondes un mélange d'envois, d'indicateurs de frappe,
+d'accusés de lecture et de get_messages (débits par utilisateur, arrivées
+de Poisson). Mesure:
+- latence de connexion (jusqu'à connection_established);
+- latence de distribution de bout en bout (envoi → new_message chez
+  chaque autre membre; l'horodatage voyage dans le contenu chiffré);
+- requêtes SQL par action (en processus uniquement);
+- mémoire (RSS) par connexion: en processus, clients simulés compris.
+
+Deux transports:
+- inprocess (défaut): WebsocketCommunicator, ChatConsumer dans le même
+  processus; --layer memory / redis / both (REDIS_URL ou --redis-url);
+- websocket: vrais clients (paquet `websockets`) contre un serveur lancé à
+  part (daphne ondes_backend.asgi:application), qui utilise son propre
+  channel layer. --server-pid pour mesurer sa mémoire.
+
+Usage:
+    python manage.py bench_chat_load --users 500 --duration 30
+    python manage.py bench_chat_load --layer both --redis-url redis://localhost:6379
+    python manage.py bench_chat_load --transport websocket --url ws://127.0.0.1:8000/ws/chat/ --server-pid 1234
+"""
+import asyncio
+import base64
+import contextvars
+import json
+import logging
+import os
+import random
+import statistics
+import struct
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from channels.layers import DEFAULT_CHANNEL_LAYER, InMemoryChannelLayer, channel_layers
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.backends.utils import CursorWrapper
+from rest_framework.authtoken.models import Token
+
+from chat.consumers import ChatConsumer
+from chat.management.bench_utils import count_redis_round_trips, percentile
+from chat.models import Conversation, ConversationMember
+
+USERNAME_PREFIX = 'loadtest_'
+
+_action = contextvars.ContextVar('bench_action', default='connect')
+
+
+@contextmanager
+def count_queries(counter):
+    """Requêtes SQL par action WebSocket (contexte propagé aux threads ORM)"""
+    execute, executemany = CursorWrapper.execute, CursorWrapper.executemany
+    receive_json = ChatConsumer.receive_json
+
+    def counted_execute(self, *args, **kwargs):
+        counter[_action.get()] += 1
+        return execute(self, *args, **kwargs)
+
+    def counted_executemany(self, *args, **kwargs):
+        counter[_action.get()] += 1
+        return executemany(self, *args, **kwargs)
+
+    async def tagged_receive_json(self, content):
+        if isinstance(content, dict):
+            _action.set(content.get('action') or 'other')
+        await receive_json(self, content)
+
+    CursorWrapper.execute, CursorWrapper.executemany = counted_execute, counted_executemany
+    ChatConsumer.receive_json = tagged_receive_json
+    try:
+        yield
+    finally:
+        CursorWrapper.execute, CursorWrapper.executemany = execute, executemany
+        ChatConsumer.receive_json = receive_json
+
+
+def rss_bytes(pid='self'):
+    """Mémoire résidente d'un processus (Linux), None si indisponible"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+
+
+def stamp():
+    """Contenu « chiffré » portant l'instant d'envoi"""
+    return base64.b64encode(struct.pack('>d', time.perf_counter()) + os.urandom(24)).decode()
+
+
+def read_stamp(encrypted_content):
+    try:
+        return struct.unpack('>d', base64.b64decode(encrypted_content)[:8])[0]
+    except (ValueError, TypeError, struct.error):
+        return None
+
+
+# ========== CLIENTS ==========
+
+class ConnectionClosed(Exception):
+    pass
+
+
+class InProcessClient:
+    """ChatConsumer via WebsocketCommunicator"""
+
+    def __init__(self, path):
+        self.communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), path)
+
+    async def connect(self):
+        connected, _ = await self.communicator.connect(timeout=30)
+        if not connected:
+            raise ConnectionClosed()
+
+    async def send(self, content):
+        await self.communicator.send_json_to(content)
+
+    async def receive(self, timeout):
+        output = await self.communicator.receive_output(timeout)
+        if output['type'] != 'websocket.send':
+            raise ConnectionClosed()
+        return output.get('text')
+
+    async def close(self):
+        await self.communicator.disconnect()
+
+
+class WebSocketClient:
+    """Vrai client WebSocket (serveur lancé à part)"""
+
+    def __init__(self, url):
+        self.url = url
+        self.socket = None
+
+    async def connect(self):
+        import websockets
+        self.socket = await websockets.connect(self.url, max_size=None, open_timeout=30)
+
+    async def send(self, content):
+        await self.socket.send(json.dumps(content))
+
+    async def receive(self, timeout):
+        import websockets
+        try:
+            return await asyncio.wait_for(self.socket.recv(), timeout)
+        except websockets.ConnectionClosed:
+            raise ConnectionClosed()
+
+    async def close(self):
+        await self.socket.close()
+
+
+# ========== COMMANDE ==========
+
+class Command(BaseCommand):
+    help = "Test de charge du chat (clients WebSocket simulés)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help="Utilisateurs connectés")
+        parser.add_argument('--conversations-per-user', type=int, default=20)
+        parser.add_argument('--group-ratio', type=float, default=0.3, help="Part des appartenances dans des groupes")
+        parser.add_argument('--group-size', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=20, help="Secondes de trafic")
+        parser.add_argument('--send-rate', type=float, default=0.1, help="Messages/s par utilisateur")
+        parser.add_argument('--typing-rate', type=float, default=0.2, help="Indicateurs de frappe/s par utilisateur")
+        parser.add_argument('--read-rate', type=float, default=0.1, help="Accusés de lecture/s par utilisateur")
+        parser.add_argument('--history-rate', type=float, default=0.02, help="get_messages/s par utilisateur")
+        parser.add_argument('--connect-concurrency', type=int, default=100)
+        parser.add_argument('--transport', choices=['inprocess', 'websocket'], default='inprocess')
+        parser.add_argument('--layer', choices=['memory', 'redis', 'both'], default=None,
+                            help="Channel layer en processus (défaut: redis si --redis-url, sinon memory)")
+        parser.add_argument('--redis-url', default=os.environ.get('REDIS_URL', ''))
+        parser.add_argument('--url', default='ws://127.0.0.1:8000/ws/chat/', help="Serveur (transport websocket)")
+        parser.add_argument('--server-pid', type=int, default=None, help="PID du serveur (mémoire, transport websocket)")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help="Conserver les utilisateurs de test")
+
+    def handle(self, *args, **options):
+        if options['transport'] == 'websocket':
+            try:
+                import websockets  # noqa: F401
+            except ImportError:
+                raise CommandError("Le transport websocket nécessite le paquet `websockets` (pip install websockets)")
+
+        layer = options['layer'] or ('redis' if options['redis_url'] else 'memory')
+        if options['transport'] == 'websocket':
+            layers = ['server']
+        else:
+            layers = ['memory', 'redis'] if layer == 'both' else [layer]
+        if 'redis' in layers and not options['redis_url']:
+            raise CommandError("--layer redis nécessite --redis-url (ou REDIS_URL)")
+
+        logging.getLogger('chat').setLevel(logging.WARNING)
+        logging.getLogger('channels_redis').setLevel(logging.WARNING)
+
+        tokens, user_conversations = self.create_fixtures(options)
+        self.stdout.write(
+            f"{len(tokens)} utilisateurs, {len({c for cs in user_conversations.values() for c in cs})} conversations, "
+            f"{options['duration']:.0f} s de trafic ({options['transport']})"
+        )
+        try:
+            for name in layers:
+                results = asyncio.run(self.run(name, tokens, user_conversations, options))
+                self.report(name, results, options)
+        finally:
+            if not options['keep']:
+                self.delete_fixtures()
+
+    # ---------- Données de test ----------
+
+    def delete_fixtures(self):
+        users = User.objects.filter(username__startswith=USERNAME_PREFIX)
+        Conversation.objects.filter(members__user__in=users).delete()
+        users.delete()
+
+    def create_fixtures(self, options):
+        """Utilisateurs, tokens, conversations privées et groupes (insertions en lot)"""
+        self.delete_fixtures()
+        rng = random.Random(options['seed'])
+        count = options['users']
+        User.objects.bulk_create([
+            User(username=f'{USERNAME_PREFIX}{i}', password='!') for i in range(count)
+        ])
+        users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('id'))
+        Token.objects.bulk_create([Token(user=u, key=Token.generate_key()) for u in users])
+        tokens = dict(Token.objects.filter(user__in=users).values_list('user_id', 'key'))
+
+        memberships = count * options['conversations_per_user']
+        group_size = max(3, min(options['group_size'], count))
+        groups = int(memberships * options['group_ratio'] / group_size)
+        privates = int(memberships * (1 - options['group_ratio']) / 2)
+        member_sets = [rng.sample(users, group_size) for _ in range(groups)]
+        # Une seule conversation privée par paire (dm_key unique)
+        pairs = {}
+        for members in (rng.sample(users, 2) for _ in range(privates if count >= 2 else 0)):
+            pairs.setdefault(Conversation.make_dm_key(members[0].id, members[1].id), members)
+        member_sets += list(pairs.values())
+
+        conversations = Conversation.objects.bulk_create([
+            Conversation(
+                conversation_type='group' if len(members) > 2 else 'private',
+                name=f'load {i}' if len(members) > 2 else '',
+                dm_key=None if len(members) > 2 else Conversation.make_dm_key(members[0].id, members[1].id),
+                created_by=members[0],
+            ) for i, members in enumerate(member_sets)
+        ])
+        ConversationMember.objects.bulk_create([
+            ConversationMember(conversation=conv, user=user, role='owner' if j == 0 else 'member')
+            for conv, members in zip(conversations, member_sets)
+            for j, user in enumerate(members)
+        ], batch_size=1000)
+
+        user_conversations = defaultdict(list)
+        for conv, members in zip(conversations, member_sets):
+            for user in members:
+                user_conversations[user.id].append(str(conv.uuid))
+        return tokens, user_conversations
+
+    # ---------- Exécution ----------
+
+    async def run(self, layer_name, tokens, user_conversations, options):
+        if layer_name == 'memory':
+            layer = InMemoryChannelLayer(capacity=1000)
+        elif layer_name == 'redis':
+            from channels_redis.core import RedisChannelLayer
+            layer = RedisChannelLayer(hosts=[options['redis_url']], capacity=1000)
+        else:
+            layer = None
+        previous = channel_layers.set(DEFAULT_CHANNEL_LAYER, layer) if layer else None
+
+        stats = {
+            'connect': [], 'delivery': [], 'retries': 0, 'errors': Counter(),
+            'actions': Counter(), 'queries': Counter(), 'redis': Counter(), 'failed': 0,
+        }
+        rng = random.Random(options['seed'])
+        clients = {}
+        sem = asyncio.Semaphore(options['connect_concurrency'])
+        deadline = None
+
+        def make_client(token):
+            if options['transport'] == 'websocket':
+                return WebSocketClient(f"{options['url']}?token={token}")
+            return InProcessClient(f"/ws/chat/?token={token}")
+
+        async def connect(user_id):
+            async with sem:
+                for _ in range(10):
+                    client = make_client(tokens[user_id])
+                    start = time.perf_counter()
+                    try:
+                        await client.connect()
+                        frame = self.decode(await client.receive(30))
+                    except (ConnectionClosed, asyncio.TimeoutError, OSError):
+                        break
+                    if frame.get('type') == 'connection_established':
+                        stats['connect'].append((time.perf_counter() - start) * 1000)
+                        clients[user_id] = client
+                        return
+                    # Admission refusée: réessayer après retry_after
+                    stats['retries'] += 1
+                    await client.close()
+                    await asyncio.sleep(frame.get('retry_after', 1))
+                stats['failed'] += 1
+
+        async def listen(user_id, client, last_seq):
+            while True:
+                try:
+                    text = await client.receive(timeout=5)
+                except asyncio.TimeoutError:
+                    if time.perf_counter() > deadline:
+                        return
+                    continue
+                except (ConnectionClosed, asyncio.CancelledError):
+                    return
+                now = time.perf_counter()
+                frame = self.decode(text)
+                for event in frame if isinstance(frame, list) else [frame]:
+                    kind = event.get('type')
+                    if kind == 'new_message':
+                        message = event['message']
+                        last_seq[message['conversation_uuid']] = message['seq']
+                        sent = read_stamp(message.get('encrypted_content'))
+                        if sent and message.get('sender_id') != user_id:
+                            stats['delivery'].append((now - sent) * 1000)
+                    elif kind == 'error':
+                        stats['errors'][event.get('code') or event.get('message', '')[:40]] += 1
+
+        async def drive(user_id, client, last_seq):
+            conversations = user_conversations[user_id]
+            weights = {
+                'send_message': options['send_rate'],
+                'typing': options['typing_rate'],
+                'read_receipt': options['read_rate'],
+                'get_messages': options['history_rate'],
+            }
+            total = sum(weights.values())
+            if not conversations or not total:
+                return
+            user_rng = random.Random(rng.random())
+            while True:
+                await asyncio.sleep(user_rng.expovariate(total))
+                if time.perf_counter() > deadline:
+                    return
+                action = user_rng.choices(list(weights), list(weights.values()))[0]
+                conv_uuid = user_rng.choice(conversations)
+                if action == 'send_message':
+                    data = {'conversation_uuid': conv_uuid, 'encrypted_content': stamp()}
+                elif action == 'typing':
+                    data = {'conversation_uuid': conv_uuid, 'is_typing': True}
+                elif action == 'read_receipt':
+                    if not last_seq:
+                        continue
+                    conv_uuid = user_rng.choice(list(last_seq))
+                    data = {'conversation_uuid': conv_uuid, 'seq': last_seq[conv_uuid]}
+                else:
+                    data = {'conversation_uuid': conv_uuid, 'limit': 50}
+                try:
+                    await client.send({'action': action, 'data': data})
+                except Exception:
+                    return
+                stats['actions'][action] += 1
+
+        server_pid = options['server_pid'] if options['transport'] == 'websocket' else 'self'
+        with count_queries(stats['queries']), count_redis_round_trips(stats['redis']):
+            rss_before = rss_bytes(server_pid) if server_pid else None
+            await asyncio.gather(*(connect(user_id) for user_id in tokens))
+            rss_after = rss_bytes(server_pid) if server_pid else None
+            stats['connect_queries'] = stats['queries']['connect']
+            stats['connect_redis'] = stats['redis']['redis']
+            stats['memory'] = (rss_after - rss_before) / len(clients) if clients and rss_before and rss_after else None
+
+            deadline = time.perf_counter() + options['duration']
+            stats['elapsed'] = options['duration']
+            seqs = {user_id: {} for user_id in clients}
+            listeners = [asyncio.create_task(listen(u, c, seqs[u])) for u, c in clients.items()]
+            await asyncio.gather(*(drive(u, c, seqs[u]) for u, c in clients.items()))
+            # Laisser arriver les derniers messages
+            await asyncio.sleep(1)
+            for task in listeners:
+                task.cancel()
+            await asyncio.gather(*(c.close() for c in clients.values()), return_exceptions=True)
+
+        stats['connections'] = len(clients)
+        if layer is not None:
+            if hasattr(layer, 'flush'):
+                await layer.flush()
+            channel_layers.set(DEFAULT_CHANNEL_LAYER, previous)
+        return stats
+
+    def decode(self, text):
+        return json.loads(text) if text else {}
+
+    # ---------- Rapport ----------
+
+    def report(self, layer_name, stats, options):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\nLayer {layer_name}"))
+        connections = stats['connections']
+        self.stdout.write(
+            f"  connexions      {connections} ouvertes, {stats['failed']} échecs, {stats['retries']} refus d'admission"
+        )
+        for name in ('connect', 'delivery'):
+            values = stats[name]
+            if not values:
+                continue
+            self.stdout.write(
+                f"  {name:<15} p50 {statistics.median(values):8.2f} ms  p95 {percentile(values, 95):8.2f} ms  "
+                f"p99 {percentile(values, 99):8.2f} ms  max {max(values):8.2f} ms  (n={len(values)})"
+            )
+        actions = stats['actions']
+        self.stdout.write(
+            f"  actions         {sum(actions.values()) / stats['elapsed']:.1f}/s  "
+            + ", ".join(f"{action} {n}" for action, n in sorted(actions.items()))
+        )
+        if options['transport'] == 'inprocess':
+            per_action = [
+                f"{action} {stats['queries'][action] / n:.1f}"
+                for action, n in sorted(actions.items()) if n
+            ]
+            if connections:
+                per_action.insert(0, f"connect {stats['connect_queries'] / connections:.1f}")
+            self.stdout.write(f"  requêtes SQL/op {', '.join(per_action)}")
+            if stats['redis']['redis'] and connections:
+                traffic = stats['redis']['redis'] - stats['connect_redis']
+                self.stdout.write(
+                    f"  redis           {stats['connect_redis'] / connections:.1f} allers-retours/connexion, "
+                    f"{traffic / max(1, sum(actions.values())):.1f}/action"
+                )
+        if stats['memory'] is not None:
+            self.stdout.write(f"  mémoire         {stats['memory'] / 1024:.1f} Kio RSS/connexion")
+        if stats['errors']:
+            self.stdout.write(
+                "  erreurs         " + ", ".join(f"{k}: {n}" for k, n in stats['errors'].most_common(5))
+            )
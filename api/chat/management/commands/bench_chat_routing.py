@@ -0,0 +1,189 @@
+"""
+bench_chat_routing — Compare les modes de routage du chat (chat/fanout.py).
+
+Simule des connexions et des envois sur le channel layer configuré
+(InMemory ou Redis) sans base de données: l'annuaire des conversations
+est préchargé dans le cache, comme en régime établi. Mesure pour chaque
+mode la latence de connexion / d'envoi / de déconnexion, le nombre
+d'opérations du channel layer et, avec channels_redis, le nombre
+d'allers-retours Redis. `--online` règle la part d'utilisateurs connectés
+et `--presence` active le fan-out filtré par la présence
+(CHAT_PRESENCE_FANOUT) le temps de la mesure.
+
+Le cache est celui de l'application, sous le préfixe de clés
+`bench_chat_routing:`: les identifiants simulés (0..users-1) recouvrent
+ceux de vrais utilisateurs, dont annuaires et présence restent intacts.
+
+Usage:
+    python manage.py bench_chat_routing
+    python manage.py bench_chat_routing --users 200 --conversations-per-user 500 --members 20
+    python manage.py bench_chat_routing --online 0.2 --presence
+    REDIS_URL=redis://localhost:6379 python manage.py bench_chat_routing
+"""
+import asyncio
+import logging
+import random
+import statistics
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from chat import fanout, membership, presence
+from chat.fanout import MODE_CONVERSATION, MODE_USER, broadcast, connection_groups
+from chat.management.bench_utils import count_redis_round_trips, percentile
+
+KEY_PREFIX = 'bench_chat_routing:'
+
+
+def isolated_caches():
+    """CACHES du projet, chaque alias sous le préfixe du benchmark"""
+    return {
+        alias: {**config, 'KEY_PREFIX': f"{config.get('KEY_PREFIX', '')}{KEY_PREFIX}"}
+        for alias, config in settings.CACHES.items()
+    }
+
+
+@contextmanager
+def count_layer_ops(layer, counter):
+    """Compte les group_add / group_discard / group_send du layer"""
+    originals = {}
+    for name in ('group_add', 'group_discard', 'group_send'):
+        original = getattr(layer, name)
+        originals[name] = original
+
+        def wrapper(*args, _name=name, _original=original, **kwargs):
+            counter[_name] += 1
+            return _original(*args, **kwargs)
+        setattr(layer, name, wrapper)
+    try:
+        yield
+    finally:
+        for name in originals:
+            delattr(layer, name)
+
+
+class Command(BaseCommand):
+    help = "Benchmark des modes de routage du chat (conversation vs user)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help="Connexions simultanées")
+        parser.add_argument('--conversations-per-user', type=int, default=500)
+        parser.add_argument('--members', type=int, default=10, help="Membres par conversation")
+        parser.add_argument('--messages', type=int, default=500)
+        parser.add_argument('--online', type=float, default=1.0, help="Part des utilisateurs connectés")
+        parser.add_argument('--presence', action='store_true',
+                            help="Ne servir que les membres en ligne (CHAT_PRESENCE_FANOUT)")
+        parser.add_argument('--mode', choices=[MODE_CONVERSATION, MODE_USER], default=None,
+                            help="Un seul mode (défaut: les deux)")
+
+    def handle(self, *args, **options):
+        presence_fanout = options['presence'] or fanout.presence_fanout()
+        with override_settings(CACHES=isolated_caches(), CHAT_PRESENCE_FANOUT=presence_fanout):
+            self.bench(presence_fanout, options)
+
+    def bench(self, presence_fanout, options):
+        users = options['users']
+        members = min(options['members'], users)
+        per_user = options['conversations_per_user']
+
+        # Conversation j: membres (j*M + t) % users — chaque utilisateur
+        # appartient à ~per_user conversations
+        count = max(1, users * per_user // members)
+        conversations = {
+            str(uuid.uuid4()): [(j * members + t) % users for t in range(members)]
+            for j in range(count)
+        }
+        user_conversations = {user_id: [] for user_id in range(users)}
+        for conv_uuid, member_ids in conversations.items():
+            for user_id in member_ids:
+                user_conversations[user_id].append(conv_uuid)
+        for j, (conv_uuid, member_ids) in enumerate(conversations.items()):
+            cache.set(membership.cache_key(conv_uuid), {
+                'id': j, 'members': {user_id: 'member' for user_id in member_ids}
+            }, None)
+
+        layer = get_channel_layer()
+        # Les canaux simulés ne sont pas consommés: les messages au-delà de
+        # la capacité sont abandonnés, sans intérêt pour la mesure
+        logging.getLogger('channels_redis').setLevel(logging.WARNING)
+        online = random.Random(1).sample(range(users), max(1, int(users * options['online'])))
+        self.stdout.write(
+            f"{type(layer).__name__}: {len(online)}/{users} utilisateurs connectés, {count} conversations, "
+            f"{members} membres/conversation, {options['messages']} messages, "
+            f"fan-out {'filtré par la présence' if presence_fanout else 'vers tous les membres'}"
+        )
+
+        modes = [options['mode']] if options['mode'] else [MODE_CONVERSATION, MODE_USER]
+        try:
+            for mode in modes:
+                results = asyncio.run(self.run_mode(
+                    layer, mode, user_conversations, conversations, online, options['messages']
+                ))
+                self.report(mode, results)
+        finally:
+            # Clés du préfixe du benchmark seulement
+            cache.delete_many([membership.cache_key(conv_uuid) for conv_uuid in conversations])
+            membership.entries.clear_local()
+            for user_id in user_conversations:
+                cache.delete_many(presence.device_keys(user_id) + [presence.last_seen_key(user_id), presence.offline_key(user_id)])
+
+    async def run_mode(self, layer, mode, user_conversations, conversations, online, messages):
+        results = {}
+        channels = {}
+        conv_uuids = list(conversations)
+        rng = random.Random(0)
+
+        async def phase(name, steps):
+            counter, latencies = Counter(), []
+            with count_layer_ops(layer, counter), count_redis_round_trips(counter):
+                for step in steps:
+                    start = time.perf_counter()
+                    await step()
+                    latencies.append((time.perf_counter() - start) * 1000)
+            results[name] = (latencies, counter)
+
+        async def connect(user_id):
+            channels[user_id] = await layer.new_channel()
+            for group in connection_groups(user_id, user_conversations[user_id], mode):
+                await layer.group_add(group, channels[user_id])
+            await presence.touch(user_id, channels[user_id])
+
+        async def send():
+            conv_uuid = rng.choice(conv_uuids)
+            event = {'type': 'chat_message', 'message': {
+                'conversation_uuid': conv_uuid, 'seq': 1, 'encrypted_content': b'x' * 256
+            }}
+            await broadcast(layer, conv_uuid, event, mode)
+
+        async def disconnect(user_id):
+            for group in connection_groups(user_id, user_conversations[user_id], mode):
+                await layer.group_discard(group, channels[user_id])
+            await presence.leave(user_id, channels[user_id])
+
+        await phase('connect', [lambda u=u: connect(u) for u in online])
+        await phase('send', [send] * messages)
+        await phase('disconnect', [lambda u=u: disconnect(u) for u in online])
+        if hasattr(layer, 'flush'):
+            await layer.flush()
+        return results
+
+    def report(self, mode, results):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\nMode {mode}"))
+        for name, (latencies, counter) in results.items():
+            steps = len(latencies)
+            layer_ops = counter['group_add'] + counter['group_discard'] + counter['group_send']
+            line = (
+                f"  {name:<10} p50 {statistics.median(latencies):7.2f} ms  "
+                f"p95 {percentile(latencies, 95):7.2f} ms  "
+                f"layer ops/op {layer_ops / steps:8.1f}"
+            )
+            if counter['redis']:
+                line += f"  redis/op {counter['redis'] / steps:8.1f}"
+            self.stdout.write(line)
@@ -0,0 +1,41 @@
+"""
+ensure_message_partitions — Crée les partitions mensuelles de chat_message.
+
+À lancer au moins une fois par mois (cron): crée le mois courant et les
+--ahead mois suivants. Les lignes déjà tombées dans la partition par
+défaut sont déplacées dans leur mois. Sans effet hors PostgreSQL ou si
+la migration 0010 n'a pas partitionné la table.
+
+Usage:
+    python manage.py ensure_message_partitions
+    python manage.py ensure_message_partitions --ahead 6
+"""
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat import partitions
+
+
+class Command(BaseCommand):
+    help = "Crée les partitions mensuelles à venir de chat_message"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=3, help="Mois à créer après le mois courant")
+
+    def handle(self, *args, **options):
+        if not partitions.is_partitioned():
+            self.stdout.write("chat_message n'est pas partitionnée (PostgreSQL requis), rien à faire")
+            return
+
+        existing = partitions.list_partitions()
+        current = partitions.month_start(timezone.now())
+        created = 0
+        for offset in range(options['ahead'] + 1):
+            month = partitions.add_months(current, offset)
+            if month in existing:
+                continue
+            moved = partitions.create_partition(month)
+            created += 1
+            self.stdout.write(f"  {partitions.partition_name(month)} créée ({moved} lignes déplacées)")
+
+        self.stdout.write(self.style.SUCCESS(f"{created} partitions créées"))
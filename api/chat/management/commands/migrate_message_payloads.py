@@ -0,0 +1,78 @@
+"""
+migrate_message_payloads — Convertit les charges base64 des messages en binaire.
+
+Migration paresseuse: le schéma ajoute seulement des colonnes nullables,
+les nouveaux messages sont écrits en binaire et les anciens restent
+lisibles en texte. Cette commande convertit l'historique par lots
+(clé primaire croissante), sans long verrou, et peut être interrompue
+puis relancée.
+
+Usage:
+    python manage.py migrate_message_payloads
+    python manage.py migrate_message_payloads --batch-size 5000 --dry-run
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from chat.models import Message
+
+
+class Command(BaseCommand):
+    help = "Convertit encrypted_content / encrypted_metadata (base64) en colonnes binaires"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Compter sans écrire")
+
+    def handle(self, *args, **options):
+        pending = Message.objects.filter(
+            Q(content_blob__isnull=True) & ~Q(encrypted_content='')
+            | Q(metadata_blob__isnull=True) & ~Q(encrypted_metadata='')
+        )
+        last_pk = 0
+        converted = kept = saved = 0
+
+        while True:
+            batch = list(
+                pending.filter(pk__gt=last_pk).order_by('pk').only(
+                    'pk', 'content_blob', 'metadata_blob', 'encrypted_content', 'encrypted_metadata'
+                )[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            updated = []
+            for message in batch:
+                before = len(message.encrypted_content) + len(message.encrypted_metadata)
+                fields = {}
+                if message.content_blob is None and message.encrypted_content:
+                    fields.update(Message.payload_fields(content=message.encrypted_content))
+                if message.metadata_blob is None and message.encrypted_metadata:
+                    fields.update(Message.payload_fields(metadata=message.encrypted_metadata))
+                for name, value in fields.items():
+                    setattr(message, name, value)
+                after = len(message.encrypted_content) + len(message.encrypted_metadata) + sum(
+                    len(blob) for blob in (message.content_blob, message.metadata_blob) if blob
+                )
+                if after < before:
+                    updated.append(message)
+                    saved += before - after
+                else:
+                    # Valeur non base64: reste en texte
+                    kept += 1
+
+            if updated and not options['dry_run']:
+                with transaction.atomic():
+                    Message.objects.bulk_update(updated, [
+                        'content_blob', 'metadata_blob', 'encrypted_content', 'encrypted_metadata'
+                    ])
+            converted += len(updated)
+            self.stdout.write(f"  … pk {last_pk}: {converted} convertis")
+
+        verb = "à convertir" if options['dry_run'] else "convertis"
+        self.stdout.write(self.style.SUCCESS(
+            f"{converted} messages {verb} ({saved / 1024:.1f} KiB économisés), "
+            f"{kept} laissés en texte"
+        ))
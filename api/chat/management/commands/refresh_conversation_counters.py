@@ -0,0 +1,32 @@
+"""
+refresh_conversation_counters — Recalcule dernier message et non-lus.
+
+Les envois et suppressions ajustent les compteurs par incrément
+(Conversation.count_new_message / count_deleted_message). Ce recalcul
+complet (Conversation.refresh_counters) sert de réparation après une
+écriture hors de ces chemins (SQL manuel, suppression en masse).
+
+Usage:
+    python manage.py refresh_conversation_counters
+    python manage.py refresh_conversation_counters --conversation 42 --batch 200
+"""
+from django.core.management.base import BaseCommand
+
+from chat.models import Conversation
+
+
+class Command(BaseCommand):
+    help = "Recalcule le dernier message et les compteurs de non-lus des conversations"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversation', type=int, action='append', default=[],
+                            help="Conversation à recalculer (répétable, toutes par défaut)")
+        parser.add_argument('--batch', type=int, default=500, help="Conversations par lot")
+
+    def handle(self, *args, **options):
+        conversation_ids = options['conversation'] or list(
+            Conversation.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        for start in range(0, len(conversation_ids), options['batch']):
+            Conversation.refresh_counters(conversation_ids[start:start + options['batch']])
+        self.stdout.write(self.style.SUCCESS(f"{len(conversation_ids)} conversations recalculées"))
@@ -0,0 +1,59 @@
+"""
+Ondes Chat - Annuaire des conversations en cache
+
+uuid → {'id': conversation_id, 'members': {user_id: role}}, dans un
+TieredCache (ondes_backend/tiered_cache.py): cache partagé
+(CHAT_MEMBERS_CACHE_TTL) et LRU par processus contrôlée par génération
+(CHAT_MEMBERSHIP_LOCAL_TTL), invalidés à chaque ajout / retrait /
+changement de rôle (chat/signals.py). Un membre retiré n'est plus accepté
+par aucun processus, sans attendre l'expiration locale.
+
+Les connexions WebSocket gardent en plus leurs propres conversations
+(ChatConsumer.conversation_ids), révoquées par l'événement
+`membership_revoked`.
+"""
+from ondes_backend.tiered_cache import TieredCache
+
+entries = TieredCache('CHAT_MEMBERS_CACHE_TTL', 'CHAT_MEMBERSHIP_LOCAL_TTL')
+
+
+def cache_key(conv_uuid):
+    return f"chat:conversation:{conv_uuid}"
+
+
+def load_entry(conv_uuid):
+    """Entrée lue en base (une requête, deux si la conversation est vide)"""
+    from .models import Conversation, ConversationMember
+
+    rows = list(
+        ConversationMember.objects.filter(
+            conversation__uuid=conv_uuid
+        ).values_list('conversation_id', 'user_id', 'role')
+    )
+    if rows:
+        return {'id': rows[0][0], 'members': {user_id: role for _, user_id, role in rows}}
+    conv_id = Conversation.objects.filter(uuid=conv_uuid).values_list('id', flat=True).first()
+    if conv_id is None:
+        return None
+    return {'id': conv_id, 'members': {}}
+
+
+def get_entry(conv_uuid):
+    """Entrée d'une conversation, None si elle n'existe pas"""
+    conv_uuid = str(conv_uuid)
+    return entries.get(cache_key(conv_uuid), lambda: load_entry(conv_uuid))
+
+
+def role_of(conv_uuid, user_id):
+    """Rôle du membre, None s'il n'appartient pas à la conversation"""
+    entry = get_entry(conv_uuid)
+    return entry['members'].get(user_id) if entry else None
+
+
+def member_ids(conv_uuid):
+    entry = get_entry(conv_uuid)
+    return list(entry['members']) if entry else []
+
+
+def invalidate(conv_uuid):
+    entries.invalidate(cache_key(conv_uuid))
@@ -0,0 +1,43 @@
+"""
+Ondes Chat - Compteurs du temps réel
+
+Compteurs en mémoire, par processus (un worker ASGI = une série),
+exposés au format texte Prometheus par GET /api/chat/metrics/ (admin).
+"""
+import threading
+from collections import Counter
+
+_lock = threading.Lock()
+_counters = Counter()
+
+
+def incr(name, amount=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] += amount
+
+
+def snapshot():
+    """{(nom, ((label, valeur), ...)): total}"""
+    with _lock:
+        return dict(_counters)
+
+
+def _escape(value):
+    """Valeur de label au format texte Prometheus"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus():
+    lines = []
+    seen = set()
+    for (name, labels), value in sorted(snapshot().items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} counter")
+            seen.add(name)
+        if labels:
+            rendered = ','.join(f'{key}="{_escape(val)}"' for key, val in labels)
+            lines.append(f"{name}{{{rendered}}} {value}")
+        else:
+            lines.append(f"{name} {value}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,63 @@
+"""
+Numérote les messages existants (seq) puis compacte les MessageReceipt
+(une ligne par message × destinataire × type) en watermarks par membre.
+"""
+from django.db import migrations
+from django.db.models import Max
+
+
+def number_messages(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    Message = apps.get_model('chat', 'Message')
+
+    for conv_id in Conversation.objects.values_list('pk', flat=True).iterator():
+        batch, seq = [], 0
+        for message in Message.objects.filter(conversation_id=conv_id).order_by('created_at', 'pk').only('pk').iterator():
+            seq += 1
+            message.seq = seq
+            batch.append(message)
+            if len(batch) >= 1000:
+                Message.objects.bulk_update(batch, ['seq'])
+                batch = []
+        Message.objects.bulk_update(batch, ['seq'])
+        Conversation.objects.filter(pk=conv_id).update(last_seq=seq)
+
+
+def compact_receipts(apps, schema_editor):
+    ConversationMember = apps.get_model('chat', 'ConversationMember')
+    MessageReceipt = apps.get_model('chat', 'MessageReceipt')
+
+    watermarks = {}  # (conversation_id, user_id) -> [delivered, read]
+    receipts = MessageReceipt.objects.values(
+        'message__conversation_id', 'user_id', 'receipt_type'
+    ).annotate(seq=Max('message__seq'))
+    for row in receipts.iterator():
+        marks = watermarks.setdefault((row['message__conversation_id'], row['user_id']), [0, 0])
+        marks[0 if row['receipt_type'] == 'delivered' else 1] = row['seq']
+
+    members = ConversationMember.objects.select_related('last_read_message').only(
+        'conversation_id', 'user_id', 'last_read_message__seq'
+    )
+    batch = []
+    for member in members.iterator():
+        delivered, read = watermarks.get((member.conversation_id, member.user_id), (0, 0))
+        if member.last_read_message is not None:
+            read = max(read, member.last_read_message.seq)
+        if not (delivered or read):
+            continue
+        member.last_read_seq = read
+        member.last_delivered_seq = max(delivered, read)
+        batch.append(member)
+    ConversationMember.objects.bulk_update(batch, ['last_delivered_seq', 'last_read_seq'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_message_seq_watermarks'),
+    ]
+
+    operations = [
+        migrations.RunPython(number_messages, migrations.RunPython.noop),
+        migrations.RunPython(compact_receipts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_compact_receipts'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('conversation', 'seq'), name='chat_message_conversation_seq'),
+        ),
+        migrations.DeleteModel(
+            name='MessageReceipt',
+        ),
+    ]
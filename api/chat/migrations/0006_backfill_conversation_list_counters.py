@@ -0,0 +1,42 @@
+"""
+Initialise Conversation.last_message et ConversationMember.unread_count
+pour les conversations existantes.
+"""
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationMember = apps.get_model('chat', 'ConversationMember')
+    Message = apps.get_model('chat', 'Message')
+
+    latest = Message.objects.filter(
+        conversation_id=OuterRef('pk'),
+        is_deleted=False
+    ).order_by('-seq')
+    Conversation.objects.update(
+        last_message=Subquery(latest.values('pk')[:1]),
+        last_message_at=Subquery(latest.values('created_at')[:1]),
+    )
+
+    remaining = Message.objects.filter(
+        conversation_id=OuterRef('conversation_id'),
+        seq__gt=OuterRef('last_read_seq'),
+        is_deleted=False
+    ).exclude(
+        sender_id=OuterRef('user_id')
+    ).order_by().values('conversation_id').annotate(n=Count('pk')).values('n')
+    ConversationMember.objects.update(unread_count=Coalesce(Subquery(remaining), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_conversation_list_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_message_change_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='content_blob',
+            field=models.BinaryField(blank=True, null=True, verbose_name='Contenu chiffré (E2EE)'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='metadata_blob',
+            field=models.BinaryField(blank=True, null=True, verbose_name='Métadonnées chiffrées'),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='encrypted_content',
+            field=models.TextField(blank=True, verbose_name='Contenu chiffré (texte, ancien format)'),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='encrypted_metadata',
+            field=models.TextField(blank=True, verbose_name='Métadonnées chiffrées (texte, ancien format)'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_message_binary_payload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.AlterField(
+            model_name='conversationmember',
+            name='last_read_message',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='read_by_members', to='chat.message'),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='reply_to',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='replies', to='chat.message', verbose_name='En réponse à'),
+        ),
+        migrations.CreateModel(
+            name='MessageArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('path', models.CharField(max_length=255)),
+                ('offset', models.PositiveBigIntegerField()),
+                ('length', models.PositiveIntegerField()),
+                ('seq_min', models.PositiveBigIntegerField()),
+                ('seq_max', models.PositiveBigIntegerField()),
+                ('count', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archives', to='chat.conversation')),
+            ],
+            options={
+                'verbose_name': 'Archive de messages',
+                'verbose_name_plural': 'Archives de messages',
+                'indexes': [models.Index(fields=['conversation', 'seq_max'], name='chat_messag_convers_294c82_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,100 @@
+"""
+PostgreSQL: chat_message devient une table partitionnée par mois sur
+created_at (voir chat/partitions.py). Sans effet sur les autres moteurs.
+
+La table est recopiée: à lancer pendant une fenêtre de maintenance sur
+une base volumineuse. Les clés étrangères vers chat_message sont déjà
+sans contrainte (0009). Les contraintes d'unicité incluent ici la clé
+de partition; leur version globale est portée par chat_message_key
+(0016). Irréversible sous PostgreSQL.
+"""
+import datetime
+
+from django.db import migrations
+from django.db.migrations.exceptions import IrreversibleError
+
+TABLE = 'chat_message'
+MONTHS_AHEAD = 3
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    execute = schema_editor.execute
+
+    execute(f'ALTER TABLE "{TABLE}" RENAME TO "{TABLE}_unpartitioned"')
+    execute(f'CREATE SEQUENCE "{TABLE}_id_partitioned_seq"')
+    execute(
+        f'CREATE TABLE "{TABLE}" (LIKE "{TABLE}_unpartitioned" INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+        f'PARTITION BY RANGE (created_at)'
+    )
+    # Colonne identité impossible sur une table partitionnée (PostgreSQL < 17)
+    execute(f'ALTER TABLE "{TABLE}" ALTER COLUMN id SET DEFAULT nextval(\'"{TABLE}_id_partitioned_seq"\')')
+    execute(f'ALTER SEQUENCE "{TABLE}_id_partitioned_seq" OWNED BY "{TABLE}".id')
+
+    # Un mois par partition, du plus ancien message à MONTHS_AHEAD mois
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT min(created_at) FROM "{TABLE}_unpartitioned"')
+        oldest = cursor.fetchone()[0]
+    today = datetime.date.today()
+    month = datetime.date((oldest or today).year, (oldest or today).month, 1)
+    last = _add_months(datetime.date(today.year, today.month, 1), MONTHS_AHEAD)
+    while month <= last:
+        following = _add_months(month, 1)
+        execute(
+            f'CREATE TABLE "{TABLE}_p{month:%Y_%m}" PARTITION OF "{TABLE}" '
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{following.isoformat()} 00:00:00+00')"
+        )
+        month = following
+    execute(f'CREATE TABLE "{TABLE}_default" PARTITION OF "{TABLE}" DEFAULT')
+
+    execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{TABLE}_unpartitioned"')
+    execute(
+        f'SELECT setval(\'"{TABLE}_id_partitioned_seq"\', COALESCE((SELECT max(id) FROM "{TABLE}"), 0) + 1, false)'
+    )
+    execute(f'DROP TABLE "{TABLE}_unpartitioned"')
+    execute(f'ALTER SEQUENCE "{TABLE}_id_partitioned_seq" RENAME TO "{TABLE}_id_seq"')
+
+    # Contraintes et index (noms Django conservés), clé de partition incluse
+    execute(f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_pkey" PRIMARY KEY (id, created_at)')
+    execute(f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_uuid_key" UNIQUE (uuid, created_at)')
+    execute(
+        f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "chat_message_conversation_seq" '
+        f'UNIQUE (conversation_id, seq, created_at)'
+    )
+    execute(
+        f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_conversation_id_fk" FOREIGN KEY (conversation_id) '
+        f'REFERENCES chat_conversation (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+    execute(
+        f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_sender_id_fk" FOREIGN KEY (sender_id) '
+        f'REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+    execute(f'CREATE INDEX "chat_messag_convers_3154fc_idx" ON "{TABLE}" (conversation_id, created_at)')
+    execute(f'CREATE INDEX "chat_messag_sender__b02346_idx" ON "{TABLE}" (sender_id, created_at)')
+    execute(f'CREATE INDEX "chat_messag_convers_3f5d80_idx" ON "{TABLE}" (conversation_id, change_seq)')
+    execute(f'CREATE INDEX "{TABLE}_reply_to_id_idx" ON "{TABLE}" (reply_to_id)')
+
+
+def unpartition(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    raise IrreversibleError(
+        f'{TABLE} is partitioned (archived months may already be dropped); restore a backup to go back'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_message_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
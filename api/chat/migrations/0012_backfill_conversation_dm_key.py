@@ -0,0 +1,100 @@
+"""
+Renseigne Conversation.dm_key pour les conversations privées existantes
+et fusionne les doublons (créations concurrentes d'une même paire).
+
+La conversation la plus ancienne de chaque paire est conservée. Les
+messages des doublons y sont déplacés, renumérotés après son last_seq
+par ordre de création (les clients les voient comme nouveaux), puis les
+doublons sont supprimés. Les messages privés sont chiffrés avec le
+secret X25519 de la paire: ils restent lisibles après déplacement.
+
+Un doublon dont l'historique a déjà été archivé (MessageArchive) n'est
+pas fusionné: il reste accessible, sans dm_key.
+"""
+from collections import defaultdict
+
+from django.db import migrations, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def dm_key(user_id, other_id):
+    low, high = sorted((user_id, other_id))
+    return f"{low}:{high}"
+
+
+def merge(apps, keeper_id, duplicate_ids):
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationMember = apps.get_model('chat', 'ConversationMember')
+    Message = apps.get_model('chat', 'Message')
+
+    last_seq = Conversation.objects.get(pk=keeper_id).last_seq
+    moved = list(
+        Message.objects.filter(conversation_id__in=duplicate_ids)
+        .order_by('created_at', 'pk').only('pk', 'seq', 'change_seq')
+    )
+    for message in moved:
+        last_seq += 1
+        message.conversation_id = keeper_id
+        message.seq = last_seq
+        message.change_seq = 0
+    Message.objects.bulk_update(moved, ['conversation_id', 'seq', 'change_seq'], batch_size=1000)
+    Conversation.objects.filter(pk__in=duplicate_ids).delete()
+
+    latest = Message.objects.filter(
+        conversation_id=OuterRef('pk'),
+        is_deleted=False
+    ).order_by('-seq')
+    Conversation.objects.filter(pk=keeper_id).update(
+        last_seq=last_seq,
+        last_message=Subquery(latest.values('pk')[:1]),
+        last_message_at=Subquery(latest.values('created_at')[:1]),
+    )
+    remaining = Message.objects.filter(
+        conversation_id=OuterRef('conversation_id'),
+        seq__gt=OuterRef('last_read_seq'),
+        is_deleted=False
+    ).exclude(
+        sender_id=OuterRef('user_id')
+    ).order_by().values('conversation_id').annotate(n=Count('pk')).values('n')
+    ConversationMember.objects.filter(conversation_id=keeper_id).update(
+        unread_count=Coalesce(Subquery(remaining), 0)
+    )
+
+
+def backfill(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationMember = apps.get_model('chat', 'ConversationMember')
+    MessageArchive = apps.get_model('chat', 'MessageArchive')
+
+    members = defaultdict(list)
+    rows = ConversationMember.objects.filter(
+        conversation__conversation_type='private'
+    ).values_list('conversation_id', 'user_id')
+    for conversation_id, user_id in rows.iterator():
+        members[conversation_id].append(user_id)
+
+    pairs = defaultdict(list)
+    for conversation_id, user_ids in members.items():
+        if len(user_ids) == 2 and user_ids[0] != user_ids[1]:
+            pairs[dm_key(*user_ids)].append(conversation_id)
+
+    archived = set(MessageArchive.objects.values_list('conversation_id', flat=True).distinct())
+    for key, conversation_ids in pairs.items():
+        keeper_id, *duplicate_ids = sorted(conversation_ids)
+        duplicate_ids = [pk for pk in duplicate_ids if pk not in archived]
+        with transaction.atomic():
+            if duplicate_ids:
+                merge(apps, keeper_id, duplicate_ids)
+            Conversation.objects.filter(pk=keeper_id).update(dm_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_conversation_dm_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
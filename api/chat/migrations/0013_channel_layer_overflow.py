@@ -0,0 +1,35 @@
+"""
+PostgreSQL: table non journalisée des messages trop gros pour NOTIFY
+(PostgresChannelLayer, chat/layers.py). Sans effet sur les autres moteurs.
+"""
+from django.db import migrations
+
+TABLE = 'chat_layer_overflow'
+
+
+def create(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE UNLOGGED TABLE IF NOT EXISTS "{TABLE}" ('
+        f'id bigserial PRIMARY KEY, '
+        f'payload bytea NOT NULL, '
+        f'created_at timestamptz NOT NULL DEFAULT now())'
+    )
+
+
+def drop(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP TABLE IF EXISTS "{TABLE}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0012_backfill_conversation_dm_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(create, drop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0013_channel_layer_overflow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='counted_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,77 @@
+"""
+PostgreSQL: unicité globale de chat_message.uuid et (conversation, seq).
+
+Depuis 0010, les contraintes d'une table partitionnée incluent la clé de
+partition: (uuid, created_at) et (conversation_id, seq, created_at) ne
+garantissent rien d'une partition à l'autre. La table non partitionnée
+chat_message_key porte les deux contraintes; des triggers la tiennent à
+jour à chaque insertion, modification de ces colonnes, suppression ou
+TRUNCATE de chat_message (une violation lève IntegrityError comme
+avant). Sans effet sur les autres moteurs, où chat_message garde ses
+propres contraintes.
+"""
+from django.db import migrations
+
+TABLE = 'chat_message'
+KEY_TABLE = 'chat_message_key'
+
+
+def create(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    execute = schema_editor.execute
+    execute(
+        f'CREATE TABLE "{KEY_TABLE}" ('
+        f'uuid uuid PRIMARY KEY, '
+        f'conversation_id bigint NOT NULL, '
+        f'seq bigint NOT NULL, '
+        f'CONSTRAINT "{KEY_TABLE}_conversation_seq" UNIQUE (conversation_id, seq))'
+    )
+    execute(f'INSERT INTO "{KEY_TABLE}" SELECT uuid, conversation_id, seq FROM "{TABLE}"')
+    execute(f'''
+        CREATE FUNCTION "{KEY_TABLE}_sync"() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                TRUNCATE "{KEY_TABLE}";
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM "{KEY_TABLE}" WHERE uuid = OLD.uuid;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO "{KEY_TABLE}" (uuid, conversation_id, seq)
+                VALUES (NEW.uuid, NEW.conversation_id, NEW.seq);
+            END IF;
+            RETURN NULL;
+        END $$
+    ''')
+    sync = f'EXECUTE FUNCTION "{KEY_TABLE}_sync"()'
+    execute(f'CREATE TRIGGER "{KEY_TABLE}_row" AFTER INSERT OR DELETE ON "{TABLE}" FOR EACH ROW {sync}')
+    # save() réécrit toutes les colonnes: la clé n'est reprise que si elle change
+    execute(
+        f'CREATE TRIGGER "{KEY_TABLE}_update" AFTER UPDATE OF uuid, conversation_id, seq ON "{TABLE}" FOR EACH ROW '
+        f'WHEN ((OLD.uuid, OLD.conversation_id, OLD.seq) IS DISTINCT FROM (NEW.uuid, NEW.conversation_id, NEW.seq)) '
+        f'{sync}'
+    )
+    execute(f'CREATE TRIGGER "{KEY_TABLE}_truncate" AFTER TRUNCATE ON "{TABLE}" FOR EACH STATEMENT {sync}')
+
+
+def drop(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    execute = schema_editor.execute
+    for trigger in ('row', 'update', 'truncate'):
+        execute(f'DROP TRIGGER IF EXISTS "{KEY_TABLE}_{trigger}" ON "{TABLE}"')
+    execute(f'DROP FUNCTION IF EXISTS "{KEY_TABLE}_sync"()')
+    execute(f'DROP TABLE IF EXISTS "{KEY_TABLE}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0015_backfill_conversation_counted_seq'),
+    ]
+
+    operations = [
+        migrations.RunPython(create, drop),
+    ]
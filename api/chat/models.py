@@ -10,10 +10,29 @@ Architecture E2EE:
 """
 
 import uuid
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, When
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from . import bumps, codec
+
+
+def _can_update_returning():
+    """UPDATE ... RETURNING disponible (PostgreSQL, SQLite ≥ 3.35)"""
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)
+
+
+def _latest_messages():
+    """Messages non supprimés de la conversation (OuterRef), du plus récent au plus ancien"""
+    return Message.objects.filter(
+        conversation_id=OuterRef('pk'),
+        is_deleted=False
+    ).order_by('-seq')
+
 
 class UserKeyPair(models.Model):
     """
@@ -89,6 +108,23 @@ class Conversation(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Dernier numéro de séquence attribué (Message.seq / Message.change_seq)
+    last_seq = models.PositiveBigIntegerField(default=0)
+    # Dernier seq reporté dans last_message / unread_count (count_messages)
+    counted_seq = models.PositiveBigIntegerField(default=0)
+    # Dernier message non supprimé (dénormalisé pour la liste des conversations)
+    # Sans contrainte en base: chat_message est partitionné sous PostgreSQL
+    last_message = models.ForeignKey(
+        'Message',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        db_constraint=False
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    # Conversations privées: «min_id:max_id» des deux membres (une seule par paire)
+    dm_key = models.CharField(max_length=41, null=True, blank=True, unique=True, editable=False)
     
     # Clé de groupe chiffrée (pour les groupes uniquement)
     # Chaque membre a sa propre version de la clé, chiffrée avec sa clé publique
@@ -98,6 +134,182 @@ class Conversation(models.Model):
         verbose_name_plural = "Conversations"
         ordering = ['-updated_at']
     
+    @staticmethod
+    def make_dm_key(user_id, other_id):
+        low, high = sorted((user_id, other_id))
+        return f"{low}:{high}"
+    
+    @classmethod
+    def get_or_create_private(cls, user, other, encrypted_keys=None):
+        """
+        Conversation privée entre deux utilisateurs: une lecture sur l'index
+        unique dm_key; deux créations concurrentes sont départagées par la
+        contrainte d'unicité.
+        
+        Returns:
+            (conversation, created)
+        """
+        dm_key = cls.make_dm_key(user.id, other.id)
+        existing = cls.objects.filter(dm_key=dm_key).first()
+        if existing:
+            return existing, False
+        
+        encrypted_keys = encrypted_keys or {}
+        try:
+            with transaction.atomic():
+                conversation = cls.objects.create(
+                    conversation_type='private',
+                    dm_key=dm_key,
+                    created_by=user
+                )
+                ConversationMember.add_members(conversation, [
+                    (member, 'member', encrypted_keys.get(str(member.id), ''))
+                    for member in (user, other)
+                ])
+        except IntegrityError:
+            return cls.objects.get(dm_key=dm_key), False
+        return conversation, True
+    
+    @classmethod
+    def allocate_seq(cls, conversation_id, bumped_at=None):
+        """
+        Réserve le prochain numéro de séquence de la conversation, en un
+        seul UPDATE ... RETURNING quand la base le permet.
+        À appeler dans une transaction: le verrou est tenu jusqu'au commit.
+        
+        Args:
+            bumped_at: nouveau message — avance aussi updated_at et
+                last_message_at dans le même UPDATE
+        """
+        bumped = {'updated_at': bumped_at, 'last_message_at': bumped_at} if bumped_at else {}
+        
+        if not _can_update_returning():
+            conv = cls.objects.select_for_update().only('last_seq').get(pk=conversation_id)
+            seq = conv.last_seq + 1
+            cls.objects.filter(pk=conversation_id).update(last_seq=seq, **bumped)
+            return seq
+        
+        qn = connection.ops.quote_name
+        column = lambda name: qn(cls._meta.get_field(name).column)
+        assignments = [f"{column('last_seq')} = {column('last_seq')} + 1"]
+        assignments += [f"{column(name)} = %s" for name in bumped]
+        params = [connection.ops.adapt_datetimefield_value(value) for value in bumped.values()]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {qn(cls._meta.db_table)} SET {', '.join(assignments)} "
+                f"WHERE {column('id')} = %s RETURNING {column('last_seq')}",
+                params + [conversation_id]
+            )
+            row = cursor.fetchone()
+        if row is None:
+            raise cls.DoesNotExist(f"Conversation {conversation_id} does not exist")
+        return row[0]
+    
+    @classmethod
+    def count_new_message(cls, message):
+        """
+        Compteurs après un envoi, sans recompter: le message devient le
+        dernier et chaque autre membre gagne un non-lu (deux UPDATE).
+        Si des seq précédents n'ont pas encore été comptés (envois
+        regroupés, éditions), passe par count_messages.
+        """
+        counted = cls.objects.filter(pk=message.conversation_id, counted_seq=message.seq - 1).update(
+            counted_seq=message.seq,
+            last_message=message.pk,
+            last_message_at=message.created_at,
+        )
+        if not counted:
+            cls.count_messages([message.conversation_id])
+            return
+        ConversationMember.objects.filter(
+            conversation_id=message.conversation_id
+        ).exclude(
+            user_id=message.sender_id
+        ).update(unread_count=F('unread_count') + 1)
+    
+    @classmethod
+    def count_messages(cls, conversation_ids):
+        """
+        Reporte dans les compteurs les messages pas encore comptés
+        (counted_seq < seq <= last_seq): chaque membre ne compte que ces
+        messages, jamais tout son historique non lu. Un UPDATE des membres
+        et un de la conversation, sous le verrou de la conversation.
+        """
+        for conversation_id in conversation_ids:
+            with transaction.atomic():
+                row = cls.objects.select_for_update().filter(
+                    pk=conversation_id
+                ).values_list('counted_seq', 'last_seq').first()
+                if row is None or row[1] <= row[0]:
+                    continue
+                counted_seq, last_seq = row
+                new = Message.objects.filter(
+                    conversation_id=conversation_id,
+                    seq__gt=counted_seq,
+                    seq__lte=last_seq,
+                    is_deleted=False
+                ).filter(
+                    seq__gt=OuterRef('last_read_seq')
+                ).exclude(
+                    sender_id=OuterRef('user_id')
+                ).order_by().values('conversation_id').annotate(n=Count('pk')).values('n')
+                ConversationMember.objects.filter(conversation_id=conversation_id).update(
+                    unread_count=F('unread_count') + Coalesce(Subquery(new), 0)
+                )
+                latest = _latest_messages()
+                cls.objects.filter(pk=conversation_id).update(
+                    counted_seq=last_seq,
+                    last_message=Subquery(latest.values('id')[:1]),
+                    last_message_at=Subquery(latest.values('created_at')[:1]),
+                )
+    
+    @classmethod
+    def count_deleted_message(cls, message):
+        """
+        Compteurs après une suppression (message déjà compté): un non-lu
+        de moins pour les membres qui ne l'avaient pas lu, dernier
+        message recalculé seulement si c'était lui.
+        """
+        latest = _latest_messages()
+        cls.objects.filter(pk=message.conversation_id, last_message_id=message.pk).update(
+            last_message=Subquery(latest.values('id')[:1]),
+            last_message_at=Subquery(latest.values('created_at')[:1]),
+        )
+        ConversationMember.objects.filter(
+            conversation_id=message.conversation_id,
+            last_read_seq__lt=message.seq,
+            unread_count__gt=0,
+        ).exclude(
+            user_id=message.sender_id
+        ).update(unread_count=F('unread_count') - 1)
+    
+    @classmethod
+    def refresh_counters(cls, conversation_ids):
+        """
+        Recalcule entièrement le dernier message et les compteurs de
+        non-lus des conversations (deux UPDATE au total, idempotent).
+        Coûteux (un COUNT de tout le non-lu par membre): réservé au
+        rattrapage (refresh_conversation_counters), jamais à l'envoi.
+        """
+        latest = _latest_messages()
+        with transaction.atomic():
+            # D'abord la conversation: son verrou bloque les envois jusqu'au commit
+            cls.objects.filter(pk__in=conversation_ids).update(
+                counted_seq=F('last_seq'),
+                last_message=Subquery(latest.values('id')[:1]),
+                last_message_at=Subquery(latest.values('created_at')[:1]),
+            )
+            unread = Message.objects.filter(
+                conversation_id=OuterRef('conversation_id'),
+                seq__gt=OuterRef('last_read_seq'),
+                is_deleted=False
+            ).exclude(
+                sender_id=OuterRef('user_id')
+            ).order_by().values('conversation_id').annotate(n=Count('pk')).values('n')
+            ConversationMember.objects.filter(conversation_id__in=conversation_ids).update(
+                unread_count=Coalesce(Subquery(unread), 0)
+            )
+    
     def __str__(self):
         if self.conversation_type == 'private':
             members = self.members.all()[:2]
@@ -150,8 +362,15 @@ class ConversationMember(models.Model):
         on_delete=models.SET_NULL,
         null=True,
         blank=True,
-        related_name='read_by_members'
+        related_name='read_by_members',
+        db_constraint=False
     )
+    # Accusés de réception: tous les messages de seq <= watermark
+    # sont délivrés / lus par ce membre
+    last_delivered_seq = models.PositiveBigIntegerField(default=0)
+    last_read_seq = models.PositiveBigIntegerField(default=0)
+    # Messages non lus des autres membres (maintenu à l'envoi et à la lecture)
+    unread_count = models.PositiveIntegerField(default=0)
     joined_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -162,11 +381,68 @@ class ConversationMember(models.Model):
     def __str__(self):
         return f"{self.user.username} dans {self.conversation}"
 
+    @classmethod
+    def add_members(cls, conversation, members):
+        """
+        Membres d'une conversation nouvellement créée, en un seul INSERT.
+        bulk_create n'émet pas post_save: aucun cache d'annuaire n'existe
+        encore pour cette conversation.
+
+        Args:
+            members: [(user, role, clé de conversation chiffrée)]
+        """
+        return cls.objects.bulk_create([
+            cls(conversation=conversation, user=user, role=role, encrypted_conversation_key=key)
+            for user, role, key in members
+        ])
+
+    @classmethod
+    def advance_watermarks(cls, conversation_id, user_id, delivered_seq=0, read_seq=0):
+        """
+        Avance les watermarks d'un membre (jamais de recul), en un seul
+        UPDATE conditionnel. Un message lu est aussi délivré. Si la lecture
+        avance, unread_count est recalculé dans le même UPDATE.
+        
+        Returns:
+            int: nombre de lignes modifiées (0 si rien n'a avancé)
+        """
+        delivered_seq = max(delivered_seq, read_seq)
+        # Seulement les messages déjà comptés: les suivants le seront par count_messages
+        counted_seq = Conversation.objects.filter(
+            pk=OuterRef(OuterRef('conversation_id'))
+        ).values('counted_seq')
+        remaining = Message.objects.filter(
+            conversation_id=OuterRef('conversation_id'),
+            seq__gt=read_seq,
+            seq__lte=Subquery(counted_seq),
+            is_deleted=False
+        ).exclude(
+            sender_id=OuterRef('user_id')
+        ).order_by().values('conversation_id').annotate(n=Count('pk')).values('n')
+        return cls.objects.filter(
+            conversation_id=conversation_id,
+            user_id=user_id,
+        ).filter(
+            models.Q(last_delivered_seq__lt=delivered_seq) | models.Q(last_read_seq__lt=read_seq)
+        ).update(
+            unread_count=Case(
+                When(last_read_seq__lt=read_seq, then=Coalesce(Subquery(remaining), 0)),
+                default=F('unread_count'),
+                output_field=models.PositiveIntegerField(),
+            ),
+            last_delivered_seq=Greatest(F('last_delivered_seq'), delivered_seq),
+            last_read_seq=Greatest(F('last_read_seq'), read_seq),
+        )
+
 
 class Message(models.Model):
     """
     Message chiffré de bout en bout.
     Le contenu est TOUJOURS chiffré côté client avant envoi.
+    
+    Sous PostgreSQL, chat_message est partitionné par mois sur created_at
+    (migration 0010, ensure_message_partitions); les mois anciens sont
+    exportés vers des archives par archive_messages (chat/archive.py).
     """
     MESSAGE_TYPES = [
         ('text', 'Texte'),
@@ -184,6 +460,11 @@ class Message(models.Model):
         related_name='messages',
         verbose_name="Conversation"
     )
+    # Numéro de séquence dans la conversation (croissant, unique)
+    seq = models.PositiveBigIntegerField(default=0)
+    # Séquence de la dernière modification/suppression (même compteur que
+    # seq): la synchronisation delta retrouve ainsi les changements
+    change_seq = models.PositiveBigIntegerField(default=0)
     sender = models.ForeignKey(
         User,
         on_delete=models.SET_NULL,
@@ -200,16 +481,29 @@ class Message(models.Model):
     )
     
     # ====== CONTENU CHIFFRÉ ======
-    # Le contenu du message chiffré avec AES-256-GCM
-    # Format: base64(nonce || ciphertext || tag)
-    encrypted_content = models.TextField(
+    # Le contenu du message chiffré avec AES-256-GCM, en octets bruts
+    # (nonce || ciphertext || tag), sans le surcoût du base64
+    content_blob = models.BinaryField(
+        null=True,
+        blank=True,
         verbose_name="Contenu chiffré (E2EE)"
     )
     # Métadonnées chiffrées (nom de fichier, taille, etc.)
-    encrypted_metadata = models.TextField(
+    metadata_blob = models.BinaryField(
+        null=True,
         blank=True,
         verbose_name="Métadonnées chiffrées"
     )
+    # Anciennes colonnes base64: lignes pas encore migrées
+    # (migrate_message_payloads) et valeurs non base64
+    encrypted_content = models.TextField(
+        blank=True,
+        verbose_name="Contenu chiffré (texte, ancien format)"
+    )
+    encrypted_metadata = models.TextField(
+        blank=True,
+        verbose_name="Métadonnées chiffrées (texte, ancien format)"
+    )
     
     # ====== FICHIERS CHIFFRÉS ======
     # Pour les médias: fichier chiffré
@@ -221,13 +515,15 @@ class Message(models.Model):
     )
     
     # ====== RÉPONSE À UN MESSAGE ======
+    # Peut viser un message archivé (chat/archive.py): sans contrainte en base
     reply_to = models.ForeignKey(
         'self',
         on_delete=models.SET_NULL,
         null=True,
         blank=True,
         related_name='replies',
-        verbose_name="En réponse à"
+        verbose_name="En réponse à",
+        db_constraint=False
     )
     
     # ====== TIMESTAMPS ======
@@ -242,58 +538,150 @@ class Message(models.Model):
         indexes = [
             models.Index(fields=['conversation', 'created_at']),
             models.Index(fields=['sender', 'created_at']),
+            models.Index(fields=['conversation', 'change_seq']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'seq'], name='chat_message_conversation_seq'),
         ]
     
     def __str__(self):
         return f"{self.sender.username if self.sender else 'System'}: [Chiffré] ({self.uuid})"
     
+    @classmethod
+    def create_next(cls, conversation, deferred=False, **fields):
+        """
+        Crée un message avec le prochain numéro de séquence de la
+        conversation (instance ou id). Le verrou sur la conversation
+        sérialise les insertions concurrentes.
+        
+        Dernier message et compteurs de non-lus sont mis à jour aussitôt
+        par incrément (count_new_message), ou avec `deferred` comptés par
+        lots par chat/bumps.py: l'envoi se réduit alors à l'UPDATE du seq
+        et à l'INSERT.
+        """
+        conversation_id = getattr(conversation, 'pk', conversation)
+        now = timezone.now()
+        with transaction.atomic():
+            seq = Conversation.allocate_seq(conversation_id, bumped_at=now)
+            message = cls.objects.create(conversation_id=conversation_id, seq=seq, **fields)
+            if not deferred:
+                Conversation.count_new_message(message)
+        if deferred:
+            bumps.mark(conversation_id)
+        
+        if isinstance(conversation, Conversation):
+            conversation.last_seq = seq
+            conversation.updated_at = now
+            if not deferred:
+                conversation.last_message = message
+                conversation.last_message_at = message.created_at
+        return message
+    
+    def receipt_status(self, members):
+        """
+        Accusés dérivés des watermarks des membres.
+        
+        Args:
+            members: ConversationMember de la conversation (déjà chargés)
+        """
+        others = [m for m in members if m.user_id != self.sender_id]
+        return {
+            'delivered': [m.user_id for m in others if m.last_delivered_seq >= self.seq],
+            'read': [m.user_id for m in others if m.last_read_seq >= self.seq],
+        }
+    
+    @staticmethod
+    def payload_fields(content=None, metadata=None):
+        """
+        Champs de stockage d'une charge chiffrée (octets ou base64).
+        Usage: Message.create_next(conv, **Message.payload_fields(content, metadata))
+        """
+        fields = {}
+        if content is not None:
+            fields['content_blob'], fields['encrypted_content'] = codec.split_payload(content)
+        if metadata is not None:
+            fields['metadata_blob'], fields['encrypted_metadata'] = codec.split_payload(metadata)
+        return fields
+    
+    @property
+    def content(self):
+        """Contenu chiffré: octets, ou texte pour une ligne non migrée"""
+        return codec.stored_payload(self.content_blob, self.encrypted_content)
+    
+    @property
+    def metadata(self):
+        return codec.stored_payload(self.metadata_blob, self.encrypted_metadata)
+    
+    def edit(self, content):
+        """Remplacer le contenu chiffré (nouveau change_seq)"""
+        fields = self.payload_fields(content)
+        with transaction.atomic():
+            self.change_seq = Conversation.allocate_seq(self.conversation_id)
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.edited_at = timezone.now()
+            self.save(update_fields=[*fields, 'edited_at', 'change_seq'])
+    
     def mark_as_edited(self):
         self.edited_at = timezone.now()
         self.save(update_fields=['edited_at'])
     
     def soft_delete(self):
         """Suppression douce - le message reste mais son contenu est effacé"""
+        was_deleted = self.is_deleted
         self.is_deleted = True
+        self.content_blob = None
+        self.metadata_blob = None
         self.encrypted_content = ""
         self.encrypted_metadata = ""
         if self.encrypted_file:
             self.encrypted_file.delete()
             self.encrypted_file = None
-        self.save()
+        with transaction.atomic():
+            self.change_seq = Conversation.allocate_seq(self.conversation_id)
+            if not was_deleted:
+                # Message encore en attente de comptage: le compter avant de le retirer
+                Conversation.count_messages([self.conversation_id])
+            self.save()
+            # Aperçu de la liste et non-lus des membres
+            if not was_deleted:
+                Conversation.count_deleted_message(self)
 
 
-class MessageReceipt(models.Model):
+class MessageArchive(models.Model):
     """
-    Accusé de réception pour les messages.
+    Index des archives de messages: messages d'une conversation pour un
+    mois exporté, bloc gzip à `offset` dans le fichier d'archive du mois.
     """
-    RECEIPT_TYPES = [
-        ('delivered', 'Délivré'),
-        ('read', 'Lu'),
-    ]
-    
-    message = models.ForeignKey(
-        Message,
-        on_delete=models.CASCADE,
-        related_name='receipts'
-    )
-    user = models.ForeignKey(
-        User,
+    conversation = models.ForeignKey(
+        Conversation,
         on_delete=models.CASCADE,
-        related_name='message_receipts'
+        related_name='archives'
     )
-    receipt_type = models.CharField(max_length=20, choices=RECEIPT_TYPES)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    month = models.DateField()
+    path = models.CharField(max_length=255)
+    offset = models.PositiveBigIntegerField()
+    length = models.PositiveIntegerField()
+    seq_min = models.PositiveBigIntegerField()
+    seq_max = models.PositiveBigIntegerField()
+    count = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        unique_together = ('message', 'user', 'receipt_type')
-        verbose_name = "Accusé de réception"
-        verbose_name_plural = "Accusés de réception"
+        verbose_name = "Archive de messages"
+        verbose_name_plural = "Archives de messages"
+        indexes = [
+            models.Index(fields=['conversation', 'seq_max']),
+        ]
+    
+    def __str__(self):
+        return f"{self.conversation_id} {self.month:%Y-%m} ({self.count})"
 
 
 class TypingIndicator(models.Model):
     """
-    Indicateur de frappe en temps réel.
-    Stockage temporaire, nettoyé régulièrement.
+    Indicateur de frappe persistant (optionnel, CHAT_TYPING_PERSIST).
+    L'état temps réel vit dans le cache avec expiration (chat/typing_state.py).
     """
     conversation = models.ForeignKey(
         Conversation,
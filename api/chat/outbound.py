@@ -0,0 +1,253 @@
+"""
+Ondes Chat - File d'envoi par connexion
+
+Les événements diffusés (nouveaux messages, frappe, accusés...) ne sont
+plus envoyés un par un: ils passent par une file bornée, vidée par une
+tâche d'écriture. Les événements arrivés dans une courte fenêtre partent
+en une seule trame tableau si le client l'a demandé (?batch=1).
+
+Sous Daphne, `send` rend la main dès que la trame est confiée au
+transport Twisted: attendre `send` ne mesure pas la lenteur du client.
+La tâche d'écriture s'enregistre donc comme producteur du transport
+(TransportBackpressure): quand son tampon d'écriture dépasse sa limite,
+Twisted suspend l'écriture et les événements restent dans la file.
+Ailleurs (serveur ASGI dont le `send` attend lui-même le drain), la
+file se règle sur l'attente de `send`.
+
+Client lent (file pleine):
+1. les indicateurs de frappe, sans valeur une fois périmés, sont écartés;
+2. s'il n'y a plus rien d'écartable, la connexion est fermée (4008) après
+   un indice de reprise: le client se reconnecte puis appelle `sync`.
+"""
+import asyncio
+import logging
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSE_SLOW_CONSUMER = 4008
+
+
+def batch_window():
+    return getattr(settings, 'CHAT_OUTBOUND_BATCH_WINDOW', 0.005)
+
+
+def max_queue():
+    return getattr(settings, 'CHAT_OUTBOUND_MAX_QUEUE', 500)
+
+
+def max_batch():
+    return getattr(settings, 'CHAT_OUTBOUND_MAX_BATCH', 100)
+
+
+class QueueOverflow(Exception):
+    """File pleine sans événement écartable"""
+
+
+class ServerSendMiddleware:
+    """
+    Middleware ASGI le plus externe: garde dans le scope (`server_send`)
+    le `send` du serveur, avant que les middlewares de session ne
+    l'enveloppent.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    async def __call__(self, scope, receive, send):
+        return await self.inner(dict(scope, server_send=send), receive, send)
+
+
+class TransportBackpressure:
+    """
+    Producteur « push » Twisted enregistré sur le transport de la
+    connexion Daphne: pauseProducing / resumeProducing suivent le tampon
+    d'écriture du socket. Le réacteur asyncio de Daphne partage la boucle
+    de l'application: pas de passage de thread.
+
+    Le transport n'accepte qu'un producteur et garde celui de la requête
+    HTTP d'upgrade: il est relayé (mêmes appels) puis rétabli au détachement.
+    """
+
+    def __init__(self, transport, previous=None):
+        self.transport = transport
+        self.previous = previous
+        self.writable = asyncio.Event()
+        self.writable.set()
+        self.pauses = 0
+
+    @classmethod
+    def attach(cls, send):
+        """
+        Args:
+            send: `send` du serveur (scope['server_send'], ServerSendMiddleware)
+
+        Returns:
+            TransportBackpressure, ou None hors Daphne
+        """
+        # Daphne passe partial(server.handle_reply, protocol)
+        args = getattr(send, 'args', ())
+        transport = getattr(args[0], 'transport', None) if args else None
+        if not hasattr(transport, 'registerProducer'):
+            return None
+        previous = getattr(transport, 'producer', None)
+        backpressure = cls(transport, previous)
+        try:
+            if previous is not None:
+                transport.unregisterProducer()
+            transport.registerProducer(backpressure, True)
+        except Exception as e:
+            # Transport déjà fermé ou producteur non remplaçable
+            logger.debug(f"Outbound backpressure unavailable: {e}")
+            return None
+        return backpressure
+
+    def pauseProducing(self):
+        self.pauses += 1
+        self.writable.clear()
+        if self.previous is not None:
+            self.previous.pauseProducing()
+
+    def resumeProducing(self):
+        self.writable.set()
+        if self.previous is not None:
+            self.previous.resumeProducing()
+
+    def stopProducing(self):
+        # Connexion perdue: ne plus bloquer la tâche d'écriture
+        self.writable.set()
+        if self.previous is not None:
+            self.previous.stopProducing()
+
+    def detach(self):
+        self.writable.set()
+        try:
+            if self.transport.producer is self:
+                self.transport.unregisterProducer()
+                if self.previous is not None and self.transport.connected:
+                    self.transport.registerProducer(self.previous, True)
+        except Exception as e:
+            logger.debug(f"Outbound backpressure detach failed: {e}")
+
+
+class OutboundQueue:
+    """
+    File d'envoi d'une connexion.
+
+    Args:
+        send: coroutine send(content) — un événement ou une liste d'événements
+        batching: regrouper les événements d'une fenêtre en une trame tableau
+        window: fenêtre de regroupement en secondes
+        maxsize: profondeur maximale de la file
+        backpressure: TransportBackpressure du transport (None: attendre `send`)
+    """
+
+    def __init__(self, send, batching=False, window=None, maxsize=None, backpressure=None):
+        self.send = send
+        self.backpressure = backpressure
+        self.batching = batching
+        self.window = batch_window() if window is None else window
+        self.maxsize = max_queue() if maxsize is None else maxsize
+        self.events = deque()  # (content, droppable)
+        self.inflight = []  # lot en cours d'envoi
+        self.wakeup = asyncio.Event()
+        self.writer = None
+        self.stats = {
+            'enqueued': 0,
+            'frames': 0,
+            'sent': 0,
+            'dropped': 0,
+            'max_depth': 0,
+        }
+
+    @property
+    def depth(self):
+        return len(self.events)
+
+    def start(self):
+        if self.writer is None:
+            self.writer = asyncio.create_task(self._run())
+
+    def put(self, content, droppable=False):
+        """
+        Ajoute un événement. `droppable`: peut être écarté sous pression.
+        Lève QueueOverflow si la file est pleine d'événements non écartables.
+        """
+        if len(self.events) >= self.maxsize:
+            if droppable:
+                self.stats['dropped'] += 1
+                return
+            if not self._drop_droppable():
+                raise QueueOverflow()
+
+        self.events.append((content, droppable))
+        self.stats['enqueued'] += 1
+        self.stats['max_depth'] = max(self.stats['max_depth'], len(self.events))
+        self.wakeup.set()
+
+    def _drop_droppable(self):
+        kept = deque(item for item in self.events if not item[1])
+        dropped = len(self.events) - len(kept)
+        self.events = kept
+        self.stats['dropped'] += dropped
+        return dropped > 0
+
+    def resume_cursors(self):
+        """
+        Curseurs de reprise pour `sync`: par conversation, le seq précédant
+        le premier message encore en file ou en cours d'envoi.
+        """
+        cursors = {}
+        for content in [*self.inflight, *(item[0] for item in self.events)]:
+            message = content.get('message') if isinstance(content, dict) else None
+            if message and message.get('seq'):
+                conv_uuid = message['conversation_uuid']
+                cursors[conv_uuid] = min(cursors.get(conv_uuid, message['seq']), message['seq'])
+        return {conv_uuid: seq - 1 for conv_uuid, seq in cursors.items()}
+
+    async def _run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            if self.batching and self.window > 0:
+                await asyncio.sleep(self.window)
+            try:
+                await self._drain()
+            except Exception as e:
+                self.inflight = []
+                logger.error(f"Outbound send failed: {e}")
+
+    async def _drain(self):
+        limit = max_batch() if self.batching else 1
+        while self.events:
+            if self.backpressure is not None:
+                # Tampon du socket plein: le client ne lit pas assez vite
+                await self.backpressure.writable.wait()
+            batch = [self.events.popleft()[0] for _ in range(min(limit, len(self.events)))]
+            self.inflight = batch
+            await self.send(batch if self.batching and len(batch) > 1 else batch[0])
+            self.inflight = []
+            self.stats['frames'] += 1
+            self.stats['sent'] += len(batch)
+
+    async def close(self, flush=True):
+        """Arrête la tâche d'écriture (en vidant la file si `flush`)"""
+        if self.backpressure is not None:
+            self.stats['transport_pauses'] = self.backpressure.pauses
+            self.backpressure.detach()
+            self.backpressure = None
+        if self.writer is not None:
+            self.writer.cancel()
+            try:
+                await self.writer
+            except asyncio.CancelledError:
+                pass
+            self.writer = None
+        if flush:
+            try:
+                await self._drain()
+            except Exception as e:
+                logger.debug(f"Outbound flush on close failed: {e}")
+        self.events.clear()
@@ -0,0 +1,139 @@
+"""
+Ondes Chat - Partitions mensuelles de chat_message (PostgreSQL)
+
+La migration 0010 transforme chat_message en table partitionnée par
+intervalle sur created_at: une partition par mois (chat_message_pAAAA_MM)
+et une partition par défaut qui reçoit les lignes hors des mois créés.
+ensure_message_partitions crée les mois à venir (à lancer chaque mois);
+archive_messages détache et supprime les mois exportés.
+
+Les contraintes d'unicité incluent la clé de partition: la clé primaire
+devient (id, created_at), uuid et (conversation, seq) ne sont uniques
+qu'avec created_at. Leur unicité globale est portée par la table non
+partitionnée chat_message_key (migration 0016), tenue à jour par
+triggers; détacher une partition ne les déclenche pas, d'où la mise à
+jour explicite dans create_partition et drop_partition.
+
+Sous SQLite (et tout autre moteur), la table reste unique: les helpers
+renvoient des valeurs neutres et l'archivage supprime par intervalle.
+"""
+import datetime
+
+from django.db import connection, transaction
+
+TABLE = 'chat_message'
+DEFAULT_PARTITION = f'{TABLE}_default'
+KEY_TABLE = f'{TABLE}_key'
+
+
+def month_start(value):
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y_%m}'
+
+
+def month_bounds(month):
+    """[début, fin) du mois en UTC"""
+    start = datetime.datetime(month.year, month.month, 1, tzinfo=datetime.timezone.utc)
+    end_month = add_months(month, 1)
+    end = datetime.datetime(end_month.year, end_month.month, 1, tzinfo=datetime.timezone.utc)
+    return start, end
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = %s AND c.relnamespace = to_regnamespace(current_schema())",
+            [TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """{mois: nom} des partitions mensuelles existantes"""
+    if not is_partitioned():
+        return {}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s",
+            [TABLE]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        if name == DEFAULT_PARTITION:
+            continue
+        year, month = name.rsplit('_p', 1)[1].split('_')
+        partitions[datetime.date(int(year), int(month), 1)] = name
+    return partitions
+
+
+def default_rows(month):
+    """Lignes du mois tombées dans la partition par défaut"""
+    start, end = month_bounds(month)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT count(*) FROM "{DEFAULT_PARTITION}" WHERE created_at >= %s AND created_at < %s',
+            [start, end]
+        )
+        return cursor.fetchone()[0]
+
+
+def create_partition(month):
+    """
+    Crée la partition du mois (sans effet si elle existe). Les lignes du
+    mois déjà tombées dans la partition par défaut y sont déplacées.
+
+    Returns:
+        nombre de lignes déplacées
+    """
+    start, end = month_bounds(month)
+    name = partition_name(month)
+    with transaction.atomic(), connection.cursor() as cursor:
+        moved = default_rows(month)
+        if moved:
+            cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{DEFAULT_PARTITION}"')
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{TABLE}" FOR VALUES FROM (%s) TO (%s)',
+            [start, end]
+        )
+        if moved:
+            # Les lignes déplacées reprennent leur clé en arrivant dans la partition
+            cursor.execute(
+                f'DELETE FROM "{KEY_TABLE}" k USING "{DEFAULT_PARTITION}" m '
+                f'WHERE k.uuid = m.uuid AND m.created_at >= %s AND m.created_at < %s',
+                [start, end]
+            )
+            cursor.execute(
+                f'INSERT INTO "{name}" SELECT * FROM "{DEFAULT_PARTITION}" '
+                f'WHERE created_at >= %s AND created_at < %s',
+                [start, end]
+            )
+            cursor.execute(
+                f'DELETE FROM "{DEFAULT_PARTITION}" WHERE created_at >= %s AND created_at < %s',
+                [start, end]
+            )
+            cursor.execute(f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{DEFAULT_PARTITION}" DEFAULT')
+    return moved
+
+
+def drop_partition(month):
+    """Détache puis supprime la partition d'un mois (après archivage)"""
+    name = partition_name(month)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM "{KEY_TABLE}" k USING "{name}" m WHERE k.uuid = m.uuid')
+        cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+        cursor.execute(f'DROP TABLE "{name}"')
@@ -0,0 +1,157 @@
+"""
+Ondes Chat - Présence des utilisateurs
+
+Une clé par connexion (appareil) dans le cache (Redis, base ou mémoire
+du processus): chaque utilisateur a CHAT_PRESENCE_MAX_DEVICES
+emplacements chat:presence:<id>:<n>. Une connexion réserve un emplacement
+libre par `add` (atomique), le prolonge par `touch` à chaque heartbeat
+(CHAT_PRESENCE_HEARTBEAT) et le supprime à la déconnexion; sans heartbeat
+il expire après CHAT_PRESENCE_TTL (processus tué, réseau coupé). Aucune
+écriture ne réécrit l'entrée d'un autre appareil: une déconnexion ne peut
+pas effacer une connexion concurrente. Un utilisateur est en ligne tant
+qu'au moins un emplacement est occupé; chat:last_seen:<id> garde l'heure
+de la dernière activité.
+
+Seule limite: une connexion dont l'emplacement a déjà expiré (heartbeats
+manqués) peut, à la déconnexion, supprimer l'emplacement qu'un autre
+appareil vient de réserver à sa place; ce dernier le reprend à son
+heartbeat suivant.
+
+File hors ligne: pour les destinataires sans appareil connecté, le
+fan-out ne publie rien et note seulement le dernier seq par conversation
+(chat:offline:<id>). À la connexion suivante, le client reçoit ce résumé
+(`missed`) et rattrape le contenu avec `sync`.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+LAST_SEEN_TTL = 30 * 86400
+
+
+def presence_ttl():
+    return getattr(settings, 'CHAT_PRESENCE_TTL', 75)
+
+
+def heartbeat_interval():
+    return getattr(settings, 'CHAT_PRESENCE_HEARTBEAT', 30)
+
+
+def max_devices():
+    return getattr(settings, 'CHAT_PRESENCE_MAX_DEVICES', 8)
+
+
+def device_keys(user_id):
+    """Emplacements de connexion d'un utilisateur"""
+    return [f"chat:presence:{user_id}:{slot}" for slot in range(max_devices())]
+
+
+def last_seen_key(user_id):
+    return f"chat:last_seen:{user_id}"
+
+
+def offline_key(user_id):
+    return f"chat:offline:{user_id}"
+
+
+# ========== CONNEXIONS ==========
+
+async def touch(user_id, channel_name):
+    """Connexion ou heartbeat d'un appareil"""
+    keys = device_keys(user_id)
+    slots = await cache.aget_many(keys)
+    mine = next((key for key in keys if slots.get(key) == channel_name), None)
+    # Emplacement expiré entre-temps: en réserver un autre
+    if mine is None or not await cache.atouch(mine, presence_ttl()):
+        for key in keys:
+            if key not in slots and await cache.aadd(key, channel_name, presence_ttl()):
+                break
+        else:
+            logger.warning(f"Presence: no free device slot for user {user_id}")
+    # last_seen survit à la dernière connexion (affichage « vu à »)
+    await cache.aset(last_seen_key(user_id), time.time(), LAST_SEEN_TTL)
+
+
+async def leave(user_id, channel_name):
+    """Déconnexion d'un appareil: seul son emplacement est supprimé"""
+    keys = device_keys(user_id)
+    slots = await cache.aget_many(keys)
+    mine = [key for key in keys if slots.get(key) == channel_name]
+    if mine:
+        await cache.adelete_many(mine)
+    await cache.aset(last_seen_key(user_id), time.time(), LAST_SEEN_TTL)
+
+
+# ========== LECTURE ==========
+
+async def get_presence(user_ids):
+    """
+    Présence de plusieurs utilisateurs en un aller-retour.
+
+    Returns:
+        {user_id: {'online': bool, 'devices': int, 'last_seen': float | None}}
+    """
+    keys = {uid: device_keys(uid) for uid in user_ids}
+    entries = await cache.aget_many(
+        [key for uid in user_ids for key in keys[uid]] + [last_seen_key(uid) for uid in user_ids]
+    )
+    result = {}
+    for uid in user_ids:
+        devices = sum(1 for key in keys[uid] if key in entries)
+        result[uid] = {
+            'online': devices > 0,
+            'devices': devices,
+            'last_seen': None if devices else entries.get(last_seen_key(uid)),
+        }
+    return result
+
+
+async def split_online(user_ids):
+    """(en ligne, hors ligne)"""
+    presence = await get_presence(user_ids)
+    online = [uid for uid in user_ids if presence[uid]['online']]
+    offline = [uid for uid in user_ids if not presence[uid]['online']]
+    return online, offline
+
+
+def visible_to(user, user_ids):
+    """Utilisateurs dont `user` peut voir la présence (une conversation en commun)"""
+    from .models import ConversationMember
+
+    visible = set(
+        ConversationMember.objects.filter(
+            user_id__in=user_ids,
+            conversation__members__user=user
+        ).values_list('user_id', flat=True)
+    )
+    return [uid for uid in user_ids if uid in visible or uid == user.id]
+
+
+# ========== FILE HORS LIGNE ==========
+
+async def enqueue_offline(user_ids, conv_uuid, seq):
+    """Note le dernier seq manqué par conversation (deux allers-retours)"""
+    if not user_ids:
+        return
+    keys = [offline_key(uid) for uid in user_ids]
+    current = await cache.aget_many(keys)
+    updates = {}
+    for key in keys:
+        missed = current.get(key) or {}
+        missed[conv_uuid] = max(seq, missed.get(conv_uuid, 0))
+        updates[key] = missed
+    await cache.aset_many(updates, getattr(settings, 'CHAT_OFFLINE_QUEUE_TTL', 7 * 86400))
+
+
+async def pop_offline(user_id):
+    """{conversation_uuid: dernier seq manqué}, vidé à la lecture"""
+    key = offline_key(user_id)
+    missed = await cache.aget(key)
+    if missed:
+        await cache.adelete(key)
+    return missed or {}
@@ -0,0 +1,148 @@
+"""
+Ondes Chat - Limitation de débit et admission des connexions WebSocket
+
+- Par connexion: un seau à jetons par action (CHAT_WS_RATES) plus un seau
+  global '*'. Une action refusée renvoie une erreur `rate_limited` avec
+  `retry_after`; trop de refus ferment la connexion (4029).
+- Par processus: admission des nouvelles connexions (débit
+  CHAT_WS_CONNECT_RATE et plafond CHAT_WS_MAX_CONNECTIONS). Un refus ferme
+  la socket avec le code 4013 (« réessayer plus tard ») après une trame
+  `retry` portant `retry_after`. Le contrôle suit la validation du token
+  (en cache): des connexions anonymes n'épuisent pas le budget. nginx
+  limite en plus les connexions par IP (zone ws_limit).
+
+Format des débits: "N/période" comme DRF (second, minute, hour, day);
+N est aussi la rafale autorisée.
+"""
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+CLOSE_TRY_AGAIN = 4013
+CLOSE_RATE_LIMITED = 4029
+
+# Seau et label communs aux actions inconnues
+UNKNOWN_ACTION = 'unknown'
+
+DEFAULT_RATES = {
+    '*': '300/minute',
+    'send_message': '60/minute',
+    'get_messages': '30/minute',
+    'get_public_keys': '30/minute',
+    'sync': '10/minute',
+    'get_presence': '30/minute',
+}
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'30/minute' → (capacité 30, 0.5 jeton/s); None → pas de limite"""
+    if not rate:
+        return None
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+def ws_rates():
+    return {**DEFAULT_RATES, **getattr(settings, 'CHAT_WS_RATES', {})}
+
+
+class TokenBucket:
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated')
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount=1):
+        """0 si `amount` jetons sont disponibles, sinon l'attente en secondes"""
+        self._refill()
+        if self.tokens >= amount:
+            return 0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount=1):
+        self.tokens -= amount
+
+
+class ConnectionLimiter:
+    """Seaux d'une connexion, créés à la première utilisation de l'action"""
+
+    def __init__(self, rates=None):
+        self.rates = {
+            action: parse_rate(rate)
+            for action, rate in (rates or ws_rates()).items()
+        }
+        self.buckets = {}
+        self.violations = 0
+
+    def _bucket(self, key):
+        if key not in self.buckets:
+            limit = self.rates.get(key)
+            self.buckets[key] = TokenBucket(*limit) if limit else None
+        return self.buckets[key]
+
+    def check(self, action):
+        """0 si l'action est admise (jetons consommés), sinon retry_after"""
+        buckets = [b for b in (self._bucket('*'), self._bucket(action)) if b]
+        wait = max((b.wait_time() for b in buckets), default=0)
+        if wait:
+            self.violations += 1
+            metrics.incr('chat_ws_rate_limited_total', action=action)
+            return wait
+        for bucket in buckets:
+            bucket.consume()
+        metrics.incr('chat_ws_actions_total', action=action)
+        return 0
+
+    def exhausted(self):
+        return self.violations > getattr(settings, 'CHAT_WS_MAX_VIOLATIONS', 50)
+
+
+class Admission:
+    """Admission des connexions d'un processus"""
+
+    def __init__(self):
+        self.active = 0
+        self.bucket = None
+        self.rate = None
+
+    def admit(self):
+        """0 si la connexion est admise, sinon retry_after (secondes)"""
+        rate = getattr(settings, 'CHAT_WS_CONNECT_RATE', '200/second')
+        if rate != self.rate:
+            self.rate = rate
+            limit = parse_rate(rate)
+            self.bucket = TokenBucket(*limit) if limit else None
+
+        max_connections = getattr(settings, 'CHAT_WS_MAX_CONNECTIONS', 0)
+        if max_connections and self.active >= max_connections:
+            metrics.incr('chat_ws_connect_rejected_total', reason='capacity')
+            return getattr(settings, 'CHAT_WS_RETRY_AFTER', 5)
+        if self.bucket:
+            wait = self.bucket.wait_time()
+            if wait:
+                metrics.incr('chat_ws_connect_rejected_total', reason='rate')
+                return max(1, round(wait))
+            self.bucket.consume()
+
+        self.active += 1
+        metrics.incr('chat_ws_connect_admitted_total')
+        return 0
+
+    def release(self):
+        self.active = max(0, self.active - 1)
+
+
+admission = Admission()
@@ -0,0 +1,116 @@
+"""
+Ondes Chat - Regroupement des notifications d'accusés de lecture
+
+Un lecteur qui rattrape 200 messages ne doit pas envoyer 200 événements
+à l'expéditeur. Les accusés sont agrégés par (expéditeur, conversation)
+en un seul `receipt_update` portant le watermark atteint, et les rafales
+de plusieurs frames `read_receipt` sont regroupées dans une fenêtre
+courte. Le délai est borné: la fenêtre part du premier accusé en attente
+et n'est pas prolongée par les suivants.
+"""
+import asyncio
+import logging
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def coalesce_window():
+    return getattr(settings, 'CHAT_RECEIPT_COALESCE_WINDOW', 0.3)
+
+
+def max_uuids():
+    return getattr(settings, 'CHAT_RECEIPT_MAX_UUIDS', 100)
+
+
+def parse_receipt(data):
+    """
+    Champs d'un accusé client: (message_uuids, conversation_uuid, seq).
+    ValueError (message fixe) si l'un d'eux est invalide.
+    """
+    message_uuids = data.get('message_uuids') or []
+    conv_uuid = data.get('conversation_uuid')
+    seq = data.get('seq')
+    try:
+        message_uuids = [str(uuid.UUID(str(value))) for value in message_uuids]
+    except (TypeError, ValueError):
+        raise ValueError("Invalid message_uuids")
+    try:
+        conv_uuid = str(uuid.UUID(str(conv_uuid))) if conv_uuid else None
+    except ValueError:
+        raise ValueError("Invalid conversation_uuid")
+    if seq is not None and (isinstance(seq, bool) or not isinstance(seq, int) or seq < 0):
+        raise ValueError("Invalid seq")
+    return message_uuids, conv_uuid, seq
+
+
+class ReceiptCoalescer:
+    """
+    Tampon d'accusés d'une connexion.
+
+    Args:
+        send: coroutine send(sender_id, data) appelée au flush
+        window: fenêtre de regroupement en secondes (0 = envoi immédiat)
+    """
+
+    def __init__(self, send, window=None):
+        self.send = send
+        self.window = coalesce_window() if window is None else window
+        self.pending = {}  # (sender_id, conversation_uuid) -> data
+        self.flush_task = None
+
+    async def add(self, receipts):
+        """
+        Args:
+            receipts: [{'sender_id', 'conversation_uuid', 'seq', 'message_uuids', 'timestamp'}]
+        """
+        for receipt in receipts:
+            key = (receipt['sender_id'], receipt['conversation_uuid'])
+            current = self.pending.get(key)
+            if current is None:
+                self.pending[key] = {
+                    'conversation_uuid': receipt['conversation_uuid'],
+                    'seq': receipt['seq'],
+                    'message_uuids': list(receipt['message_uuids']),
+                    'timestamp': receipt['timestamp'],
+                }
+                continue
+            current['seq'] = max(current['seq'], receipt['seq'])
+            current['timestamp'] = receipt['timestamp']
+            if current['message_uuids'] is not None:
+                current['message_uuids'].extend(receipt['message_uuids'])
+
+        # Au-delà de la limite, le watermark `seq` suffit au client
+        limit = max_uuids()
+        for data in self.pending.values():
+            if data['message_uuids'] is not None and len(data['message_uuids']) > limit:
+                data['message_uuids'] = None
+
+        if self.window <= 0:
+            await self.flush()
+        elif self.pending and self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        pending, self.pending = self.pending, {}
+        for (sender_id, _), data in pending.items():
+            try:
+                await self.send(sender_id, data)
+            except Exception as e:
+                logger.error(f"Error sending receipt to user {sender_id}: {e}")
+
+    async def close(self):
+        """Envoie les accusés en attente (déconnexion)"""
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.flush()
@@ -1,8 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+
+from . import attachments, codec
 from .models import (
     UserKeyPair, Conversation, ConversationMember,
-    Message, MessageReceipt
+    Message
 )
 
 
@@ -37,14 +39,17 @@ class MemberSerializer(serializers.ModelSerializer):
         fields = (
             'user_id', 'username', 'avatar', 'role',
             'encrypted_conversation_key', 'public_key',
-            'notifications_enabled', 'joined_at'
+            'notifications_enabled', 'last_delivered_seq', 'last_read_seq', 'joined_at'
         )
-        read_only_fields = ('user_id', 'username', 'avatar', 'joined_at')
+        read_only_fields = ('user_id', 'username', 'avatar', 'last_delivered_seq', 'last_read_seq', 'joined_at')
     
     def get_avatar(self, obj):
         # Récupérer l'avatar depuis le profil si existant
-        if hasattr(obj.user, 'userprofile') and obj.user.userprofile.avatar:
-            return obj.user.userprofile.avatar.url
+        profile = getattr(obj.user, 'profile', None)
+        if profile and profile.avatar:
+            url = profile.avatar_url(96)
+            request = self.context.get('request')
+            return request.build_absolute_uri(url) if request else url
         return None
     
     def get_public_key(self, obj):
@@ -70,30 +75,25 @@ class ConversationListSerializer(serializers.ModelSerializer):
         read_only_fields = ('uuid', 'created_at', 'updated_at')
     
     def get_last_message(self, obj):
-        last_msg = obj.messages.filter(is_deleted=False).last()
+        # Dénormalisé (Conversation.last_message), chargé par select_related
+        last_msg = obj.last_message
         if last_msg:
             return {
                 'uuid': str(last_msg.uuid),
+                'seq': last_msg.seq,
                 'sender_id': last_msg.sender.id if last_msg.sender else None,
                 'sender_username': last_msg.sender.username if last_msg.sender else 'System',
                 'message_type': last_msg.message_type,
-                'encrypted_content': last_msg.encrypted_content,
+                'encrypted_content': codec.to_text(last_msg.content),
                 'created_at': last_msg.created_at.isoformat(),
             }
         return None
     
     def get_unread_count(self, obj):
+        # Compteur maintenu à l'envoi et à la lecture, membres préchargés
         user = self.context.get('request').user
-        try:
-            membership = obj.members.get(user=user)
-            if membership.last_read_message:
-                return obj.messages.filter(
-                    created_at__gt=membership.last_read_message.created_at,
-                    is_deleted=False
-                ).exclude(sender=user).count()
-            return obj.messages.filter(is_deleted=False).exclude(sender=user).count()
-        except ConversationMember.DoesNotExist:
-            return 0
+        membership = next((m for m in obj.members.all() if m.user_id == user.id), None)
+        return membership.unread_count if membership else 0
 
 
 class ConversationCreateSerializer(serializers.Serializer):
@@ -114,35 +114,46 @@ class ConversationCreateSerializer(serializers.Serializer):
     )
 
 
+class EncryptedPayloadField(serializers.Field):
+    """Charge chiffrée stockée en binaire, exposée en base64"""
+    
+    def to_representation(self, value):
+        return codec.to_text(value)
+
+
 class MessageSerializer(serializers.ModelSerializer):
     """Sérialiseur pour les messages"""
+    encrypted_content = EncryptedPayloadField(source='content', read_only=True)
+    encrypted_metadata = EncryptedPayloadField(source='metadata', read_only=True)
     sender_id = serializers.IntegerField(source='sender.id', read_only=True)
     sender_username = serializers.CharField(source='sender.username', read_only=True)
     reply_to_uuid = serializers.CharField(source='reply_to.uuid', read_only=True, allow_null=True)
+    # URL de téléchargement autorisée (jamais l'URL média publique)
+    encrypted_file = serializers.SerializerMethodField()
     receipts = serializers.SerializerMethodField()
     
     class Meta:
         model = Message
         fields = (
-            'uuid', 'conversation', 'sender_id', 'sender_username',
+            'uuid', 'conversation', 'seq', 'sender_id', 'sender_username',
             'message_type', 'encrypted_content', 'encrypted_metadata',
             'encrypted_file', 'reply_to_uuid', 'receipts',
             'created_at', 'edited_at', 'is_deleted'
         )
         read_only_fields = (
-            'uuid', 'sender_id', 'sender_username', 
+            'uuid', 'seq', 'sender_id', 'sender_username', 
             'created_at', 'edited_at', 'is_deleted'
         )
     
+    def get_encrypted_file(self, obj):
+        return attachments.download_path(obj.uuid) if obj.encrypted_file else None
+    
     def get_receipts(self, obj):
-        return {
-            'delivered': list(obj.receipts.filter(
-                receipt_type='delivered'
-            ).values_list('user_id', flat=True)),
-            'read': list(obj.receipts.filter(
-                receipt_type='read'
-            ).values_list('user_id', flat=True)),
-        }
+        # Dérivés des watermarks des membres, chargés une fois par la vue
+        members = self.context.get('members')
+        if members is None:
+            members = obj.conversation.members.all()
+        return obj.receipt_status(members)
 
 
 class MessageCreateSerializer(serializers.Serializer):
@@ -0,0 +1,52 @@
+"""
+Ondes Chat - Invalidation de l'annuaire des conversations en cache et
+notification des rotations de clés
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import keys, membership
+from .fanout import user_group
+from .models import ConversationMember, UserKeyPair
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=ConversationMember)
+@receiver(post_delete, sender=ConversationMember)
+def membership_changed(sender, instance, **kwargs):
+    membership.invalidate(instance.conversation.uuid)
+
+
+@receiver(post_delete, sender=ConversationMember)
+def membership_revoked(sender, instance, **kwargs):
+    """Les connexions du membre retiré oublient la conversation"""
+    conv_uuid = str(instance.conversation.uuid)
+    user_id = instance.user_id
+
+    def notify():
+        layer = get_channel_layer()
+        if layer is None:
+            return
+        try:
+            async_to_sync(layer.group_send)(user_group(user_id), {
+                'type': 'membership_revoked',
+                'conversation_uuid': conv_uuid,
+            })
+        except Exception as e:
+            logger.error(f"Error notifying membership revocation: {e}")
+
+    transaction.on_commit(notify)
+
+
+@receiver(post_save, sender=UserKeyPair)
+def key_rotated(sender, instance, **kwargs):
+    """Les contacts en ligne invalident la clé en cache"""
+    # Relue après commit: la version peut être une expression F()
+    keypair_id = instance.pk
+    transaction.on_commit(lambda: keys.notify_rotation(keypair_id))
@@ -0,0 +1,101 @@
+"""
+Ondes Chat - Synchronisation delta après reconnexion
+
+Le client envoie, pour chaque conversation, le dernier numéro de séquence
+vu ({conversation_uuid: last_seq}). Les messages, éditions et suppressions
+partagent le compteur Conversation.last_seq: tout ce qui a changé depuis
+le curseur vérifie Greatest(seq, change_seq) > last_seq. Les conversations
+à jour sont écartées sans requête sur les messages.
+"""
+import uuid
+
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+from .attachments import download_path
+from .models import ConversationMember, Message
+
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 500
+
+
+def serialize_message(m):
+    """Représentation d'un message côté WebSocket / sync"""
+    return {
+        'uuid': str(m.uuid),
+        'seq': m.seq,
+        'change_seq': m.change_seq,
+        'sender_id': m.sender.id if m.sender else None,
+        'sender_username': m.sender.username if m.sender else 'System',
+        'message_type': m.message_type,
+        # Octets bruts (ou texte non migré), base64 pour les clients JSON
+        'encrypted_content': m.content if not m.is_deleted else '',
+        'encrypted_metadata': m.metadata,
+        'encrypted_file': download_path(m.uuid) if m.encrypted_file else None,
+        'reply_to_uuid': str(m.reply_to.uuid) if m.reply_to else None,
+        'created_at': m.created_at.isoformat(),
+        'edited_at': m.edited_at.isoformat() if m.edited_at else None,
+        'is_deleted': m.is_deleted,
+    }
+
+
+def sync_conversations(user, cursors, limit=DEFAULT_LIMIT):
+    """
+    Changements manqués dans plusieurs conversations.
+
+    Args:
+        user: utilisateur (seules ses conversations sont renvoyées)
+        cursors: {conversation_uuid: last_seq}
+        limit: nombre maximal de changements par conversation
+
+    Returns:
+        {conversation_uuid: {'last_seq', 'messages', 'changes', 'has_more'}}
+        `messages`: nouveaux messages (seq > curseur); `changes`: messages
+        déjà connus, modifiés ou supprimés depuis. Avec has_more, rappeler
+        sync avec last_seq comme nouveau curseur.
+    """
+    try:
+        limit = max(1, min(int(limit), MAX_LIMIT))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid limit")
+    parsed = {}
+    for conv_uuid, last_seq in cursors.items():
+        try:
+            parsed[str(uuid.UUID(str(conv_uuid)))] = max(0, int(last_seq or 0))
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid cursor for {conv_uuid}")
+
+    memberships = ConversationMember.objects.filter(
+        user=user,
+        conversation__uuid__in=list(parsed)
+    ).values_list('conversation_id', 'conversation__uuid', 'conversation__last_seq')
+
+    result = {}
+    for conv_id, conv_uuid, conv_last_seq in memberships:
+        conv_uuid = str(conv_uuid)
+        cursor = parsed[conv_uuid]
+        if conv_last_seq <= cursor:
+            result[conv_uuid] = {
+                'last_seq': conv_last_seq, 'messages': [], 'changes': [], 'has_more': False
+            }
+            continue
+
+        rows = list(
+            Message.objects.filter(
+                conversation_id=conv_id
+            ).filter(
+                # OR sur deux colonnes indexées plutôt que Greatest(...) > curseur
+                Q(seq__gt=cursor) | Q(change_seq__gt=cursor)
+            ).annotate(
+                sync_seq=Greatest(F('seq'), F('change_seq'))
+            ).select_related('sender', 'reply_to').order_by('sync_seq')[:limit + 1]
+        )
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        result[conv_uuid] = {
+            'last_seq': rows[-1].sync_seq if has_more else max(conv_last_seq, rows[-1].sync_seq if rows else 0),
+            'messages': [serialize_message(m) for m in rows if m.seq > cursor],
+            'changes': [serialize_message(m) for m in rows if m.seq <= cursor],
+            'has_more': has_more,
+        }
+    return result
@@ -0,0 +1,95 @@
+import datetime
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+
+from chat import archive, partitions
+from chat.models import Conversation, ConversationMember, Message, MessageArchive
+
+JANUARY, FEBRUARY = datetime.date(2001, 1, 1), datetime.date(2001, 2, 1)
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        storages = {
+            **settings.STORAGES,
+            'chat_archive': {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': f'{root}/archive'}},
+        }
+        # Stockage média par MEDIA_ROOT: sous Django 5.0, les OPTIONS de
+        # STORAGES['default'] sont ignorées dans un override_settings
+        override = override_settings(MEDIA_ROOT=f'{root}/media', STORAGES=storages)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.alice, self.bob = (User.objects.create_user(name, password='x') for name in ('a1', 'a2'))
+        self.conversation = Conversation.objects.create(conversation_type='group', created_by=self.alice)
+        ConversationMember.add_members(self.conversation, [
+            (self.alice, 'owner', ''), (self.bob, 'member', ''),
+        ])
+        # seq 1-2 en janvier, 3-4 en février, 5-6 restent en base
+        for month in (JANUARY, FEBRUARY, None):
+            for _ in range(2):
+                self.send(month)
+
+    def send(self, month=None, conversation=None):
+        message = Message.create_next(
+            conversation or self.conversation, sender=self.alice, **Message.payload_fields(b'secret')
+        )
+        if month:
+            start, _ = partitions.month_bounds(month)
+            Message.objects.filter(pk=message.pk).update(created_at=start)
+        return message
+
+    def page(self):
+        return [
+            {'seq': m.seq} for m in Message.objects.filter(conversation=self.conversation).order_by('seq')
+        ]
+
+    def test_export_and_read_back(self):
+        other = Conversation.objects.create(conversation_type='group', created_by=self.bob)
+        self.send(JANUARY, conversation=other)
+
+        self.assertEqual(archive.export_month(JANUARY, dry_run=True), (3, 2))
+        self.assertEqual(archive.export_month(JANUARY), (3, 2))
+        self.assertEqual(archive.export_month(FEBRUARY), (2, 1))
+        self.assertEqual(list(Message.objects.filter(conversation=self.conversation).values_list('seq', flat=True)), [5, 6])
+
+        entries = MessageArchive.objects.filter(conversation=self.conversation).order_by('seq_min')
+        self.assertEqual([(e.path, e.seq_min, e.seq_max, e.count) for e in entries], [
+            ('2001-01.bin', 1, 2, 2), ('2001-02.bin', 3, 4, 2),
+        ])
+        # Stockage privé, hors de l'arbre média
+        self.assertTrue(archive.archive_storage().exists('2001-01.bin'))
+        self.assertFalse(default_storage.exists('2001-01.bin'))
+
+        records = archive.archived_messages(self.conversation.id)
+        self.assertEqual([r['seq'] for r in records], [1, 2, 3, 4])
+        self.assertEqual(records[0]['encrypted_content'], b'secret')
+        self.assertTrue(all(r['archived'] and r['encrypted_file'] is None for r in records))
+        self.assertEqual([r['seq'] for r in archive.archived_messages(self.conversation.id, before_seq=4, limit=2)], [2, 3])
+        self.assertEqual([r['seq'] for r in archive.archived_messages(other.id)], [1])
+
+    def test_fill_page(self):
+        archive.export_month(JANUARY)
+        archive.export_month(FEBRUARY)
+        page = self.page()
+        self.assertEqual([m['seq'] for m in archive.fill_page(self.conversation.id, page, 2)], [5, 6])
+        self.assertEqual([m['seq'] for m in archive.fill_page(self.conversation.id, page, 5)], [2, 3, 4, 5, 6])
+        self.assertEqual([m['seq'] for m in archive.fill_page(self.conversation.id, [], 3, before_seq=4)], [1, 2, 3])
+
+    def test_legacy_archive_in_media_storage(self):
+        archive.export_month(JANUARY)
+        entry = MessageArchive.objects.get(conversation=self.conversation)
+        with archive.archive_storage().open(entry.path, 'rb') as f:
+            data = f.read()
+        entry.path = default_storage.save(f'{archive.LEGACY_PREFIX}2001-01.bin', ContentFile(data))
+        entry.save()
+        self.assertEqual([r['seq'] for r in archive.archived_messages(self.conversation.id)], [1, 2])
@@ -0,0 +1,77 @@
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from chat import bumps
+from chat.models import Conversation, ConversationMember, Message
+
+
+class CountersMixin:
+
+    def setUp(self):
+        bumps._pending.clear()
+        self.alice, self.bob = (User.objects.create_user(name, password='x') for name in ('b1', 'b2'))
+        self.conversation = Conversation.objects.create(conversation_type='group', created_by=self.alice)
+        ConversationMember.add_members(self.conversation, [
+            (self.alice, 'owner', ''), (self.bob, 'member', ''),
+        ])
+
+    def send(self, sender=None):
+        return Message.create_next(
+            self.conversation.id, deferred=True, sender=sender or self.alice, **Message.payload_fields(b'x')
+        )
+
+    def state(self):
+        conversation = Conversation.objects.get(pk=self.conversation.pk)
+        unread = dict(ConversationMember.objects.filter(
+            conversation=self.conversation
+        ).values_list('user_id', 'unread_count'))
+        return conversation.counted_seq, conversation.last_message_id, unread[self.alice.id], unread[self.bob.id]
+
+
+class DeferredCounterTests(CountersMixin, TestCase):
+
+    def test_flush_counts_pending_messages_once(self):
+        self.send()
+        self.send()
+        self.send(self.bob)
+        self.assertTrue(bumps.has_pending())
+        self.assertEqual(self.state(), (0, None, 0, 0))
+
+        self.assertEqual(bumps.flush(), 1)
+        self.assertFalse(bumps.has_pending())
+        last = Message.objects.get(conversation=self.conversation, seq=3)
+        self.assertEqual(self.state(), (3, last.id, 1, 2))
+
+        # Rien de nouveau: le passage suivant ne recompte pas
+        bumps.mark(self.conversation.id)
+        bumps.flush()
+        self.assertEqual(self.state(), (3, last.id, 1, 2))
+
+    def test_read_before_flush_is_not_counted_twice(self):
+        for _ in range(3):
+            self.send()
+        ConversationMember.advance_watermarks(self.conversation.id, self.bob.id, read_seq=2)
+        bumps.flush()
+        self.assertEqual(self.state()[3], 1)
+
+    def test_immediate_send_catches_up_deferred_ones(self):
+        self.send()
+        Message.create_next(self.conversation, sender=self.alice, **Message.payload_fields(b'x'))
+        self.assertEqual(self.state()[0], 2)
+        self.assertEqual(self.state()[3], 2)
+
+
+class ScheduledFlushTests(CountersMixin, TransactionTestCase):
+    # database_sync_to_async ferme la connexion: pas de transaction de test autour
+
+    @override_settings(CHAT_LIST_REFRESH_WINDOW=0)
+    def test_schedule_flushes_after_the_window(self):
+        self.send()
+
+        async def run():
+            await bumps.schedule()
+            await bumps._task
+        async_to_sync(run)()
+        self.assertFalse(bumps.has_pending())
+        self.assertEqual(self.state()[3], 1)
@@ -0,0 +1,69 @@
+import threading
+import unittest
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase
+
+from chat.models import Conversation, ConversationMember
+
+
+class PrivateConversationTests(TestCase):
+
+    def setUp(self):
+        self.alice, self.bob = (User.objects.create_user(name, password='x') for name in ('d1', 'd2'))
+
+    def test_one_conversation_per_pair(self):
+        conversation, created = Conversation.get_or_create_private(
+            self.alice, self.bob, {str(self.alice.id): 'ka', str(self.bob.id): 'kb'}
+        )
+        self.assertTrue(created)
+        self.assertEqual(conversation.dm_key, Conversation.make_dm_key(self.bob.id, self.alice.id))
+        self.assertEqual(
+            dict(conversation.members.values_list('user_id', 'encrypted_conversation_key')),
+            {self.alice.id: 'ka', self.bob.id: 'kb'}
+        )
+        self.assertEqual(Conversation.get_or_create_private(self.bob, self.alice), (conversation, False))
+
+    def test_dm_key_is_unique(self):
+        conversation, _ = Conversation.get_or_create_private(self.alice, self.bob)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Conversation.objects.create(conversation_type='private', dm_key=conversation.dm_key)
+
+    def test_lost_creation_race_returns_the_winner(self):
+        winner, _ = Conversation.get_or_create_private(self.alice, self.bob)
+        # Lecture qui ne voit pas encore la conversation concurrente
+        with mock.patch.object(QuerySet, 'first', return_value=None):
+            self.assertEqual(Conversation.get_or_create_private(self.bob, self.alice), (winner, False))
+        self.assertEqual(Conversation.objects.filter(conversation_type='private').count(), 1)
+        self.assertEqual(ConversationMember.objects.filter(conversation=winner).count(), 2)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "créations concurrentes: PostgreSQL uniquement")
+class ConcurrentPrivateConversationTests(TransactionTestCase):
+
+    def test_concurrent_creations(self):
+        alice, bob = (User.objects.create_user(name, password='x') for name in ('d3', 'd4'))
+        start = threading.Barrier(6)
+        results, errors = [], []
+
+        def worker(user, other):
+            try:
+                start.wait()
+                results.append(Conversation.get_or_create_private(user, other))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(alice, bob) if i % 2 else (bob, alice)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len({conversation.pk for conversation, _ in results}), 1)
+        self.assertEqual(sum(created for _, created in results), 1)
+        self.assertEqual(ConversationMember.objects.count(), 2)
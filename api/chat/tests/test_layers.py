@@ -0,0 +1,134 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase
+from redis import asyncio as aioredis
+
+from chat import layers
+from chat.layers import HashRing, PostgresChannelLayer, ShardedPubSubChannelLayer, host_name
+
+try:
+    import fakeredis
+    from fakeredis.aioredis import FakeConnection, FakeRedis
+except ImportError:
+    fakeredis = None
+
+HOSTS = ['redis://shard-a:6379', 'redis://shard-b:6379']
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis requis")
+class ShardedPubSubChannelLayerTests(SimpleTestCase):
+
+    def setUp(self):
+        # Un serveur Redis en mémoire par hôte
+        self.servers = {host: fakeredis.FakeServer() for host in HOSTS}
+        patcher = mock.patch('channels_redis.pubsub.create_pool', lambda host: aioredis.ConnectionPool(
+            connection_class=FakeConnection, server=self.servers[host['address']],
+        ))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_group_send_across_two_shards(self):
+        ring = HashRing([host_name({'address': host}) for host in HOSTS])
+        groups = {}
+        for i in range(100):
+            groups.setdefault(HOSTS[ring.node(f'asgi__group__room{i}')], f'room{i}')
+        self.assertEqual(len(groups), 2)
+
+        async def run():
+            a, b = ShardedPubSubChannelLayer(hosts=HOSTS), ShardedPubSubChannelLayer(hosts=HOSTS)
+            try:
+                cb = await b.new_channel()
+                for group in groups.values():
+                    await b.group_add(group, cb)
+                for host, group in groups.items():
+                    # Abonnement du groupe sur l'hôte choisi par l'anneau seulement
+                    for other, server in self.servers.items():
+                        channels = await FakeRedis(server=server).pubsub_channels()
+                        self.assertEqual(f'asgi__group__{group}'.encode() in channels, other == host)
+                    await a.group_send(group, {'type': 'm', 'group': group})
+                    message = await asyncio.wait_for(b.receive(cb), 5)
+                    self.assertEqual(message['group'], group)
+            finally:
+                await a.flush()
+                await b.flush()
+        async_to_sync(run)()
+
+    def test_missing_internals_fail_at_startup(self):
+        with mock.patch.object(layers.channels_redis.utils, '_wrap_close', None):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'channels_redis.utils._wrap_close'):
+                ShardedPubSubChannelLayer(hosts=HOSTS)
+        with mock.patch.object(layers.RedisPubSubLoopLayer, '_get_shard', None):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'RedisPubSubLoopLayer._get_shard'):
+                ShardedPubSubChannelLayer(hosts=HOSTS)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "LISTEN/NOTIFY: PostgreSQL uniquement")
+class PostgresChannelLayerTests(TransactionTestCase):
+
+    def setUp(self):
+        self.layers = []
+
+    def tearDown(self):
+        for layer in self.layers:
+            async_to_sync(layer.flush)()
+
+    def layer(self):
+        layer = PostgresChannelLayer(prefix='test', expiry=5)
+        self.layers.append(layer)
+        return layer
+
+    def test_group_send_and_overflow(self):
+        async def run():
+            a, b = self.layer(), self.layer()
+            ca, cb = await a.new_channel(), await b.new_channel()
+            await a.group_add('room', ca)
+            await b.group_add('room', cb)
+            big = 'z' * 20000
+            await asyncio.gather(*(
+                a.group_send('room', {'type': 'm', 'i': i, 'text': big if i % 2 else ''})
+                for i in range(6)
+            ))
+            for layer, channel in ((a, ca), (b, cb)):
+                received = [await asyncio.wait_for(layer.receive(channel), 5) for _ in range(6)]
+                self.assertEqual([m['i'] for m in received], list(range(6)))
+                self.assertEqual([len(m['text']) for m in received], [0, 20000] * 3)
+        async_to_sync(run)()
+
+    def test_failing_statement_only_fails_its_own_send(self):
+        async def run():
+            a, b = self.layer(), self.layer()
+            cb = await b.new_channel()
+            loop_layer = a._get_layer()
+            results = await asyncio.to_thread(loop_layer._send_batch, [
+                ('SELECT 1', []),
+                ('SELECT 1 / 0', []),
+                ('SELECT 2', []),
+            ])
+            self.assertIsNone(results[0])
+            self.assertIsNotNone(results[1])
+            self.assertIsNone(results[2])
+
+            # Un envoi fautif dans le lot: les autres envois partent quand même
+            notify = loop_layer._notify
+            async def failing_notify(name, message, channel=''):
+                if message.get('fail'):
+                    return await notify('x' * 200, message, channel)  # nom de canal NOTIFY trop long
+                return await notify(name, message, channel)
+            loop_layer._notify = failing_notify
+            outcomes = await asyncio.gather(
+                a.send(cb, {'type': 'm', 'i': 0}),
+                a.send(cb, {'type': 'm', 'fail': True}),
+                a.send(cb, {'type': 'm', 'i': 1}),
+                return_exceptions=True,
+            )
+            self.assertIsNone(outcomes[0])
+            self.assertIsInstance(outcomes[1], Exception)
+            self.assertIsNone(outcomes[2])
+            received = [await asyncio.wait_for(b.receive(cb), 5) for _ in range(2)]
+            self.assertEqual([m['i'] for m in received], [0, 1])
+        async_to_sync(run)()
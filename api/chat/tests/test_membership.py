@@ -0,0 +1,49 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+
+from chat import membership
+from chat.models import Conversation, ConversationMember
+from ondes_backend.tiered_cache import TieredCache
+
+
+class MembershipCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        membership.entries.clear_local()
+        self.owner, self.member = (User.objects.create_user(name, password='x') for name in ('m1', 'm2'))
+        self.conversation = Conversation.objects.create(conversation_type='group', created_by=self.owner)
+        ConversationMember.objects.create(conversation=self.conversation, user=self.owner, role='owner')
+        ConversationMember.objects.create(conversation=self.conversation, user=self.member)
+
+    def test_entry_and_roles(self):
+        entry = membership.get_entry(self.conversation.uuid)
+        self.assertEqual(entry['id'], self.conversation.id)
+        self.assertEqual(membership.role_of(self.conversation.uuid, self.owner.id), 'owner')
+        self.assertIsNone(membership.role_of(self.conversation.uuid, 0))
+        with self.assertNumQueries(0):
+            self.assertCountEqual(membership.member_ids(self.conversation.uuid), [self.owner.id, self.member.id])
+
+    def test_unknown_conversation(self):
+        self.assertIsNone(membership.get_entry('00000000-0000-0000-0000-000000000000'))
+
+    def test_removed_member_refused_by_every_worker(self):
+        conv_uuid = str(self.conversation.uuid)
+        worker = TieredCache('CHAT_MEMBERS_CACHE_TTL', 'CHAT_MEMBERSHIP_LOCAL_TTL')
+
+        def other_worker_members():
+            entry = worker.get(membership.cache_key(conv_uuid), lambda: membership.load_entry(conv_uuid))
+            return set(entry['members'])
+
+        self.assertIn(self.member.id, other_worker_members())
+        ConversationMember.objects.filter(user=self.member).get().delete()
+        self.assertNotIn(self.member.id, set(membership.member_ids(conv_uuid)))
+        self.assertNotIn(self.member.id, other_worker_members())
+
+    def test_role_change(self):
+        membership.get_entry(self.conversation.uuid)
+        member = ConversationMember.objects.get(user=self.member)
+        member.role = 'admin'
+        member.save()
+        self.assertEqual(membership.role_of(self.conversation.uuid, self.member.id), 'admin')
@@ -0,0 +1,68 @@
+import datetime
+import unittest
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+
+from chat import partitions
+from chat.models import Conversation, Message
+
+OLD_MONTH = datetime.date(2001, 1, 1)  # hors des partitions créées: partition par défaut
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "partitions: PostgreSQL uniquement")
+class MessageKeyTests(TestCase):
+    """Unicité globale de uuid et (conversation, seq) malgré le partitionnement"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('p1', password='x')
+        self.conversation = Conversation.objects.create(conversation_type='group', created_by=self.user)
+
+    def message(self, month=None, **fields):
+        message = Message.create_next(self.conversation, sender=self.user, **Message.payload_fields(b'x'), **fields)
+        if month:
+            start, _ = partitions.month_bounds(month)
+            Message.objects.filter(pk=message.pk).update(created_at=start)
+        return message
+
+    def keys(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT uuid, seq FROM "{partitions.KEY_TABLE}" WHERE conversation_id = %s', [self.conversation.id])
+            return set(cursor.fetchall())
+
+    def assertDuplicate(self, **fields):
+        start, _ = partitions.month_bounds(OLD_MONTH)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Message.objects.create(
+                conversation=self.conversation, sender=self.user, created_at=start, **fields
+            )
+
+    def test_duplicates_in_another_partition_are_rejected(self):
+        message = self.message()
+        self.assertDuplicate(seq=message.seq)
+        self.assertDuplicate(uuid=message.uuid, seq=message.seq + 100)
+
+    def test_keys_follow_the_rows(self):
+        first, second = self.message(OLD_MONTH), self.message()
+        self.assertEqual(self.keys(), {(first.uuid, first.seq), (second.uuid, second.seq)})
+
+        second.is_deleted = True
+        second.save()
+        Message.objects.filter(pk=first.pk).update(seq=50)
+        self.assertEqual(self.keys(), {(first.uuid, 50), (second.uuid, second.seq)})
+
+        Message.objects.filter(pk=second.pk).delete()
+        self.assertEqual(self.keys(), {(first.uuid, 50)})
+
+    def test_create_and_drop_partition(self):
+        old = self.message(OLD_MONTH)
+        self.assertEqual(partitions.create_partition(OLD_MONTH), 1)
+        self.assertEqual(self.keys(), {(old.uuid, old.seq)})
+        self.assertDuplicate(seq=old.seq)
+
+        with connection.cursor() as cursor:
+            # Clés étrangères différées des lignes insérées par ce test
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        partitions.drop_partition(OLD_MONTH)
+        self.assertEqual(self.keys(), set())
@@ -0,0 +1,54 @@
+import asyncio
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from chat import presence
+
+
+@override_settings(CHAT_PRESENCE_MAX_DEVICES=4)
+class PresenceTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def state(self, user_id=1):
+        return async_to_sync(presence.get_presence)([user_id])[user_id]
+
+    def test_devices_and_last_seen(self):
+        async_to_sync(presence.touch)(1, 'a')
+        async_to_sync(presence.touch)(1, 'b')
+        async_to_sync(presence.touch)(1, 'a')  # heartbeat: même emplacement
+        self.assertEqual(self.state()['devices'], 2)
+
+        async_to_sync(presence.leave)(1, 'a')
+        self.assertEqual(self.state(), {'online': True, 'devices': 1, 'last_seen': None})
+
+        async_to_sync(presence.leave)(1, 'b')
+        state = self.state()
+        self.assertFalse(state['online'])
+        self.assertIsNotNone(state['last_seen'])
+
+    def test_leave_never_erases_a_concurrent_connection(self):
+        async def run():
+            for i in range(30):
+                await presence.touch(1, f'old{i}')
+                await asyncio.gather(presence.leave(1, f'old{i}'), presence.touch(1, f'new{i}'))
+                state = (await presence.get_presence([1]))[1]
+                self.assertEqual(state['devices'], 1, i)
+                await presence.leave(1, f'new{i}')
+        async_to_sync(run)()
+
+    def test_concurrent_connects_get_distinct_slots(self):
+        async def run():
+            await asyncio.gather(*(presence.touch(1, f'c{i}') for i in range(4)))
+            return (await presence.get_presence([1]))[1]['devices']
+        self.assertEqual(async_to_sync(run)(), 4)
+
+    def test_expired_slot_is_reclaimed(self):
+        async_to_sync(presence.touch)(1, 'a')
+        cache.delete_many(presence.device_keys(1))  # expiration
+        self.assertFalse(self.state()['online'])
+        async_to_sync(presence.touch)(1, 'a')
+        self.assertEqual(self.state()['devices'], 1)
@@ -0,0 +1,141 @@
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from chat import metrics
+from chat.consumers import ChatConsumer
+from chat.ratelimit import CLOSE_TRY_AGAIN, Admission, ConnectionLimiter, admission
+
+
+def _counter(name, **labels):
+    return metrics.snapshot().get((name, tuple(sorted(labels.items()))), 0)
+
+
+class ConnectionLimiterTests(SimpleTestCase):
+
+    def test_burst_then_retry_after(self):
+        limiter = ConnectionLimiter({'*': '100/minute', 'sync': '2/minute'})
+        self.assertEqual(limiter.check('sync'), 0)
+        self.assertEqual(limiter.check('sync'), 0)
+        wait = limiter.check('sync')
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 30)
+        self.assertEqual(limiter.violations, 1)
+        # Les autres actions ne sont limitées que par le seau global
+        self.assertEqual(limiter.check('typing'), 0)
+
+    def test_global_bucket(self):
+        limiter = ConnectionLimiter({'*': '3/minute'})
+        self.assertEqual([limiter.check(a) for a in ('a', 'b', 'c')], [0, 0, 0])
+        self.assertGreater(limiter.check('d'), 0)
+
+    @override_settings(CHAT_WS_MAX_VIOLATIONS=2)
+    def test_exhausted(self):
+        limiter = ConnectionLimiter({'*': '1/minute'})
+        limiter.check('x')
+        for _ in range(2):
+            limiter.check('x')
+        self.assertFalse(limiter.exhausted())
+        limiter.check('x')
+        self.assertTrue(limiter.exhausted())
+
+
+class AdmissionTests(SimpleTestCase):
+
+    @override_settings(CHAT_WS_CONNECT_RATE='2/second', CHAT_WS_MAX_CONNECTIONS=0)
+    def test_rate(self):
+        gate = Admission()
+        self.assertEqual([gate.admit(), gate.admit()], [0, 0])
+        self.assertGreaterEqual(gate.admit(), 1)
+        self.assertEqual(gate.active, 2)
+
+    @override_settings(CHAT_WS_CONNECT_RATE=None, CHAT_WS_MAX_CONNECTIONS=2, CHAT_WS_RETRY_AFTER=7)
+    def test_capacity(self):
+        gate = Admission()
+        gate.admit()
+        gate.admit()
+        self.assertEqual(gate.admit(), 7)
+        gate.release()
+        self.assertEqual(gate.admit(), 0)
+
+
+class MetricsTests(SimpleTestCase):
+
+    def test_label_values_are_escaped(self):
+        metrics.incr('chat_test_escape_total', action='a"b\\c\nd')
+        line = next(
+            line for line in metrics.render_prometheus().splitlines()
+            if line.startswith('chat_test_escape_total{')
+        )
+        self.assertEqual(line, 'chat_test_escape_total{action="a\\"b\\\\c\\nd"} 1')
+
+
+@override_settings(ALLOWED_HOSTS=['*'], CHAT_WS_RATES={'*': '1000/minute'})
+class ConsumerLimitsTests(TransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('rl', password='x')
+        self.token = Token.objects.create(user=self.user).key
+
+    async def _connect(self, token):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f'/ws/chat/?token={token}')
+        connected, code = await communicator.connect()
+        return communicator, connected, code
+
+    def test_invalid_token_does_not_consume_admission(self):
+        async def run():
+            with mock.patch.object(admission, 'admit', wraps=admission.admit) as admit:
+                communicator, connected, code = await self._connect('nope')
+                self.assertFalse(connected)
+                self.assertEqual(code, 4001)
+                self.assertFalse(admit.called)
+                communicator, connected, _ = await self._connect(self.token)
+                self.assertTrue(connected)
+                self.assertTrue(admit.called)
+                await communicator.disconnect()
+        async_to_sync(run)()
+
+    def test_admission_refusal(self):
+        async def run():
+            with mock.patch.object(admission, 'admit', return_value=3):
+                communicator, connected, _ = await self._connect(self.token)
+                self.assertTrue(connected)
+                self.assertEqual(await communicator.receive_json_from(), {'type': 'retry', 'retry_after': 3})
+                self.assertEqual((await communicator.receive_output())['code'], CLOSE_TRY_AGAIN)
+        async_to_sync(run)()
+
+    def test_unknown_actions_share_one_label(self):
+        async def run():
+            communicator, _, _ = await self._connect(self.token)
+            await communicator.receive_json_from()  # connection_established
+            before = _counter('chat_ws_actions_total', action='unknown')
+            for action in ('x"y', 'evil\nlabel', 'z'):
+                await communicator.send_json_to({'action': action})
+                self.assertEqual(await communicator.receive_json_from(),
+                                 {'type': 'error', 'message': 'Unknown action'})
+            self.assertEqual(_counter('chat_ws_actions_total', action='unknown') - before, 3)
+            self.assertEqual(_counter('chat_ws_actions_total', action='x"y'), 0)
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+    def test_invalid_fields_get_fixed_errors(self):
+        async def run():
+            communicator, _, _ = await self._connect(self.token)
+            await communicator.receive_json_from()
+            cases = [
+                ({'action': 'get_presence', 'data': {'user_ids': ['abc']}}, 'Invalid user_ids'),
+                ({'action': 'read_receipt', 'data': {'conversation_uuid': 'x', 'seq': 3}}, 'Invalid conversation_uuid'),
+                ({'action': 'read_receipt', 'data': {
+                    'conversation_uuid': '00000000-0000-0000-0000-000000000001', 'seq': 'abc'}}, 'Invalid seq'),
+                ({'action': 'delivered_receipt', 'data': {'message_uuids': ['nope']}}, 'Invalid message_uuids'),
+                ({'action': 'sync', 'data': []}, "'data' must be an object"),
+            ]
+            for frame, message in cases:
+                await communicator.send_json_to(frame)
+                self.assertEqual(await communicator.receive_json_from(), {'type': 'error', 'message': message})
+            await communicator.disconnect()
+        async_to_sync(run)()
@@ -0,0 +1,63 @@
+import uuid
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from chat.models import Conversation, ConversationMember, Message
+from chat.sync import sync_conversations
+
+
+class SyncTests(TestCase):
+
+    def setUp(self):
+        self.alice, self.bob, self.eve = (User.objects.create_user(name, password='x') for name in ('s1', 's2', 's3'))
+        self.conversation = Conversation.objects.create(conversation_type='group', created_by=self.alice)
+        ConversationMember.add_members(self.conversation, [
+            (self.alice, 'owner', ''), (self.bob, 'member', ''),
+        ])
+        self.messages = [
+            Message.create_next(self.conversation, sender=self.alice, **Message.payload_fields(b'm%d' % i))
+            for i in range(5)
+        ]
+        self.conv_uuid = str(self.conversation.uuid)
+
+    def sync(self, cursor, user=None, **kwargs):
+        return sync_conversations(user or self.bob, {self.conv_uuid: cursor}, **kwargs).get(self.conv_uuid)
+
+    def test_new_messages_and_changes_since_cursor(self):
+        self.messages[1].edit(b'edited')      # change_seq 6
+        self.messages[3].soft_delete()        # change_seq 7
+        result = self.sync(3)
+        # Ordre des changements: le 4, supprimé après l'envoi du 5, vient après lui
+        self.assertEqual([m['seq'] for m in result['messages']], [5, 4])
+        self.assertEqual([(m['seq'], m['is_deleted']) for m in result['changes']], [(2, False)])
+        self.assertEqual(result['messages'][1]['is_deleted'], True)
+        self.assertEqual(result['messages'][1]['encrypted_content'], '')
+        self.assertEqual(result['last_seq'], 7)
+        self.assertFalse(result['has_more'])
+
+        # Curseur au dernier changement: rien à renvoyer, sans lire les messages
+        self.assertEqual(self.sync(7), {'last_seq': 7, 'messages': [], 'changes': [], 'has_more': False})
+
+    def test_paging_with_has_more(self):
+        seen, cursor = [], 0
+        while True:
+            result = self.sync(cursor, limit=2)
+            seen += [m['seq'] for m in result['messages']]
+            cursor = result['last_seq']
+            if not result['has_more']:
+                break
+        self.assertEqual(seen, [1, 2, 3, 4, 5])
+        self.assertEqual(cursor, 5)
+
+    def test_only_member_conversations(self):
+        self.assertIsNone(self.sync(0, user=self.eve))
+        self.assertEqual(sync_conversations(self.bob, {str(uuid.uuid4()): 0}), {})
+
+    def test_invalid_input(self):
+        with self.assertRaisesMessage(ValueError, 'Invalid cursor'):
+            sync_conversations(self.bob, {'not-a-uuid': 0})
+        with self.assertRaisesMessage(ValueError, 'Invalid cursor'):
+            self.sync('x')
+        with self.assertRaisesMessage(ValueError, 'Invalid limit'):
+            self.sync(0, limit='x')
@@ -0,0 +1,103 @@
+import threading
+import unittest
+
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase
+
+from chat.models import Conversation, ConversationMember, Message
+
+
+def send(conversation, sender, **fields):
+    return Message.create_next(conversation, sender=sender, **Message.payload_fields(b'x'), **fields)
+
+
+class SeqAndWatermarkTests(TestCase):
+
+    def setUp(self):
+        self.alice, self.bob = (User.objects.create_user(name, password='x') for name in ('w1', 'w2'))
+        self.conversation = Conversation.objects.create(conversation_type='group', created_by=self.alice)
+        ConversationMember.add_members(self.conversation, [
+            (self.alice, 'owner', ''), (self.bob, 'member', ''),
+        ])
+
+    def member(self, user):
+        return ConversationMember.objects.get(conversation=self.conversation, user=user)
+
+    def test_seq_is_allocated_in_order(self):
+        messages = [send(self.conversation, self.alice) for _ in range(3)]
+        self.assertEqual([m.seq for m in messages], [1, 2, 3])
+        self.assertEqual(self.conversation.last_seq, 3)
+
+        # Une édition consomme un seq du même compteur
+        messages[0].edit(b'y')
+        self.assertEqual(messages[0].change_seq, 4)
+        self.assertEqual(send(self.conversation.id, self.alice).seq, 5)
+        self.conversation.refresh_from_db()
+        self.assertEqual((self.conversation.last_seq, self.conversation.counted_seq), (5, 5))
+
+    def test_allocate_seq_of_missing_conversation(self):
+        with self.assertRaises(Conversation.DoesNotExist):
+            Conversation.allocate_seq(0)
+
+    def test_watermarks_only_move_forward(self):
+        for _ in range(4):
+            send(self.conversation, self.alice)
+        self.assertEqual(self.member(self.bob).unread_count, 4)
+
+        self.assertEqual(ConversationMember.advance_watermarks(self.conversation.id, self.bob.id, delivered_seq=3), 1)
+        member = self.member(self.bob)
+        self.assertEqual((member.last_delivered_seq, member.last_read_seq, member.unread_count), (3, 0, 4))
+
+        # Lu implique délivré; les non-lus restants sont recomptés
+        ConversationMember.advance_watermarks(self.conversation.id, self.bob.id, read_seq=4)
+        member = self.member(self.bob)
+        self.assertEqual((member.last_delivered_seq, member.last_read_seq, member.unread_count), (4, 4, 0))
+
+        self.assertEqual(ConversationMember.advance_watermarks(self.conversation.id, self.bob.id, 2, 2), 0)
+        member = self.member(self.bob)
+        self.assertEqual((member.last_delivered_seq, member.last_read_seq), (4, 4))
+
+    def test_partial_read_recounts_unread(self):
+        messages = [send(self.conversation, self.alice) for _ in range(4)]
+        messages[3].soft_delete()
+        self.assertEqual(self.member(self.bob).unread_count, 3)
+        ConversationMember.advance_watermarks(self.conversation.id, self.bob.id, read_seq=1)
+        self.assertEqual(self.member(self.bob).unread_count, 2)
+        self.assertEqual(self.member(self.alice).unread_count, 0)
+
+    def test_receipt_status(self):
+        first, second = send(self.conversation, self.alice), send(self.conversation, self.alice)
+        ConversationMember.advance_watermarks(self.conversation.id, self.bob.id, delivered_seq=2, read_seq=1)
+        members = list(self.conversation.members.all())
+        self.assertEqual(first.receipt_status(members), {'delivered': [self.bob.id], 'read': [self.bob.id]})
+        self.assertEqual(second.receipt_status(members), {'delivered': [self.bob.id], 'read': []})
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "envois concurrents: PostgreSQL uniquement")
+class ConcurrentSeqTests(TransactionTestCase):
+
+    def test_concurrent_sends_get_distinct_contiguous_seqs(self):
+        user = User.objects.create_user('w3', password='x')
+        conversation = Conversation.objects.create(conversation_type='group', created_by=user)
+        start = threading.Barrier(8)
+        errors = []
+
+        def worker():
+            try:
+                start.wait()
+                for _ in range(10):
+                    send(conversation.id, user, deferred=True)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        seqs = sorted(Message.objects.filter(conversation=conversation).values_list('seq', flat=True))
+        self.assertEqual(seqs, list(range(1, 81)))
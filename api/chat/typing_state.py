@@ -0,0 +1,54 @@
+"""
+Ondes Chat - Indicateurs de frappe éphémères
+
+L'état "en train d'écrire" vit dans le cache (Redis si configuré, sinon en
+mémoire du processus) avec expiration automatique: aucune requête SQL,
+aucun nettoyage explicite à la déconnexion.
+
+Deux clés par (conversation, utilisateur):
+- état, TTL CHAT_TYPING_TTL: l'utilisateur est affiché comme "écrit";
+- throttle, TTL CHAT_TYPING_THROTTLE: un seul broadcast is_typing=true
+  par fenêtre, quel que soit le nombre de frappes reçues.
+
+Les clients effacent l'indicateur après `expires_in` secondes sans
+rafraîchissement, comme le serveur.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+
+def typing_ttl():
+    return getattr(settings, 'CHAT_TYPING_TTL', 6)
+
+
+def typing_throttle():
+    return getattr(settings, 'CHAT_TYPING_THROTTLE', 3)
+
+
+def _state_key(conv_uuid, user_id):
+    return f"chat:typing:{conv_uuid}:{user_id}"
+
+
+def _throttle_key(conv_uuid, user_id):
+    return f"chat:typing:{conv_uuid}:{user_id}:throttle"
+
+
+async def update(conv_uuid, user_id, is_typing):
+    """
+    Enregistre un événement de frappe.
+
+    Returns:
+        bool: True si l'événement doit être diffusé
+    """
+    if is_typing:
+        await cache.aset(_state_key(conv_uuid, user_id), 1, typing_ttl())
+        # add() est atomique: une seule connexion gagne la fenêtre
+        return await cache.aadd(_throttle_key(conv_uuid, user_id), 1, typing_throttle())
+
+    await cache.adelete(_throttle_key(conv_uuid, user_id))
+    # Rien à diffuser si l'état a déjà expiré chez tout le monde
+    return await cache.adelete(_state_key(conv_uuid, user_id))
+
+
+def is_user_typing(conv_uuid, user_id):
+    return cache.get(_state_key(conv_uuid, user_id)) is not None
@@ -9,10 +9,23 @@ urlpatterns = [
     # Gestion des clés E2EE
     path('keys/', views.KeyPairView.as_view(), name='chat-keypair'),
     path('keys/public/', views.PublicKeysView.as_view(), name='chat-public-keys'),
+    path('keys/directory/', views.KeyDirectoryView.as_view(), name='chat-key-directory'),
     
     # Conversation privée rapide
     path('dm/', views.StartPrivateConversationView.as_view(), name='chat-dm'),
     
+    # Synchronisation delta (reconnexion)
+    path('sync/', views.SyncView.as_view(), name='chat-sync'),
+    
+    # Pièces jointes chiffrées (envoi en flux, téléchargement avec Range)
+    path('messages/<uuid:message_uuid>/attachment/', views.AttachmentView.as_view(), name='chat-attachment'),
+    
+    # Présence
+    path('presence/', views.PresenceView.as_view(), name='chat-presence'),
+    
+    # Compteurs temps réel (admin)
+    path('metrics/', views.MetricsView.as_view(), name='chat-metrics'),
+    
     # ViewSet conversations
     path('', include(router.urls)),
 ]
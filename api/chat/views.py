@@ -1,22 +1,48 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.views import APIView
+import base64
+import logging
+from datetime import datetime
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.core.files import File
+from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import F, Prefetch, Q, Subquery
 from django.utils import timezone
 
 from .models import (
     UserKeyPair, Conversation, ConversationMember,
-    Message, MessageReceipt
+    Message
 )
+from . import archive, attachments, codec, keys, membership, metrics, presence
+from .fanout import broadcast
+from .sync import sync_conversations, DEFAULT_LIMIT
 from .serializers import (
     UserPublicKeySerializer, UserKeyPairCreateSerializer,
     ConversationListSerializer, ConversationCreateSerializer,
     MessageSerializer, MemberSerializer
 )
 
+logger = logging.getLogger(__name__)
+
+
+def keys_response(request, payload):
+    """Réponse en lot avec ETag (304 si le client l'a déjà)"""
+    tag = keys.etag(payload)
+    if keys.etag_matches(request, tag):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(payload)
+    response['ETag'] = tag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
 
 class KeyPairView(APIView):
     """
@@ -42,17 +68,21 @@ class KeyPairView(APIView):
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        keypair, created = UserKeyPair.objects.update_or_create(
+        public_key = serializer.validated_data['public_key']
+        key_signature = serializer.validated_data.get('key_signature', '')
+        keypair, created = UserKeyPair.objects.get_or_create(
             user=request.user,
-            defaults={
-                'public_key': serializer.validated_data['public_key'],
-                'key_signature': serializer.validated_data.get('key_signature', ''),
-            }
+            defaults={'public_key': public_key, 'key_signature': key_signature}
         )
         
-        if not created:
-            keypair.version += 1
-            keypair.save(update_fields=['version'])
+        # Nouvelle version seulement si la clé change (les contacts
+        # invalident leur cache et reçoivent key_rotated)
+        if not created and (keypair.public_key, keypair.key_signature) != (public_key, key_signature):
+            keypair.public_key = public_key
+            keypair.key_signature = key_signature
+            keypair.version = F('version') + 1
+            keypair.save(update_fields=['public_key', 'key_signature', 'version', 'rotated_at'])
+            keypair.refresh_from_db(fields=['version'])
         
         return Response({
             'success': True,
@@ -85,9 +115,9 @@ class PublicKeysView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        keypairs = UserKeyPair.objects.filter(user_id__in=ids)
+        keypairs = UserKeyPair.objects.filter(user_id__in=ids).select_related('user')
         serializer = UserPublicKeySerializer(keypairs, many=True)
-        return Response(serializer.data)
+        return keys_response(request, serializer.data)
     
     def post(self, request):
         """Récupérer les clés publiques (POST pour listes plus longues)"""
@@ -98,9 +128,39 @@ class PublicKeysView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        keypairs = UserKeyPair.objects.filter(user_id__in=user_ids)
+        keypairs = UserKeyPair.objects.filter(user_id__in=user_ids).select_related('user')
         serializer = UserPublicKeySerializer(keypairs, many=True)
-        return Response(serializer.data)
+        return keys_response(request, serializer.data)
+
+
+class KeyDirectoryView(APIView):
+    """
+    Annuaire versionné des clés publiques (voir chat/keys.py).
+    
+    POST {"known": {"<user_id>": version, ...}}
+    GET ?known=<user_id>:<version>,...
+    → {"keys": [clés plus récentes], "missing": [user_ids sans clé]}, ETag
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        try:
+            known = dict(
+                item.split(':', 1) if ':' in item else (item, 0)
+                for item in request.query_params.get('known', '').split(',') if item
+            )
+            return self.directory(request, keys.parse_known(known))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    def post(self, request):
+        try:
+            return self.directory(request, keys.parse_known(request.data.get('known')))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    def directory(self, request, known):
+        return keys_response(request, keys.changed_keys(known))
 
 
 class ConversationViewSet(viewsets.ModelViewSet):
@@ -112,10 +172,71 @@ class ConversationViewSet(viewsets.ModelViewSet):
     lookup_field = 'uuid'  # Utiliser UUID au lieu de pk
     
     def get_queryset(self):
-        """Retourne uniquement les conversations de l'utilisateur"""
+        """
+        Conversations de l'utilisateur: une requête (dernier message joint)
+        plus un prefetch des membres avec profil et clé publique.
+        """
+        members = ConversationMember.objects.select_related(
+            'user', 'user__profile', 'user__chat_keypair'
+        )
         return Conversation.objects.filter(
             members__user=self.request.user
-        ).prefetch_related('members', 'members__user').distinct()
+        ).select_related(
+            'last_message', 'last_message__sender'
+        ).prefetch_related(
+            Prefetch('members', queryset=members)
+        ).order_by('-updated_at', '-id')
+    
+    def list(self, request):
+        """
+        Liste des conversations, de la plus récente à la plus ancienne.
+        Avec `limit` (et `cursor`), pagination par clé (updated_at, id):
+        pas d'OFFSET, stable si de nouveaux messages arrivent entre deux pages.
+        """
+        queryset = self.get_queryset()
+        if 'limit' not in request.query_params and 'cursor' not in request.query_params:
+            serializer = self.get_serializer(queryset, many=True)
+            return Response(serializer.data)
+        
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 50)), 100))
+        except ValueError:
+            limit = 50
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            try:
+                updated_at, conv_id = self.decode_cursor(cursor)
+            except ValueError:
+                return Response(
+                    {'error': 'Invalid cursor'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            queryset = queryset.filter(
+                Q(updated_at__lt=updated_at) | Q(updated_at=updated_at, id__lt=conv_id)
+            )
+        
+        conversations = list(queryset[:limit + 1])
+        has_more = len(conversations) > limit
+        conversations = conversations[:limit]
+        serializer = self.get_serializer(conversations, many=True)
+        return Response({
+            'conversations': serializer.data,
+            'next_cursor': self.encode_cursor(conversations[-1]) if has_more else None,
+        })
+    
+    @staticmethod
+    def encode_cursor(conversation):
+        raw = f"{conversation.updated_at.isoformat()}|{conversation.id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+    
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+            updated_at, conv_id = raw.split('|')
+            return datetime.fromisoformat(updated_at), int(conv_id)
+        except (TypeError, UnicodeDecodeError, ValueError) as e:
+            raise ValueError(str(e))
     
     def create(self, request):
         """Créer une nouvelle conversation"""
@@ -135,50 +256,35 @@ class ConversationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Pour les conversations privées, vérifier qu'il n'en existe pas déjà une
-        if data['conversation_type'] == 'private' and len(member_ids) == 1:
-            other_user_id = member_ids[0]
-            existing = Conversation.objects.filter(
-                conversation_type='private',
-                members__user=request.user
-            ).filter(
-                members__user_id=other_user_id
-            ).first()
-            
-            if existing:
-                # Retourner la conversation existante
-                response_serializer = ConversationListSerializer(
-                    existing, 
-                    context={'request': request}
-                )
-                return Response(response_serializer.data)
-        
-        # Créer la conversation
-        conversation = Conversation.objects.create(
-            conversation_type=data['conversation_type'],
-            name=data.get('name', ''),
-            created_by=request.user
-        )
-        
-        # Ajouter le créateur
-        my_encrypted_key = encrypted_keys.get(str(request.user.id), '')
-        ConversationMember.objects.create(
-            conversation=conversation,
-            user=request.user,
-            role='owner' if data['conversation_type'] == 'group' else 'member',
-            encrypted_conversation_key=my_encrypted_key
-        )
+        # Conversation privée: une seule par paire (index unique dm_key)
+        if data['conversation_type'] == 'private' and len(member_ids) == 1 and member_ids[0] != request.user.id:
+            conversation, created = Conversation.get_or_create_private(
+                request.user, users.get(), encrypted_keys
+            )
+            response_serializer = ConversationListSerializer(
+                conversation,
+                context={'request': request}
+            )
+            return Response(
+                response_serializer.data,
+                status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+            )
         
-        # Ajouter les autres membres
-        for user in users:
-            if user.id != request.user.id:
-                user_encrypted_key = encrypted_keys.get(str(user.id), '')
-                ConversationMember.objects.create(
-                    conversation=conversation,
-                    user=user,
-                    role='member',
-                    encrypted_conversation_key=user_encrypted_key
-                )
+        with transaction.atomic():
+            conversation = Conversation.objects.create(
+                conversation_type=data['conversation_type'],
+                name=data.get('name', ''),
+                created_by=request.user
+            )
+            # Créateur puis autres membres, en un seul INSERT
+            ConversationMember.add_members(conversation, [(
+                request.user,
+                'owner' if data['conversation_type'] == 'group' else 'member',
+                encrypted_keys.get(str(request.user.id), '')
+            )] + [
+                (user, 'member', encrypted_keys.get(str(user.id), ''))
+                for user in users if user.id != request.user.id
+            ])
         
         response_serializer = ConversationListSerializer(
             conversation, 
@@ -290,14 +396,15 @@ class ConversationViewSet(viewsets.ModelViewSet):
         
         last_message = conversation.messages.filter(is_deleted=False).last()
         if last_message:
-            membership = ConversationMember.objects.get(
+            ConversationMember.objects.filter(
                 conversation=conversation,
                 user=request.user
-            )
-            membership.last_read_message = last_message
-            membership.save(update_fields=['last_read_message'])
+            ).update(last_read_message=last_message)
+        ConversationMember.advance_watermarks(
+            conversation.id, request.user.id, read_seq=conversation.last_seq
+        )
         
-        return Response({'success': True})
+        return Response({'success': True, 'last_read_seq': conversation.last_seq})
     
     @action(detail=True, methods=['get'])
     def messages(self, request, uuid=None):
@@ -306,20 +413,170 @@ class ConversationViewSet(viewsets.ModelViewSet):
         
         limit = min(int(request.query_params.get('limit', 50)), 100)
         before_uuid = request.query_params.get('before')
+        before_seq = request.query_params.get('before_seq')
         
         queryset = conversation.messages.filter(is_deleted=False)
         
-        if before_uuid:
+        if before_seq:
             try:
-                before_msg = Message.objects.get(uuid=before_uuid)
-                queryset = queryset.filter(created_at__lt=before_msg.created_at)
-            except Message.DoesNotExist:
-                pass
+                before_seq = int(before_seq)
+            except ValueError:
+                return Response(
+                    {'error': 'Invalid before_seq'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            queryset = queryset.filter(seq__lt=before_seq)
+        elif before_uuid:
+            queryset = queryset.filter(seq__lt=Subquery(
+                conversation.messages.filter(uuid=before_uuid).values('seq')[:1]
+            ))
+        
+        messages = queryset.order_by('-seq')[:limit]
+        members = list(conversation.members.all())
+        serializer = MessageSerializer(
+            reversed(list(messages)),
+            many=True,
+            context={'members': members}
+        )
+        page = list(serializer.data)
         
-        messages = queryset.order_by('-created_at')[:limit]
-        serializer = MessageSerializer(reversed(list(messages)), many=True)
+        # Page trop courte: suite dans les archives (sauf ancien curseur introuvable)
+        if before_seq or page or not before_uuid:
+            page = [
+                codec.for_json(archive.rest_record(m, conversation.id, members)) if m.get('archived') else m
+                for m in archive.fill_page(conversation.id, page, limit, before_seq or None)
+                if not m['is_deleted']
+            ]
         
-        return Response(serializer.data)
+        return Response(page)
+
+
+class SyncView(APIView):
+    """
+    Synchronisation delta après reconnexion.
+    
+    POST {"conversations": {"<uuid>": last_seq, ...}, "limit": 200}
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        cursors = request.data.get('conversations')
+        if not isinstance(cursors, dict) or not cursors:
+            return Response(
+                {'error': 'conversations required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            result = sync_conversations(
+                request.user, cursors, request.data.get('limit', DEFAULT_LIMIT)
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({'conversations': codec.for_json(result)})
+
+
+class PresenceView(APIView):
+    """
+    Présence de plusieurs utilisateurs.
+    
+    GET /api/chat/presence/?user_ids=1,2,3
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        try:
+            user_ids = [int(uid) for uid in request.query_params.get('user_ids', '').split(',') if uid]
+        except ValueError:
+            return Response({'error': 'Invalid user_ids'}, status=status.HTTP_400_BAD_REQUEST)
+        if not user_ids:
+            return Response({'error': 'user_ids required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        user_ids = presence.visible_to(request.user, user_ids[:200])
+        result = async_to_sync(presence.get_presence)(user_ids)
+        return Response({'presence': {str(uid): state for uid, state in result.items()}})
+
+
+class AttachmentView(APIView):
+    """
+    Pièce jointe chiffrée d'un message (voir chat/attachments.py).
+    
+    PUT /api/chat/messages/<uuid>/attachment/  (corps brut, expéditeur)
+    GET /api/chat/messages/<uuid>/attachment/  (membres, Range)
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get_message(self, message_uuid):
+        message = Message.objects.select_related('conversation').filter(uuid=message_uuid).first()
+        if message and membership.role_of(message.conversation.uuid, self.request.user.id):
+            return message
+        return None
+    
+    def put(self, request, message_uuid):
+        message = self.get_message(message_uuid)
+        if not message:
+            return Response({'error': 'Message not found'}, status=status.HTTP_404_NOT_FOUND)
+        if message.sender_id != request.user.id:
+            return Response({'error': 'Only the sender can upload'}, status=status.HTTP_403_FORBIDDEN)
+        if message.is_deleted or message.message_type not in attachments.ATTACHMENT_TYPES:
+            return Response({'error': 'Message does not accept attachments'}, status=status.HTTP_400_BAD_REQUEST)
+        if message.encrypted_file:
+            return Response({'error': 'Attachment already uploaded'}, status=status.HTTP_409_CONFLICT)
+        
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if not length or request.stream is None:
+            return Response({'error': 'Empty body'}, status=status.HTTP_400_BAD_REQUEST)
+        if length > attachments.max_size():
+            return Response({'error': 'Attachment too large'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        
+        # Copie par blocs vers le stockage (disque ou S3 multipart)
+        stream = attachments.UploadStream(request.stream, min(length, attachments.max_size()))
+        try:
+            message.encrypted_file.save(attachments.storage_name(message), File(stream), save=False)
+        except attachments.AttachmentTooLarge:
+            name = message.encrypted_file.field.generate_filename(message, attachments.storage_name(message))
+            message.encrypted_file.storage.delete(name)
+            return Response({'error': 'Attachment too large'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        message.save(update_fields=['encrypted_file'])
+        
+        data = {
+            'message_uuid': str(message.uuid),
+            'conversation_uuid': str(message.conversation.uuid),
+            'size': stream.size,
+            'url': attachments.download_path(message.uuid),
+        }
+        try:
+            async_to_sync(broadcast)(get_channel_layer(), data['conversation_uuid'], {
+                'type': 'attachment_ready',
+                'data': data,
+            })
+        except Exception as e:
+            logger.error(f"Error broadcasting attachment: {e}")
+        
+        return Response(data, status=status.HTTP_201_CREATED)
+    
+    def get(self, request, message_uuid):
+        message = self.get_message(message_uuid)
+        if not message or message.is_deleted or not message.encrypted_file:
+            return Response({'error': 'Attachment not found'}, status=status.HTTP_404_NOT_FOUND)
+        return attachments.serve(request, message.encrypted_file)
+
+
+class MetricsView(APIView):
+    """
+    Compteurs du temps réel (texte Prometheus), par processus.
+    """
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        return HttpResponse(
+            metrics.render_prometheus(),
+            content_type='text/plain; version=0.0.4'
+        )
 
 
 class StartPrivateConversationView(APIView):
@@ -357,45 +614,15 @@ class StartPrivateConversationView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Chercher une conversation existante
-        existing = Conversation.objects.filter(
-            conversation_type='private',
-            members__user=request.user
-        ).filter(
-            members__user=other_user
-        ).first()
-        
-        if existing:
-            serializer = ConversationListSerializer(
-                existing,
-                context={'request': request}
-            )
-            return Response({
-                'created': False,
-                'conversation': serializer.data
-            })
-        
-        # Créer la conversation
-        conversation = Conversation.objects.create(
-            conversation_type='private',
-            created_by=request.user
+        conversation, created = Conversation.get_or_create_private(
+            request.user, other_user, encrypted_keys
         )
         
-        # Ajouter les membres
-        for user in [request.user, other_user]:
-            user_key = encrypted_keys.get(str(user.id), '')
-            ConversationMember.objects.create(
-                conversation=conversation,
-                user=user,
-                role='member',
-                encrypted_conversation_key=user_key
-            )
-        
         serializer = ConversationListSerializer(
             conversation,
             context={'request': request}
         )
         return Response({
-            'created': True,
+            'created': created,
             'conversation': serializer.data
-        }, status=status.HTTP_201_CREATED)
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
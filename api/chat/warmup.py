@@ -0,0 +1,105 @@
+"""
+Ondes Chat - Démarrage à chaud de la connexion WebSocket
+
+Avec ?warm=N à la connexion, `connection_established` embarque les N
+conversations les plus récentes (updated_at) avec leurs K derniers
+messages, leurs membres et les clés publiques de ces membres, ce qui
+évite au client un get_messages / get_public_keys par conversation.
+
+Quatre requêtes quel que soit N:
+1. conversations de l'utilisateur (tri updated_at, limite N)
+2. K derniers messages de chaque conversation (ROW_NUMBER() par conversation)
+3. membres de ces conversations
+4. clés publiques de ces membres
+"""
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import ConversationMember, Message, UserKeyPair
+from .sync import serialize_message
+
+MAX_CONVERSATIONS = 50
+MAX_MESSAGES = 50
+
+
+def parse_warm(value):
+    """Paramètre ?warm=: '1' / 'true' → valeur par défaut, 'N' → N (plafonné), sinon 0"""
+    if not value:
+        return 0
+    if value in ('1', 'true'):
+        return getattr(settings, 'CHAT_WARM_CONVERSATIONS', 20)
+    try:
+        return max(0, min(int(value), MAX_CONVERSATIONS))
+    except ValueError:
+        return 0
+
+
+def warm_start(user, conversations, messages=None):
+    """
+    Conversations récentes prêtes à afficher.
+
+    Args:
+        user: utilisateur connecté
+        conversations: nombre de conversations (N)
+        messages: derniers messages par conversation (K,
+            CHAT_WARM_MESSAGES par défaut)
+
+    Returns:
+        {'conversations': [{'uuid', 'conversation_type', 'name', 'last_seq',
+          'unread_count', 'last_read_seq', 'members', 'messages'}],
+         'public_keys': [{'user_id', 'public_key', 'version'}]}
+    """
+    if messages is None:
+        messages = getattr(settings, 'CHAT_WARM_MESSAGES', 20)
+    messages = max(0, min(messages, MAX_MESSAGES))
+
+    memberships = list(
+        ConversationMember.objects.filter(
+            user=user
+        ).select_related('conversation').order_by('-conversation__updated_at')[:conversations]
+    )
+    if not memberships:
+        return {'conversations': [], 'public_keys': []}
+    conv_ids = [m.conversation_id for m in memberships]
+
+    by_conversation = {conv_id: [] for conv_id in conv_ids}
+    if messages:
+        rows = Message.objects.filter(
+            conversation_id__in=conv_ids
+        ).annotate(
+            rank=Window(RowNumber(), partition_by=[F('conversation_id')], order_by=F('seq').desc())
+        ).filter(
+            rank__lte=messages
+        ).select_related('sender', 'reply_to').order_by('conversation_id', 'seq')
+        for m in rows:
+            by_conversation[m.conversation_id].append(serialize_message(m))
+
+    members = {conv_id: [] for conv_id in conv_ids}
+    member_ids = set()
+    for conv_id, user_id, username, role in ConversationMember.objects.filter(
+        conversation_id__in=conv_ids
+    ).values_list('conversation_id', 'user_id', 'user__username', 'role'):
+        members[conv_id].append({'user_id': user_id, 'username': username, 'role': role})
+        member_ids.add(user_id)
+
+    keys = UserKeyPair.objects.filter(
+        user_id__in=member_ids
+    ).values_list('user_id', 'public_key', 'version')
+
+    return {
+        'conversations': [{
+            'uuid': str(m.conversation.uuid),
+            'conversation_type': m.conversation.conversation_type,
+            'name': m.conversation.name,
+            'last_seq': m.conversation.last_seq,
+            'unread_count': m.unread_count,
+            'last_read_seq': m.last_read_seq,
+            'members': members[m.conversation_id],
+            'messages': by_conversation[m.conversation_id],
+        } for m in memberships],
+        'public_keys': [
+            {'user_id': user_id, 'public_key': public_key, 'version': version}
+            for user_id, public_key, version in keys
+        ],
+    }
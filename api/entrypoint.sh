@@ -10,7 +10,7 @@ echo "  Ondes Backend — Starting production server"
 echo "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━"
 
 # Créer les répertoires nécessaires
-mkdir -p /app/logs /app/staticfiles /app/media
+mkdir -p /app/logs /app/staticfiles /app/media /app/archive
 
 # ----------------------------------------------------------
 # 1. Wait for PostgreSQL to be ready
@@ -33,6 +33,8 @@ done
 # ----------------------------------------------------------
 echo "[2/4] Applying database migrations..."
 python manage.py migrate --no-input
+# Table du cache partagé (sans effet si le cache n'est pas en base)
+python manage.py createcachetable
 
 # ----------------------------------------------------------
 # 3. Collect static files
@@ -16,10 +16,11 @@ class UserMiniSerializer(serializers.ModelSerializer):
     def get_avatar(self, obj):
         try:
             if obj.profile and obj.profile.avatar:
+                url = obj.profile.avatar_url(96)
                 request = self.context.get('request')
                 if request:
-                    return request.build_absolute_uri(obj.profile.avatar.url)
-                return obj.profile.avatar.url
+                    return request.build_absolute_uri(url)
+                return url
         except UserProfile.DoesNotExist:
             pass
         return f"https://api.dicebear.com/7.x/avataaars/png?seed={obj.username}"
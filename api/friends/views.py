@@ -50,7 +50,7 @@ class FriendsListView(APIView):
             avatar_url = None
             try:
                 if friend.profile and friend.profile.avatar:
-                    avatar_url = request.build_absolute_uri(friend.profile.avatar.url)
+                    avatar_url = request.build_absolute_uri(friend.profile.avatar_url(96))
             except UserProfile.DoesNotExist:
                 pass
             
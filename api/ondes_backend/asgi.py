@@ -16,13 +16,17 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ondes_backend.settings')
 django_asgi_app = get_asgi_application()
 
 # Import après l'initialisation Django
+from chat.outbound import ServerSendMiddleware
 from chat.routing import websocket_urlpatterns
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
-    "websocket": AllowedHostsOriginValidator(
-        AuthMiddlewareStack(
-            URLRouter(websocket_urlpatterns)
+    # ServerSendMiddleware: contre-pression du socket pour la file d'envoi
+    "websocket": ServerSendMiddleware(
+        AllowedHostsOriginValidator(
+            AuthMiddlewareStack(
+                URLRouter(websocket_urlpatterns)
+            )
         )
     ),
 })
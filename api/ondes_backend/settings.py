@@ -30,7 +30,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'store.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_THROTTLE_CLASSES': [
@@ -45,6 +45,10 @@ REST_FRAMEWORK = {
     },
 }
 
+# Cache token → utilisateur, partagé par REST et WebSocket (store/authentication.py)
+AUTH_TOKEN_CACHE_TTL = config('AUTH_TOKEN_CACHE_TTL', default=300, cast=int)  # cache partagé (s)
+AUTH_TOKEN_LOCAL_TTL = config('AUTH_TOKEN_LOCAL_TTL', default=5, cast=float)  # LRU par processus (s), contrôlée par génération
+
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware', # First
     'django.middleware.security.SecurityMiddleware',
@@ -79,12 +83,27 @@ ASGI_APPLICATION = 'ondes_backend.asgi.application'
 
 # Channel Layers Configuration
 _redis_url = config('REDIS_URL', default='')
-if _redis_url:
+# Hôtes du channel layer (plusieurs = répartition des groupes), REDIS_URL par défaut
+_channel_redis_urls = config('CHANNEL_REDIS_URLS', default=_redis_url, cast=Csv())
+# core: une liste Redis par canal; pubsub: un PUBLISH par group_send;
+# postgres: LISTEN/NOTIFY de la base, sans Redis (chat/layers.py)
+CHANNEL_LAYER_BACKEND = config('CHANNEL_LAYER_BACKEND', default='core')
+_channel_backends = {
+    'core': 'channels_redis.core.RedisChannelLayer',
+    'pubsub': 'chat.layers.ShardedPubSubChannelLayer',
+}
+if CHANNEL_LAYER_BACKEND == 'postgres':
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "chat.layers.PostgresChannelLayer",
+        }
+    }
+elif _channel_redis_urls:
     CHANNEL_LAYERS = {
         "default": {
-            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "BACKEND": _channel_backends[CHANNEL_LAYER_BACKEND],
             "CONFIG": {
-                "hosts": [_redis_url],
+                "hosts": _channel_redis_urls,
             },
         }
     }
@@ -95,6 +114,82 @@ else:
         }
     }
 
+# Cache partagé (tables de routage du chat, etc.) — Redis si disponible
+if _redis_url:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': _redis_url,
+        }
+    }
+elif CHANNEL_LAYER_BACKEND == 'postgres':
+    # Plusieurs processus sans Redis: présence et annuaires partagés en base
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# ==================== CHAT ====================
+# Routage des événements temps réel (voir chat/fanout.py):
+# - "conversation": un groupe chat_<uuid> par conversation (join en O(conversations))
+# - "user": un seul groupe user_<id> par connexion, fan-out vers les membres
+CHAT_ROUTING_MODE = config('CHAT_ROUTING_MODE', default='conversation')
+CHAT_MEMBERS_CACHE_TTL = config('CHAT_MEMBERS_CACHE_TTL', default=300, cast=int)
+CHAT_MEMBERSHIP_LOCAL_TTL = config('CHAT_MEMBERSHIP_LOCAL_TTL', default=5, cast=float)  # copie par processus (s), contrôlée par génération
+# Présence (voir chat/presence.py): heartbeat par connexion, expiration sans heartbeat
+CHAT_PRESENCE_HEARTBEAT = config('CHAT_PRESENCE_HEARTBEAT', default=30, cast=int)  # secondes
+CHAT_PRESENCE_TTL = config('CHAT_PRESENCE_TTL', default=75, cast=int)  # secondes
+CHAT_PRESENCE_MAX_DEVICES = config('CHAT_PRESENCE_MAX_DEVICES', default=8, cast=int)  # une clé par connexion
+CHAT_PRESENCE_FANOUT = config('CHAT_PRESENCE_FANOUT', default=False, cast=bool)  # ne servir que les membres en ligne
+CHAT_OFFLINE_QUEUE_TTL = config('CHAT_OFFLINE_QUEUE_TTL', default=7 * 86400, cast=int)
+
+CHAT_WARM_CONVERSATIONS = config('CHAT_WARM_CONVERSATIONS', default=20, cast=int)  # ?warm=1
+CHAT_WARM_MESSAGES = config('CHAT_WARM_MESSAGES', default=20, cast=int)  # par conversation
+
+# Pièces jointes chiffrées (voir chat/attachments.py)
+CHAT_ATTACHMENT_MAX_SIZE = config('CHAT_ATTACHMENT_MAX_SIZE', default=500 * 1024 * 1024, cast=int)  # octets
+CHAT_ATTACHMENT_ACCEL_PREFIX = config('CHAT_ATTACHMENT_ACCEL_PREFIX', default='')  # ex: /protected-media/ (nginx)
+CHAT_ATTACHMENT_URL_TTL = config('CHAT_ATTACHMENT_URL_TTL', default=300, cast=int)  # URL signée S3 (s)
+
+# Historique partitionné par mois, archivé au-delà (voir chat/archive.py)
+CHAT_ARCHIVE_AFTER_MONTHS = config('CHAT_ARCHIVE_AFTER_MONTHS', default=12, cast=int)
+
+# Dernier message / non-lus de la liste recalculés par lots après les envois
+CHAT_LIST_REFRESH_WINDOW = config('CHAT_LIST_REFRESH_WINDOW', default=1.0, cast=float)  # secondes
+# Indicateurs de frappe: état éphémère en cache (TTL), un broadcast par fenêtre
+CHAT_TYPING_TTL = config('CHAT_TYPING_TTL', default=6, cast=int)
+CHAT_TYPING_THROTTLE = config('CHAT_TYPING_THROTTLE', default=3, cast=int)
+CHAT_TYPING_PERSIST = config('CHAT_TYPING_PERSIST', default=False, cast=bool)  # écrire aussi TypingIndicator
+# Accusés de lecture: un événement par (expéditeur, conversation), rafales regroupées
+CHAT_RECEIPT_COALESCE_WINDOW = config('CHAT_RECEIPT_COALESCE_WINDOW', default=0.3, cast=float)  # secondes
+CHAT_RECEIPT_MAX_UUIDS = config('CHAT_RECEIPT_MAX_UUIDS', default=100, cast=int)
+# File d'envoi par connexion: regroupement (?batch=1) et borne pour clients lents
+CHAT_OUTBOUND_BATCH_WINDOW = config('CHAT_OUTBOUND_BATCH_WINDOW', default=0.005, cast=float)  # secondes
+CHAT_OUTBOUND_MAX_BATCH = config('CHAT_OUTBOUND_MAX_BATCH', default=100, cast=int)
+CHAT_OUTBOUND_MAX_QUEUE = config('CHAT_OUTBOUND_MAX_QUEUE', default=500, cast=int)
+# Limitation de débit WebSocket (voir chat/ratelimit.py): seaux à jetons par
+# connexion et par action ("N/période"), admission des connexions par processus
+CHAT_WS_RATES = {
+    '*': config('CHAT_WS_RATE', default='300/minute'),
+    'send_message': config('CHAT_WS_RATE_SEND', default='60/minute'),
+    'get_messages': config('CHAT_WS_RATE_HISTORY', default='30/minute'),
+    'get_public_keys': config('CHAT_WS_RATE_KEYS', default='30/minute'),
+    'sync': config('CHAT_WS_RATE_SYNC', default='10/minute'),
+    'get_presence': config('CHAT_WS_RATE_PRESENCE', default='30/minute'),
+}
+CHAT_WS_MAX_VIOLATIONS = config('CHAT_WS_MAX_VIOLATIONS', default=50, cast=int)  # puis fermeture 4029
+CHAT_WS_CONNECT_RATE = config('CHAT_WS_CONNECT_RATE', default='200/second')
+CHAT_WS_MAX_CONNECTIONS = config('CHAT_WS_MAX_CONNECTIONS', default=0, cast=int)  # 0 = illimité
+CHAT_WS_RETRY_AFTER = config('CHAT_WS_RETRY_AFTER', default=5, cast=int)  # secondes (code 4013)
+
 # Database — SQLite (dev) or PostgreSQL (prod) via env
 DATABASES = {
     'default': {
@@ -137,6 +232,53 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# ==================== MEDIA STORAGE ====================
+# Vide = disque local (MEDIA_ROOT), un seul nœud API.
+# Renseigné = stockage objet compatible S3 (AWS, MinIO, moto) partagé entre
+# plusieurs nœuds API. Voir social/storage.py pour le pipeline média.
+MEDIA_UPLOAD_WORKERS = config('MEDIA_UPLOAD_WORKERS', default=8, cast=int)
+# Archives de l'historique du chat (chat/archive.py): privées, hors
+# MEDIA_ROOT, jamais servies par nginx ni parcourues par media_gc
+CHAT_ARCHIVE_ROOT = config('CHAT_ARCHIVE_ROOT', default=os.path.join(BASE_DIR, 'archive'))
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'chat_archive': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': CHAT_ARCHIVE_ROOT},
+    },
+}
+AWS_STORAGE_BUCKET_NAME = config('AWS_STORAGE_BUCKET_NAME', default='')
+if AWS_STORAGE_BUCKET_NAME:
+    from boto3.s3.transfer import TransferConfig
+
+    STORAGES['default'] = {'BACKEND': 'storages.backends.s3.S3Storage'}
+    # Objets privés (URL signées), hors du domaine public du CDN
+    STORAGES['chat_archive'] = {
+        'BACKEND': 'storages.backends.s3.S3Storage',
+        'OPTIONS': {
+            'bucket_name': config('CHAT_ARCHIVE_BUCKET_NAME', default=AWS_STORAGE_BUCKET_NAME),
+            'location': 'chat-archive',
+            'default_acl': 'private',
+            'querystring_auth': True,
+            'custom_domain': None,
+        },
+    }
+    AWS_S3_ENDPOINT_URL = config('AWS_S3_ENDPOINT_URL', default=None)  # ex: http://minio:9000
+    AWS_S3_ACCESS_KEY_ID = config('AWS_S3_ACCESS_KEY_ID', default=None)
+    AWS_S3_SECRET_ACCESS_KEY = config('AWS_S3_SECRET_ACCESS_KEY', default=None)
+    AWS_S3_REGION_NAME = config('AWS_S3_REGION_NAME', default=None)
+    AWS_S3_CUSTOM_DOMAIN = config('AWS_S3_CUSTOM_DOMAIN', default=None)  # CDN public
+    AWS_S3_ADDRESSING_STYLE = config('AWS_S3_ADDRESSING_STYLE', default='path' if AWS_S3_ENDPOINT_URL else None)
+    AWS_QUERYSTRING_AUTH = False
+    AWS_S3_FILE_OVERWRITE = False
+    # Multipart parallèle au-delà de 8 MB (segments HLS, zips, vidéos)
+    AWS_S3_TRANSFER_CONFIG = TransferConfig(
+        multipart_threshold=8 * 1024 * 1024,
+        multipart_chunksize=8 * 1024 * 1024,
+        max_concurrency=MEDIA_UPLOAD_WORKERS,
+    )
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # ==================== CORS ====================
@@ -243,5 +385,7 @@ STRIPE_CREDIT_PACK_PRICE_ID = config('STRIPE_CREDIT_PACK_PRICE_ID', default='')
 
 # ==================== FILE UPLOAD LIMITS ====================
 DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50 MB
-FILE_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50 MB
+# Au-delà, les fichiers (et sous ASGI le corps des requêtes) passent par
+# un fichier temporaire plutôt que la mémoire du processus
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5 MB (défaut Django)
 MAX_ZIP_UPLOAD_SIZE = 100 * 1024 * 1024  # 100 MB for app zips
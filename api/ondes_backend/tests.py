@@ -0,0 +1,52 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from ondes_backend.tiered_cache import TieredCache
+
+
+@override_settings(TEST_TTL=60, TEST_LOCAL_TTL=60)
+class TieredCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.loads = []
+
+    def worker(self, **kwargs):
+        return TieredCache('TEST_TTL', 'TEST_LOCAL_TTL', **kwargs)
+
+    def load(self, value):
+        def load():
+            self.loads.append(value)
+            return value
+        return load
+
+    def test_local_hit_checks_shared_generation(self):
+        a, b = self.worker(), self.worker()  # deux processus, un cache partagé
+        self.assertEqual(a.get('k', self.load('v1')), 'v1')
+        self.assertEqual(b.get('k', self.load('unused')), 'v1')
+        self.assertEqual(self.loads, ['v1'])
+
+        a.invalidate('k')
+        # La copie locale de b n'a pas expiré mais sa génération est périmée
+        self.assertEqual(b.get('k', self.load('v2')), 'v2')
+        self.assertEqual(a.get('k', self.load('unused')), 'v2')
+        self.assertEqual(self.loads, ['v1', 'v2'])
+
+    def test_local_copy_skips_shared_entry(self):
+        a = self.worker()
+        a.get('k', self.load('v1'))
+        cache.delete('k')  # seule la génération est relue
+        self.assertEqual(a.get('k', self.load('v2')), 'v1')
+
+    def test_missing_entries_are_not_cached(self):
+        a = self.worker()
+        self.assertIsNone(a.get('k', self.load(None)))
+        self.assertEqual(a.get('k', self.load('v')), 'v')
+
+    def test_lru_eviction(self):
+        a = self.worker(max_entries=2)
+        a.get('x', self.load('x'))
+        a.get('y', self.load('y'))
+        a.get('x', self.load('unused'))  # x devient le plus récent
+        a.get('z', self.load('z'))
+        self.assertEqual(list(a._local), ['x', 'z'])
@@ -0,0 +1,97 @@
+"""
+Cache à deux niveaux pour des entrées lues à chaque requête
+
+- cache Django partagé (Redis en production), TTL réglable;
+- LRU locale au processus, très courte, qui évite un aller-retour et une
+  désérialisation par lecture.
+
+Une invalidation ne vide la LRU que du processus qui la reçoit: elle
+écrit aussi une génération partagée (jeton aléatoire, `<clé>:generation`)
+que chaque LRU vérifie avant de servir une entrée (un GET d'une petite
+clé). Une entrée invalidée n'est donc plus servie par aucun processus,
+sans attendre l'expiration locale. La génération survit aux entrées
+locales qui l'ont lue: elle expire après elles.
+
+Utilisé par l'annuaire du chat (chat/membership.py) et l'authentification
+par token (store/authentication.py).
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def generation_key(key):
+    return f"{key}:generation"
+
+
+class TieredCache:
+    """
+    Args:
+        ttl_setting: réglage du TTL partagé (secondes)
+        local_ttl_setting: réglage du TTL local (secondes)
+        max_entries: taille de la LRU locale
+    """
+
+    def __init__(self, ttl_setting, local_ttl_setting, ttl=300, local_ttl=5, max_entries=10000):
+        self.ttl_setting = ttl_setting
+        self.local_ttl_setting = local_ttl_setting
+        self.default_ttl = ttl
+        self.default_local_ttl = local_ttl
+        self.max_entries = max_entries
+        self._local = OrderedDict()  # clé -> (expiration, génération, entrée), du moins au plus récent
+        self._lock = threading.Lock()
+
+    def ttl(self):
+        return getattr(settings, self.ttl_setting, self.default_ttl)
+
+    def local_ttl(self):
+        return getattr(settings, self.local_ttl_setting, self.default_local_ttl)
+
+    def get(self, key, load):
+        """Entrée de `key`; `load()` la lit en base au besoin (None: pas d'entrée, rien en cache)"""
+        now = time.monotonic()
+        with self._lock:
+            hit = self._local.get(key)
+        if hit and hit[0] > now and cache.get(generation_key(key)) == hit[1]:
+            with self._lock:
+                if key in self._local:
+                    self._local.move_to_end(key)
+            return hit[2]
+
+        found = cache.get_many([key, generation_key(key)])
+        entry, generation = found.get(key), found.get(generation_key(key))
+        if entry is None:
+            entry = load()
+            if entry is None:
+                return None
+            cache.set(key, entry, self.ttl())
+
+        with self._lock:
+            self._local[key] = (now + self.local_ttl(), generation, entry)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+        return entry
+
+    def _invalidate(self, key):
+        with self._lock:
+            self._local.pop(key, None)
+        cache.delete(key)
+        cache.set(generation_key(key), uuid.uuid4().hex, int(self.local_ttl()) + 60)
+
+    def invalidate(self, key):
+        """
+        Invalide maintenant puis au commit: une relecture avant le commit
+        aurait remis l'ancienne entrée en cache.
+        """
+        self._invalidate(key)
+        transaction.on_commit(lambda: self._invalidate(key))
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from .models import (
-    Follow, Post, PostMedia, PostLike, PostComment, 
+    Follow, Post, PostMedia, MediaBlob, PostLike, PostComment, 
     CommentLike, Story, StoryView, Bookmark
 )
 
@@ -34,6 +34,15 @@ class PostMediaAdmin(admin.ModelAdmin):
     list_display = ['uuid', 'post', 'media_type', 'processing_status', 'hls_ready', 'created_at']
     list_filter = ['media_type', 'processing_status', 'hls_ready']
     readonly_fields = ['uuid', 'width', 'height', 'duration', 'file_size']
+    raw_id_fields = ['post', 'blob']
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ['sha256', 'media_type', 'ref_count', 'processing_status', 'hls_ready', 'created_at']
+    list_filter = ['media_type', 'processing_status', 'hls_ready']
+    search_fields = ['sha256']
+    readonly_fields = ['sha256', 'ref_count', 'width', 'height', 'duration', 'file_size']
 
 
 @admin.register(PostLike)
@@ -0,0 +1,120 @@
+"""
+Encodeur BlurHash (https://blurha.sh) en Python pur.
+
+Produit une chaîne d'une trentaine de caractères décrivant une version très
+floue de l'image, décodable côté client pour afficher un placeholder avant
+le téléchargement de l'image réelle. L'encodage travaille sur une image
+réduite (32 px) : quelques millisecondes par média.
+"""
+import math
+
+from PIL import Image
+
+BASE83_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+SAMPLE_SIZE = 32
+
+
+def _encode83(value, length):
+    result = ''
+    for i in range(1, length + 1):
+        digit = (value // (83 ** (length - i))) % 83
+        result += BASE83_CHARS[digit]
+    return result
+
+
+def _srgb_to_linear(value):
+    v = value / 255
+    if v <= 0.04045:
+        return v / 12.92
+    return ((v + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value):
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value, exp):
+    return math.copysign(abs(value) ** exp, value)
+
+
+def encode(image, x_components=4, y_components=3):
+    """
+    Encode une image PIL en BlurHash.
+
+    Args:
+        image: Image PIL (déjà décodée, n'importe quelle taille)
+        x_components: Composantes horizontales (1-9)
+        y_components: Composantes verticales (1-9)
+
+    Returns:
+        str: chaîne BlurHash
+    """
+    img = image.convert('RGB')
+    img.thumbnail((SAMPLE_SIZE, SAMPLE_SIZE))
+    width, height = img.size
+    pixels = [
+        tuple(_srgb_to_linear(c) for c in px)
+        for px in img.getdata()
+    ]
+
+    # Tables de cosinus précalculées
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(x_components)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(y_components)]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            normalisation = 1 if i == 0 and j == 0 else 2
+            r = g = b = 0.0
+            for y in range(height):
+                cy = cos_y[j][y]
+                row = y * width
+                for x in range(width):
+                    basis = cos_x[i][x] * cy
+                    pr, pg, pb = pixels[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = normalisation / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _encode83((x_components - 1) + (y_components - 1) * 9, 1)
+
+    if ac:
+        actual_max = max(abs(v) for factor in ac for v in factor)
+        quantised_max = max(0, min(82, math.floor(actual_max * 166 - 0.5)))
+        maximum_value = (quantised_max + 1) / 166
+    else:
+        quantised_max = 0
+        maximum_value = 1
+    result += _encode83(quantised_max, 1)
+
+    dc_value = (_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2])
+    result += _encode83(dc_value, 4)
+
+    for factor in ac:
+        quant = [
+            max(0, min(18, math.floor(_sign_pow(v / maximum_value, 0.5) * 9 + 9.5)))
+            for v in factor
+        ]
+        result += _encode83(quant[0] * 19 * 19 + quant[1] * 19 + quant[2], 2)
+
+    return result
+
+
+def dominant_color(image, colors=5):
+    """
+    Couleur dominante d'une image PIL, au format hex (#rrggbb).
+    Quantification median-cut sur une version réduite.
+    """
+    img = image.convert('RGB')
+    img.thumbnail((64, 64))
+    quantized = img.quantize(colors=colors, method=Image.Quantize.MEDIANCUT)
+    palette = quantized.getpalette()
+    count, index = max(quantized.getcolors())
+    r, g, b = palette[index * 3:index * 3 + 3]
+    return f"#{r:02x}{g:02x}{b:02x}"
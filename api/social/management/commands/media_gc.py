@@ -0,0 +1,191 @@
+"""
+media_gc — Ramasse-miettes des fichiers médias orphelins.
+
+Parcourt le stockage média (MEDIA_ROOT ou bucket S3) en ordre trié et le
+compare, par jointure triée en streaming, aux noms référencés par tous les
+FileField/ImageField de toutes les apps, plus les colonnes ordinaires
+déclarées dans EXTRA_REFERENCES et les rendus d'avatar (JSONField). Aucun
+ensemble complet n'est chargé en mémoire : chaque côté est un itérateur trié.
+
+Un nouveau champ qui stocke un nom de fichier sans être un FileField doit
+être ajouté à EXTRA_REFERENCES, sans quoi ses fichiers seront supprimés.
+
+Usage:
+    python manage.py media_gc                     # dry-run
+    python manage.py media_gc --delete            # suppression
+    python manage.py media_gc --quarantine        # déplacement sous .quarantine/
+    python manage.py media_gc --prefix posts      # limiter à un sous-arbre
+    python manage.py media_gc --keep-versions 3   # rétention des zips AppVersion
+"""
+import heapq
+import posixpath
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connection, models
+from django.db.models.functions import Collate
+from django.utils import timezone
+
+from social.storage import walk, move
+
+QUARANTINE_PREFIX = '.quarantine'
+
+# Noms de stockage gardés hors FileField ("app.Modèle", champ)
+EXTRA_REFERENCES = [
+    ('chat.MessageArchive', 'path'),  # archives écrites sous chat/archive/ du stockage média
+]
+
+# Collation binaire: l'ordre SQL doit être celui des str Python
+BINARY_COLLATIONS = {'postgresql': 'C', 'sqlite': 'BINARY'}
+
+
+def _reference_key(name):
+    """
+    Clé de jointure d'un nom référencé. Une playlist HLS référence tout
+    son dossier (variantes et segments): elle devient un préfixe "dir/".
+    """
+    if name.endswith('.m3u8'):
+        return posixpath.dirname(name) + '/'
+    return name
+
+
+def _field_references(model, field_name, chunk_size):
+    """Noms référencés par un champ fichier, triés côté base"""
+    queryset = model._base_manager.exclude(**{field_name: ''}).exclude(**{f"{field_name}__isnull": True})
+    collation = BINARY_COLLATIONS.get(connection.vendor)
+    order = Collate(field_name, collation) if collation else field_name
+    names = queryset.order_by(order).values_list(field_name, flat=True)
+    for name in names.iterator(chunk_size=chunk_size):
+        yield _reference_key(name)
+
+
+def _avatar_rendition_references(chunk_size):
+    """
+    Rendus d'avatar (référencés dans un JSONField, pas un FileField).
+    Quelques noms par profil: tri en mémoire.
+    """
+    from store.models import UserProfile
+
+    renditions = UserProfile.objects.exclude(avatar_renditions={}).values_list('avatar_renditions', flat=True)
+    names = [
+        name
+        for value in renditions.iterator(chunk_size=chunk_size)
+        for formats in value.values()
+        for name in formats.values()
+    ]
+    yield from sorted(names)
+
+
+def iter_references(chunk_size=2000):
+    """Fusion triée (heapq.merge) des noms référencés par tous les modèles"""
+    streams = [_avatar_rendition_references(chunk_size)]
+    for label, field_name in EXTRA_REFERENCES:
+        streams.append(_field_references(apps.get_model(label), field_name, chunk_size))
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, models.FileField) and field.concrete:
+                streams.append(_field_references(model, field.name, chunk_size))
+    return heapq.merge(*streams)
+
+
+def iter_orphans(stored, references):
+    """
+    Jointure triée: fichiers stockés absents des références.
+    Les deux itérateurs doivent être triés dans le même ordre.
+    """
+    ref = next(references, None)
+    prefixes = []  # préfixes HLS couvrant le fichier courant
+    for name in stored:
+        while ref is not None and ref < name:
+            if ref.endswith('/'):
+                prefixes.append(ref)
+            ref = next(references, None)
+        # Un préfixe qui ne couvre pas ce fichier ne couvrira aucun suivant
+        while prefixes and not name.startswith(prefixes[-1]):
+            prefixes.pop()
+        if ref == name or prefixes:
+            continue
+        yield name
+
+
+class Command(BaseCommand):
+    help = "Supprime ou met en quarantaine les fichiers médias qui ne sont plus référencés"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='', help="Sous-arbre à parcourir (ex: posts, blobs/ab)")
+        parser.add_argument('--grace-hours', type=int, default=24,
+                            help="Ignorer les fichiers plus récents (uploads en cours)")
+        action = parser.add_mutually_exclusive_group()
+        action.add_argument('--delete', action='store_true', help="Supprimer les orphelins")
+        action.add_argument('--quarantine', action='store_true',
+                            help=f"Déplacer les orphelins sous {QUARANTINE_PREFIX}/<date>/")
+        parser.add_argument('--keep-versions', type=int, default=None,
+                            help="Conserver N versions inactives par app (les plus récentes)")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        apply = options['delete'] or options['quarantine']
+        if not apply:
+            self.stdout.write("Dry-run: aucun fichier ne sera modifié (--delete ou --quarantine)")
+
+        if options['keep_versions'] is not None:
+            self.apply_version_retention(options['keep_versions'], apply)
+
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        quarantine_root = f"{QUARANTINE_PREFIX}/{timezone.now():%Y%m%d-%H%M%S}"
+        prefix = options['prefix'].strip('/')
+
+        stored = (
+            name for name in walk(prefix)
+            if not name.startswith(f"{QUARANTINE_PREFIX}/")
+        )
+        references = iter_references(options['chunk_size'])
+        if prefix:
+            references = (ref for ref in references if ref.startswith(prefix) or prefix.startswith(ref))
+
+        orphans = recent = processed = freed = 0
+        for name in iter_orphans(stored, references):
+            orphans += 1
+            try:
+                if default_storage.get_modified_time(name) > cutoff:
+                    recent += 1
+                    continue
+                size = default_storage.size(name)
+                if options['delete']:
+                    default_storage.delete(name)
+                elif options['quarantine']:
+                    move(name, f"{quarantine_root}/{name}")
+            except FileNotFoundError:
+                continue
+            processed += 1
+            freed += size
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {name}")
+
+        verb = 'supprimés' if options['delete'] else 'mis en quarantaine' if options['quarantine'] else 'à traiter'
+        self.stdout.write(self.style.SUCCESS(
+            f"{orphans} orphelins, {recent} trop récents, {processed} {verb} "
+            f"({freed / (1024 * 1024):.1f} MB)"
+        ))
+
+    def apply_version_retention(self, keep, apply):
+        """Supprime les AppVersion inactives au-delà des `keep` plus récentes par app"""
+        from store.models import AppVersion
+
+        removed = 0
+        current_app, kept = None, 0
+        versions = AppVersion.objects.filter(is_active=False).order_by('app_id', '-created_at')
+        for version in versions.iterator(chunk_size=500):
+            if version.app_id != current_app:
+                current_app, kept = version.app_id, 0
+            if kept < keep:
+                kept += 1
+                continue
+            removed += 1
+            if apply:
+                if version.zip_file:
+                    version.zip_file.delete(save=False)
+                version.delete()
+        self.stdout.write(f"Rétention AppVersion: {removed} versions inactives au-delà de {keep} par app")
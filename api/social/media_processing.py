@@ -2,19 +2,25 @@
 Utilitaires de traitement média pour Ondes Social.
 - Compression d'images (PIL/Pillow)
 - Conversion HLS pour vidéos (FFmpeg)
+- Hash de contenu pour la déduplication (MediaBlob)
+- Rendus d'avatar (48/96/256 px, WebP + JPEG)
+
+Les fichiers sont lus et écrits via social.storage (disque local ou S3).
 """
 import os
+import hashlib
 import subprocess
 import uuid
-import tempfile
-import shutil
 from pathlib import Path
-from PIL import Image
-from django.conf import settings
+from PIL import Image, ImageOps
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 import io
 import logging
 
+from . import blurhash
+from .storage import open_local, output_dir, publish_directory, delete_prefix
+
 logger = logging.getLogger('social')
 
 
@@ -117,6 +123,21 @@ class ImageProcessor:
         """
         Compresse et retourne les bytes de l'image (pour stockage Django).
         """
+        compressed_bytes, new_width, new_height, _ = ImageProcessor.compress_with_placeholder(
+            image_path, max_width, max_height, quality, placeholder=False
+        )
+        return compressed_bytes, new_width, new_height
+    
+    @staticmethod
+    def compress_with_placeholder(image_path, max_width=None, max_height=None, quality=None,
+                                  placeholder=True):
+        """
+        Compresse l'image et calcule son placeholder à partir de la même
+        image décodée (un seul décodage).
+        
+        Returns:
+            tuple: (bytes, width, height, placeholder dict ou None)
+        """
         max_width = max_width or ImageProcessor.MAX_WIDTH
         max_height = max_height or ImageProcessor.MAX_HEIGHT
         quality = quality or ImageProcessor.QUALITY
@@ -139,7 +160,30 @@ class ImageProcessor:
             img.save(buffer, 'JPEG', quality=quality, optimize=True)
             buffer.seek(0)
             
-            return buffer.getvalue(), new_width, new_height
+            placeholder_data = ImageProcessor.placeholder(img) if placeholder else None
+            return buffer.getvalue(), new_width, new_height, placeholder_data
+    
+    @staticmethod
+    def placeholder(img):
+        """
+        Données de premier affichage pour une image PIL déjà décodée.
+        
+        Returns:
+            dict: {blurhash, dominant_color, aspect_ratio}
+        """
+        width, height = img.size
+        return {
+            'blurhash': blurhash.encode(img),
+            'dominant_color': blurhash.dominant_color(img),
+            'aspect_ratio': round(width / height, 4) if height else None,
+        }
+    
+    @staticmethod
+    def placeholder_from_path(image_path):
+        """Placeholder depuis un fichier (ex: frame extraite d'une vidéo)"""
+        with Image.open(image_path) as img:
+            img.draft('RGB', (ImageProcessor.THUMBNAIL_SIZE[0], ImageProcessor.THUMBNAIL_SIZE[1]))
+            return ImageProcessor.placeholder(img)
 
 
 class VideoProcessor:
@@ -371,78 +415,57 @@ class VideoProcessor:
                 f.write(f'{v["relative_path"]}\n')
 
 
-def process_post_media(post_media_instance):
+def hash_uploaded_file(uploaded_file):
     """
-    Traite un média de post (compression image ou conversion HLS vidéo).
-    Cette fonction est appelée de manière asynchrone après l'upload.
-    
-    Args:
-        post_media_instance: Instance de PostMedia
+    Calcule le SHA-256 d'un fichier uploadé en une seule passe, par chunks,
+    sans le charger entièrement en mémoire.
+
+    Returns:
+        str: hash hexadécimal
+    """
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def delete_media_prefix(prefix):
+    """Supprime un dossier du stockage média (blob, post ou story)"""
+    try:
+        delete_prefix(prefix)
+        logger.info(f"Deleted media prefix: {prefix}")
+    except Exception as e:
+        logger.error(f"Error deleting media prefix {prefix}: {e}")
+
+
+def _convert_to_hls(original_path, hls_prefix, adaptive=True):
+    """
+    Conversion HLS puis publication sous `hls_prefix`.
+
+    Returns:
+        tuple: (nom de stockage du playlist ou None, résultat de convert_to_hls)
+    """
+    with output_dir(hls_prefix) as workdir:
+        result = VideoProcessor.convert_to_hls(original_path, workdir, adaptive=adaptive)
+        if not result['success']:
+            return None, result
+        publish_directory(workdir, hls_prefix)
+        relative = os.path.relpath(result['playlist'], workdir).replace(os.sep, '/')
+    return f"{hls_prefix}/{relative}", result
+
+
+def _process_media(media, hls_prefix):
+    """
+    Compression image ou conversion HLS vidéo pour un PostMedia ou un MediaBlob
+    (les deux exposent les mêmes champs de rendu).
     """
-    from .models import PostMedia
-    
-    media = post_media_instance
     media.processing_status = 'processing'
     media.save(update_fields=['processing_status'])
     
     try:
-        original_path = media.original_file.path
-        
-        if media.media_type == 'image':
-            # Compression de l'image
-            compressed_bytes, width, height = ImageProcessor.compress_to_bytes(original_path)
-            
-            # Sauvegarder l'image compressée
-            compressed_name = f"compressed_{uuid.uuid4().hex[:8]}.jpg"
-            media.compressed_file.save(compressed_name, ContentFile(compressed_bytes), save=False)
-            
-            # Créer la miniature
-            thumb_path, _, _ = ImageProcessor.create_thumbnail(original_path)
-            if thumb_path:
-                with open(thumb_path, 'rb') as f:
-                    thumb_name = f"thumb_{uuid.uuid4().hex[:8]}.jpg"
-                    media.thumbnail.save(thumb_name, ContentFile(f.read()), save=False)
-                os.remove(thumb_path)
-            
-            media.width = width
-            media.height = height
-            media.file_size = len(compressed_bytes)
-            media.processing_status = 'completed'
-        
-        elif media.media_type == 'video':
-            # Récupérer les infos vidéo
-            info = VideoProcessor.get_video_info(original_path)
-            media.width = info.get('width')
-            media.height = info.get('height')
-            media.duration = info.get('duration')
-            media.file_size = os.path.getsize(original_path)
-            
-            # Créer la miniature
-            thumb_path = VideoProcessor.create_thumbnail(original_path)
-            if thumb_path:
-                with open(thumb_path, 'rb') as f:
-                    thumb_name = f"thumb_{uuid.uuid4().hex[:8]}.jpg"
-                    media.thumbnail.save(thumb_name, ContentFile(f.read()), save=False)
-                os.remove(thumb_path)
-            
-            # Conversion HLS
-            hls_output_dir = os.path.join(
-                settings.MEDIA_ROOT,
-                f"posts/{media.post.author.id}/{media.post.uuid}/hls"
-            )
-            
-            result = VideoProcessor.convert_to_hls(original_path, hls_output_dir)
-            
-            if result['success']:
-                # Stocker le chemin relatif du master playlist
-                relative_path = os.path.relpath(result['playlist'], settings.MEDIA_ROOT)
-                media.hls_playlist.name = relative_path
-                media.hls_ready = True
-                media.processing_status = 'completed'
-            else:
-                media.processing_error = result.get('error', 'Unknown error')
-                media.processing_status = 'failed'
-        
+        with open_local(media.original_file) as original_path:
+            _render(media, original_path, hls_prefix)
         media.save()
         
     except Exception as e:
@@ -452,9 +475,104 @@ def process_post_media(post_media_instance):
         raise
 
 
+def _apply_placeholder(target, placeholder):
+    """Copie blurhash / couleur dominante / ratio sur un modèle"""
+    if not placeholder:
+        return
+    target.blurhash = placeholder['blurhash']
+    target.dominant_color = placeholder['dominant_color']
+    target.aspect_ratio = placeholder['aspect_ratio']
+
+
+def _render(media, original_path, hls_prefix):
+    """Génère les rendus à partir d'une copie locale de l'original"""
+    if media.media_type == 'image':
+        # Compression de l'image + placeholder (blurhash, couleur, ratio)
+        compressed_bytes, width, height, placeholder = ImageProcessor.compress_with_placeholder(
+            original_path
+        )
+        _apply_placeholder(media, placeholder)
+        
+        # Sauvegarder l'image compressée
+        compressed_name = f"compressed_{uuid.uuid4().hex[:8]}.jpg"
+        media.compressed_file.save(compressed_name, ContentFile(compressed_bytes), save=False)
+        
+        # Créer la miniature
+        thumb_path, _, _ = ImageProcessor.create_thumbnail(original_path)
+        if thumb_path:
+            with open(thumb_path, 'rb') as f:
+                thumb_name = f"thumb_{uuid.uuid4().hex[:8]}.jpg"
+                media.thumbnail.save(thumb_name, ContentFile(f.read()), save=False)
+            os.remove(thumb_path)
+        
+        media.width = width
+        media.height = height
+        media.file_size = len(compressed_bytes)
+        media.processing_status = 'completed'
+    
+    elif media.media_type == 'video':
+        # Récupérer les infos vidéo
+        info = VideoProcessor.get_video_info(original_path)
+        media.width = info.get('width')
+        media.height = info.get('height')
+        media.duration = info.get('duration')
+        media.file_size = os.path.getsize(original_path)
+        
+        # Créer la miniature (et le placeholder à partir de cette frame)
+        thumb_path = VideoProcessor.create_thumbnail(original_path)
+        if thumb_path:
+            _apply_placeholder(media, ImageProcessor.placeholder_from_path(thumb_path))
+            with open(thumb_path, 'rb') as f:
+                thumb_name = f"thumb_{uuid.uuid4().hex[:8]}.jpg"
+                media.thumbnail.save(thumb_name, ContentFile(f.read()), save=False)
+            os.remove(thumb_path)
+        if media.width and media.height:
+            media.aspect_ratio = round(media.width / media.height, 4)
+        
+        # Conversion HLS
+        playlist_name, result = _convert_to_hls(original_path, hls_prefix)
+        
+        if playlist_name:
+            media.hls_playlist.name = playlist_name
+            media.hls_ready = True
+            media.processing_status = 'completed'
+        else:
+            media.processing_error = result.get('error', 'Unknown error')
+            media.processing_status = 'failed'
+
+
+def process_post_media(post_media_instance):
+    """
+    Traite un média de post (compression image ou conversion HLS vidéo).
+    Cette fonction est appelée de manière asynchrone après l'upload.
+    
+    Si le média pointe vers un blob déjà traité (upload en double), aucun
+    transcodage n'est relancé: les rendus partagés ont déjà été recopiés
+    à la création du PostMedia.
+    
+    Args:
+        post_media_instance: Instance de PostMedia
+    """
+    media = post_media_instance
+    blob = media.blob
+    
+    if blob is None:
+        _process_media(media, f"posts/{media.post.author.id}/{media.post.uuid}/hls")
+        return
+    
+    if blob.processing_status == 'completed':
+        return
+    
+    try:
+        _process_media(blob, f"{blob.storage_prefix}/hls")
+    finally:
+        blob.propagate_renditions()
+        media.refresh_from_db()
+
+
 def process_story_media(story_instance):
     """
-    Traite le média d'une story (compression image ou conversion HLS vidéo).
+    Traite le média d'une story (placeholder et conversion HLS vidéo).
     Cette fonction est appelée de manière asynchrone après la création.
     
     Args:
@@ -465,25 +583,114 @@ def process_story_media(story_instance):
     story = story_instance
     
     try:
-        original_path = story.media.path
-        
-        if story.media_type == 'video':
-            # Conversion HLS pour les vidéos de stories
-            hls_output_dir = os.path.join(
-                settings.MEDIA_ROOT,
-                f"stories/{story.author.id}/{story.uuid}/hls"
-            )
+        with open_local(story.media) as original_path:
+            if story.media_type == 'image':
+                _apply_placeholder(story, ImageProcessor.placeholder_from_path(original_path))
+                story.save(update_fields=['blurhash', 'dominant_color', 'aspect_ratio'])
+                return
             
-            result = VideoProcessor.convert_to_hls(original_path, hls_output_dir, adaptive=False)
+            # Placeholder depuis la première frame
+            thumb_path = VideoProcessor.create_thumbnail(original_path)
+            if thumb_path:
+                _apply_placeholder(story, ImageProcessor.placeholder_from_path(thumb_path))
+                os.remove(thumb_path)
+                story.save(update_fields=['blurhash', 'dominant_color', 'aspect_ratio'])
             
-            if result['success']:
-                # Stocker le chemin relatif du playlist
-                relative_path = os.path.relpath(result['playlist'], settings.MEDIA_ROOT)
-                story.hls_playlist.name = relative_path
-                story.hls_ready = True
-                story.save(update_fields=['hls_playlist', 'hls_ready'])
-            else:
-                logger.warning(f"Story HLS conversion failed: {result.get('error')}")
+            # Conversion HLS pour les vidéos de stories
+            playlist_name, result = _convert_to_hls(
+                original_path,
+                f"stories/{story.author.id}/{story.uuid}/hls",
+                adaptive=False
+            )
+        
+        if playlist_name:
+            story.hls_playlist.name = playlist_name
+            story.hls_ready = True
+            story.save(update_fields=['hls_playlist', 'hls_ready'])
+        else:
+            logger.warning(f"Story HLS conversion failed: {result.get('error')}")
                 
     except Exception as e:
         logger.error(f"Error processing story media: {e}")
+
+
+AVATAR_FORMATS = (
+    ('webp', 'WEBP', 'webp', {'quality': 80, 'method': 6}),
+    ('jpeg', 'JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+)
+
+
+def avatar_renditions_prefix(profile):
+    """Dossier des rendus d'un profil (jamais partagé entre profils)"""
+    return f"avatars/renditions/{profile.pk}"
+
+
+def process_avatar(profile):
+    """
+    Génère les rendus d'un avatar (UserProfile.AVATAR_SIZES, WebP + JPEG).
+    Les noms sont adressés par contenu dans le dossier du profil
+    (`avatars/renditions/<profil>/<hash>_<size>.<ext>`) donc immuables et
+    cachables indéfiniment ; un rendu identique n'est jamais réécrit.
+    Une source plus petite qu'une taille n'est pas agrandie: le rendu est
+    plafonné à la taille de la source.
+    
+    Les anciens rendus sont effacés du profil avant le traitement: en cas
+    d'échec, c'est le nouvel original qui est servi.
+    
+    Args:
+        profile: Instance de store.UserProfile
+    """
+    previous = {
+        name
+        for formats in (profile.avatar_renditions or {}).values()
+        for name in formats.values()
+    }
+    update_fields = ['avatar_renditions', 'avatar_blurhash', 'avatar_dominant_color']
+    profile.avatar_renditions = {}
+    profile.avatar_blurhash = ''
+    profile.avatar_dominant_color = ''
+    profile.save(update_fields=update_fields)
+    
+    prefix = avatar_renditions_prefix(profile)
+    renditions = {}
+    try:
+        if profile.avatar:
+            with open_local(profile.avatar) as original_path, Image.open(original_path) as img:
+                # Photos de téléphone: appliquer l'orientation EXIF avant le recadrage
+                img = ImageOps.exif_transpose(img).convert('RGB')
+                min_dim = min(img.size)
+                img = ImageOps.fit(img, (min_dim, min_dim), Image.Resampling.LANCZOS)
+                placeholder = ImageProcessor.placeholder(img)
+                
+                rendered = {}  # taille réelle -> {format: nom}
+                for size in profile.AVATAR_SIZES:
+                    actual = min(size, min_dim)
+                    if actual not in rendered:
+                        resized = img.resize((actual, actual), Image.Resampling.LANCZOS)
+                        rendered[actual] = {}
+                        for key, pil_format, ext, options in AVATAR_FORMATS:
+                            buffer = io.BytesIO()
+                            resized.save(buffer, pil_format, **options)
+                            data = buffer.getvalue()
+                            digest = hashlib.sha256(data).hexdigest()[:16]
+                            name = f"{prefix}/{digest}_{actual}.{ext}"
+                            if not default_storage.exists(name):
+                                name = default_storage.save(name, ContentFile(data))
+                            rendered[actual][key] = name
+                    renditions[str(size)] = rendered[actual]
+            
+            profile.avatar_renditions = renditions
+            profile.avatar_blurhash = placeholder['blurhash']
+            profile.avatar_dominant_color = placeholder['dominant_color']
+            profile.save(update_fields=update_fields)
+    finally:
+        # Rendus de l'ancien avatar. Les noms hors du dossier du profil
+        # (ancien schéma, potentiellement partagés) sont laissés à media_gc.
+        current = {name for formats in renditions.values() for name in formats.values()}
+        for name in previous - current:
+            if not name.startswith(f"{prefix}/"):
+                continue
+            try:
+                default_storage.delete(name)
+            except Exception as e:
+                logger.warning(f"Error deleting avatar rendition {name}: {e}")
@@ -0,0 +1,66 @@
+# Generated by Django 5.0.1 on 2026-10-19 03:50
+
+import django.core.validators
+import django.db.models.deletion
+import social.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0002_story_social_stor_expires_2883fe_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('media_type', models.CharField(choices=[('image', 'Image'), ('video', 'Video')], max_length=10, verbose_name='Type')),
+                ('original_file', models.FileField(max_length=255, upload_to=social.models.blob_upload_path, verbose_name='Fichier original')),
+                ('compressed_file', models.FileField(blank=True, max_length=255, null=True, upload_to=social.models.blob_rendition_upload_path)),
+                ('thumbnail', models.ImageField(blank=True, max_length=255, null=True, upload_to=social.models.blob_rendition_upload_path)),
+                ('hls_playlist', models.FileField(blank=True, max_length=255, null=True, upload_to='')),
+                ('hls_ready', models.BooleanField(default=False)),
+                ('processing_status', models.CharField(choices=[('pending', 'En attente'), ('processing', 'En cours'), ('completed', 'Terminé'), ('failed', 'Échec')], default='pending', max_length=20)),
+                ('processing_error', models.TextField(blank=True)),
+                ('width', models.PositiveIntegerField(blank=True, null=True)),
+                ('height', models.PositiveIntegerField(blank=True, null=True)),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('file_size', models.PositiveIntegerField(blank=True, null=True)),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='Références')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Blob média',
+                'verbose_name_plural': 'Blobs médias',
+            },
+        ),
+        migrations.AlterField(
+            model_name='postmedia',
+            name='compressed_file',
+            field=models.FileField(blank=True, max_length=255, null=True, upload_to=social.models.compressed_image_upload_path, verbose_name='Fichier compressé'),
+        ),
+        migrations.AlterField(
+            model_name='postmedia',
+            name='hls_playlist',
+            field=models.FileField(blank=True, max_length=255, null=True, upload_to=social.models.hls_video_upload_path, verbose_name='Playlist HLS (.m3u8)'),
+        ),
+        migrations.AlterField(
+            model_name='postmedia',
+            name='original_file',
+            field=models.FileField(max_length=255, upload_to=social.models.post_media_upload_path, validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'gif', 'webp', 'mp4', 'mov', 'avi', 'webm', 'mkv'])], verbose_name='Fichier original'),
+        ),
+        migrations.AlterField(
+            model_name='postmedia',
+            name='thumbnail',
+            field=models.ImageField(blank=True, max_length=255, null=True, upload_to=social.models.compressed_image_upload_path, verbose_name='Miniature'),
+        ),
+        migrations.AddField(
+            model_name='postmedia',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='post_media', to='social.mediablob', verbose_name='Blob'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.0.1 on 2026-10-19 03:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0003_mediablob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediablob',
+            name='aspect_ratio',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mediablob',
+            name='blurhash',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='mediablob',
+            name='dominant_color',
+            field=models.CharField(blank=True, max_length=7),
+        ),
+        migrations.AddField(
+            model_name='postmedia',
+            name='aspect_ratio',
+            field=models.FloatField(blank=True, help_text='Largeur / hauteur', null=True),
+        ),
+        migrations.AddField(
+            model_name='postmedia',
+            name='blurhash',
+            field=models.CharField(blank=True, max_length=100, verbose_name='BlurHash'),
+        ),
+        migrations.AddField(
+            model_name='postmedia',
+            name='dominant_color',
+            field=models.CharField(blank=True, help_text='Couleur dominante (#rrggbb)', max_length=7),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='aspect_ratio',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='blurhash',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='dominant_color',
+            field=models.CharField(blank=True, max_length=7),
+        ),
+    ]
@@ -1,6 +1,7 @@
 import uuid
 import os
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.validators import FileExtensionValidator
@@ -24,6 +25,17 @@ def hls_video_upload_path(instance, filename):
     """Chemin pour les vidéos HLS"""
     return f"posts/{instance.post.author.id}/{instance.post.uuid}/hls/{filename}"
 
+def blob_upload_path(instance, filename):
+    """Chemin adressé par contenu pour l'original d'un blob"""
+    ext = filename.split('.')[-1].lower()
+    return f"{instance.storage_prefix}/original.{ext}"
+
+def blob_rendition_upload_path(instance, filename):
+    """Chemin pour les rendus (compressé, miniature) d'un blob"""
+    ext = filename.split('.')[-1]
+    unique_id = uuid.uuid4().hex[:8]
+    return f"{instance.storage_prefix}/compressed/{unique_id}.{ext}"
+
 
 class Follow(models.Model):
     """
@@ -110,6 +122,163 @@ class Post(models.Model):
         self.save(update_fields=['views_count'])
 
 
+class MediaBlob(models.Model):
+    """
+    Média stocké une seule fois, adressé par le SHA-256 de son contenu.
+    Les PostMedia identiques partagent le même blob (original, rendus
+    compressés et sortie HLS) via un compteur de références.
+    """
+    PROCESSING_STATUS_CHOICES = [
+        ('pending', 'En attente'),
+        ('processing', 'En cours'),
+        ('completed', 'Terminé'),
+        ('failed', 'Échec'),
+    ]
+
+    # Champs recopiés sur chaque PostMedia qui référence le blob
+    RENDITION_FIELDS = (
+        'original_file', 'compressed_file', 'thumbnail', 'hls_playlist', 'hls_ready',
+        'processing_status', 'processing_error', 'width', 'height', 'duration', 'file_size',
+        'blurhash', 'dominant_color', 'aspect_ratio',
+    )
+
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name="SHA-256")
+    media_type = models.CharField(
+        max_length=10,
+        choices=[('image', 'Image'), ('video', 'Video')],
+        verbose_name="Type"
+    )
+    # Chemins adressés par contenu: plus longs que les 100 caractères par défaut
+    original_file = models.FileField(
+        upload_to=blob_upload_path,
+        max_length=255,
+        verbose_name="Fichier original"
+    )
+    compressed_file = models.FileField(
+        upload_to=blob_rendition_upload_path,
+        max_length=255,
+        null=True,
+        blank=True
+    )
+    thumbnail = models.ImageField(
+        upload_to=blob_rendition_upload_path,
+        max_length=255,
+        null=True,
+        blank=True
+    )
+    hls_playlist = models.FileField(max_length=255, null=True, blank=True)
+    hls_ready = models.BooleanField(default=False)
+    processing_status = models.CharField(
+        max_length=20,
+        choices=PROCESSING_STATUS_CHOICES,
+        default='pending'
+    )
+    processing_error = models.TextField(blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True)
+    file_size = models.PositiveIntegerField(null=True, blank=True)
+    blurhash = models.CharField(max_length=100, blank=True)
+    dominant_color = models.CharField(max_length=7, blank=True)
+    aspect_ratio = models.FloatField(null=True, blank=True)
+
+    ref_count = models.PositiveIntegerField(default=0, verbose_name="Références")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Blob média"
+        verbose_name_plural = "Blobs médias"
+
+    def __str__(self):
+        return f"{self.media_type}: {self.sha256[:12]} ({self.ref_count} réf.)"
+
+    @property
+    def storage_prefix(self):
+        return f"blobs/{self.sha256[:2]}/{self.sha256}"
+
+    def rendition_values(self):
+        """Valeurs à recopier sur les PostMedia qui pointent vers ce blob"""
+        values = {}
+        for name in self.RENDITION_FIELDS:
+            value = getattr(self, name)
+            if isinstance(value, models.fields.files.FieldFile):
+                # Seul le nom est partagé: le fichier n'est jamais recopié
+                value = value.name or None
+            values[name] = value
+        return values
+
+    def propagate_renditions(self):
+        """
+        Met à jour tous les PostMedia liés après (re)traitement du blob,
+        sous le verrou de acquire: un PostMedia en cours de création est
+        soit déjà visible, soit créé ensuite avec les rendus à jour.
+        """
+        with transaction.atomic():
+            MediaBlob.objects.select_for_update().filter(pk=self.pk).first()
+            return PostMedia.objects.filter(blob=self).update(**self.rendition_values())
+
+    @classmethod
+    def acquire(cls, sha256, uploaded_file, media_type, **media_fields):
+        """
+        Récupère (ou crée) le blob correspondant au hash, prend une référence
+        et crée le PostMedia (`media_fields`: post, order...) dans la même
+        transaction verrouillée. Le fichier n'est écrit sur le disque que
+        pour le premier upload; un échec annule la référence.
+
+        Returns:
+            tuple: (post_media, created)
+        """
+        saved = None
+        try:
+            with transaction.atomic():
+                blob, created = cls.objects.select_for_update().get_or_create(
+                    sha256=sha256,
+                    defaults={'media_type': media_type}
+                )
+                if created:
+                    blob.original_file.save(uploaded_file.name, uploaded_file, save=False)
+                    saved = blob.original_file.name
+                    blob.file_size = uploaded_file.size
+                    blob.save(update_fields=['original_file', 'file_size'])
+                cls.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+                post_media = PostMedia.objects.create(
+                    blob=blob,
+                    media_type=blob.media_type,
+                    **media_fields,
+                    **blob.rendition_values()
+                )
+        except Exception:
+            if saved:
+                blob.original_file.storage.delete(saved)
+            raise
+        blob.refresh_from_db(fields=['ref_count'])
+        return post_media, created
+
+    @classmethod
+    def release(cls, blob_id):
+        """
+        Libère une référence. Le blob et ses fichiers ne sont supprimés
+        que lorsque plus aucun PostMedia ne l'utilise.
+
+        Returns:
+            bool: True si le blob a été supprimé
+        """
+        from .media_processing import delete_media_prefix
+
+        with transaction.atomic():
+            try:
+                blob = cls.objects.select_for_update().get(pk=blob_id)
+            except cls.DoesNotExist:
+                return False
+            blob.ref_count = max(blob.ref_count - 1, 0)
+            if blob.ref_count or blob.post_media.exists():
+                blob.save(update_fields=['ref_count'])
+                return False
+            prefix = blob.storage_prefix
+            blob.delete()
+            transaction.on_commit(lambda: delete_media_prefix(prefix))
+        return True
+
 class PostMedia(models.Model):
     """
     Média attaché à un post (image ou vidéo).
@@ -134,10 +303,20 @@ class PostMedia(models.Model):
         related_name='media',
         verbose_name="Post"
     )
+    # Blob dédupliqué partagé (None pour les médias antérieurs à la déduplication)
+    blob = models.ForeignKey(
+        MediaBlob,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='post_media',
+        verbose_name="Blob"
+    )
     
     # Fichier original
     original_file = models.FileField(
         upload_to=post_media_upload_path,
+        max_length=255,
         verbose_name="Fichier original",
         validators=[FileExtensionValidator(
             allowed_extensions=['jpg', 'jpeg', 'png', 'gif', 'webp', 'mp4', 'mov', 'avi', 'webm', 'mkv']
@@ -153,12 +332,14 @@ class PostMedia(models.Model):
     # Image compressée (pour les images)
     compressed_file = models.FileField(
         upload_to=compressed_image_upload_path,
+        max_length=255,
         null=True,
         blank=True,
         verbose_name="Fichier compressé"
     )
     thumbnail = models.ImageField(
         upload_to=compressed_image_upload_path,
+        max_length=255,
         null=True,
         blank=True,
         verbose_name="Miniature"
@@ -167,6 +348,7 @@ class PostMedia(models.Model):
     # HLS (pour les vidéos)
     hls_playlist = models.FileField(
         upload_to=hls_video_upload_path,
+        max_length=255,
         null=True,
         blank=True,
         verbose_name="Playlist HLS (.m3u8)"
@@ -188,6 +370,11 @@ class PostMedia(models.Model):
     duration = models.FloatField(null=True, blank=True, help_text="Durée en secondes (vidéos)")
     file_size = models.PositiveIntegerField(null=True, blank=True, help_text="Taille en bytes")
     
+    # Placeholder de premier affichage (calculé au traitement)
+    blurhash = models.CharField(max_length=100, blank=True, verbose_name="BlurHash")
+    dominant_color = models.CharField(max_length=7, blank=True, help_text="Couleur dominante (#rrggbb)")
+    aspect_ratio = models.FloatField(null=True, blank=True, help_text="Largeur / hauteur")
+    
     order = models.PositiveIntegerField(default=0, verbose_name="Ordre")
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -317,6 +504,11 @@ class Story(models.Model):
     hls_ready = models.BooleanField(default=False)
     
     duration = models.FloatField(default=5.0, help_text="Durée d'affichage en secondes")
+    
+    # Placeholder de premier affichage
+    blurhash = models.CharField(max_length=100, blank=True)
+    dominant_color = models.CharField(max_length=7, blank=True)
+    aspect_ratio = models.FloatField(null=True, blank=True)
     views_count = models.PositiveIntegerField(default=0)
     
     created_at = models.DateTimeField(auto_now_add=True)
@@ -22,10 +22,11 @@ class UserMiniSerializer(serializers.ModelSerializer):
     def get_avatar(self, obj):
         try:
             if obj.profile and obj.profile.avatar:
+                url = obj.profile.avatar_url(96)
                 request = self.context.get('request')
                 if request:
-                    return request.build_absolute_uri(obj.profile.avatar.url)
-                return obj.profile.avatar.url
+                    return request.build_absolute_uri(url)
+                return url
         except UserProfile.DoesNotExist:
             pass
         return f"https://api.dicebear.com/7.x/avataaars/png?seed={obj.username}"
@@ -70,7 +71,8 @@ class PostMediaSerializer(serializers.ModelSerializer):
         model = PostMedia
         fields = [
             'uuid', 'media_type', 'display_url', 'thumbnail_url', 'hls_url',
-            'width', 'height', 'duration', 'processing_status', 'hls_ready', 'order'
+            'width', 'height', 'duration', 'processing_status', 'hls_ready', 'order',
+            'blurhash', 'dominant_color', 'aspect_ratio'
         ]
     
     def get_display_url(self, obj):
@@ -199,6 +201,7 @@ class StorySerializer(serializers.ModelSerializer):
         fields = [
             'uuid', 'author', 'media_url', 'hls_url', 'media_type',
             'duration', 'views_count', 'is_viewed',
+            'blurhash', 'dominant_color', 'aspect_ratio',
             'created_at', 'expires_at'
         ]
     
@@ -263,10 +266,11 @@ class UserProfileSerializer(serializers.ModelSerializer):
     def get_avatar(self, obj):
         try:
             if obj.profile and obj.profile.avatar:
+                url = obj.profile.avatar_url(256)
                 request = self.context.get('request')
                 if request:
-                    return request.build_absolute_uri(obj.profile.avatar.url)
-                return obj.profile.avatar.url
+                    return request.build_absolute_uri(url)
+                return url
         except UserProfile.DoesNotExist:
             pass
         return f"https://api.dicebear.com/7.x/avataaars/png?seed={obj.username}"
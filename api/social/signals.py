@@ -0,0 +1,14 @@
+"""
+Références des MediaBlob: toute suppression de PostMedia (vue, admin,
+cascade depuis le post ou l'utilisateur, ORM) rend sa référence au blob
+"""
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import MediaBlob, PostMedia
+
+
+@receiver(post_delete, sender=PostMedia)
+def post_media_deleted(sender, instance, **kwargs):
+    if instance.blob_id:
+        MediaBlob.release(instance.blob_id)
@@ -0,0 +1,161 @@
+"""
+Abstraction de stockage pour le pipeline média d'Ondes Social.
+
+Le backend réel est `default_storage` : disque local (MEDIA_ROOT) par défaut,
+ou stockage objet compatible S3 (AWS, MinIO, moto) si AWS_STORAGE_BUCKET_NAME
+est défini. FFmpeg et Pillow ont besoin de fichiers locaux : ces helpers
+fournissent une copie locale lue en streaming et publient les sorties
+(HLS notamment) en parallèle, pour que les nœuds API restent sans état.
+"""
+import os
+import shutil
+import tempfile
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger('social')
+
+
+def local_path(name, storage=None):
+    """Chemin disque d'un nom de stockage, ou None si le backend est distant"""
+    storage = storage or default_storage
+    try:
+        return storage.path(name)
+    except NotImplementedError:
+        return None
+
+
+@contextmanager
+def open_local(field_file):
+    """
+    Fournit un chemin local lisible pour un FieldFile.
+    Sur disque: le fichier lui-même. Sinon: copie temporaire lue par chunks.
+    """
+    path = local_path(field_file.name, field_file.storage)
+    if path is not None:
+        yield path
+        return
+
+    suffix = os.path.splitext(field_file.name)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        with field_file.storage.open(field_file.name, 'rb') as src:
+            for chunk in src.chunks():
+                tmp.write(chunk)
+        tmp.flush()
+        yield tmp.name
+
+
+@contextmanager
+def output_dir(prefix):
+    """
+    Répertoire de travail pour des sorties destinées à `prefix`.
+    Sur disque, c'est directement le dossier final ; sinon un dossier
+    temporaire à publier avec `publish_directory`.
+    """
+    path = local_path(prefix)
+    if path is not None:
+        os.makedirs(path, exist_ok=True)
+        yield path
+        return
+
+    tmp_dir = tempfile.mkdtemp(prefix='ondes_media_')
+    try:
+        yield tmp_dir
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def publish_directory(source_dir, prefix, storage=None):
+    """
+    Publie le contenu de `source_dir` sous `prefix` en conservant
+    l'arborescence (indispensable pour les playlists HLS relatives).
+    Les fichiers sont envoyés en parallèle ; le backend S3 découpe
+    lui-même les gros fichiers en multipart (AWS_S3_TRANSFER_CONFIG).
+
+    Returns:
+        list: noms de stockage publiés
+    """
+    storage = storage or default_storage
+    if local_path(prefix, storage) == source_dir:
+        return []
+
+    uploads = []
+    for root, _, files in os.walk(source_dir):
+        for filename in files:
+            full_path = os.path.join(root, filename)
+            relative = os.path.relpath(full_path, source_dir).replace(os.sep, '/')
+            uploads.append((full_path, f"{prefix}/{relative}"))
+
+    def _upload(item):
+        full_path, name = item
+        # Les noms doivent rester exacts: pas de suffixe anti-collision
+        if storage.exists(name):
+            storage.delete(name)
+        with open(full_path, 'rb') as f:
+            return storage.save(name, File(f))
+
+    workers = getattr(settings, 'MEDIA_UPLOAD_WORKERS', 8)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_upload, uploads))
+
+
+def delete_prefix(prefix, storage=None):
+    """Supprime tous les fichiers stockés sous `prefix`"""
+    storage = storage or default_storage
+    path = local_path(prefix, storage)
+    if path is not None:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        return
+
+    bucket = getattr(storage, 'bucket', None)
+    if bucket is not None:
+        # S3: suppression par lots (DeleteObjects, 1000 clés par requête)
+        location = getattr(storage, 'location', '')
+        key_prefix = '/'.join(p for p in (location.strip('/'), prefix.strip('/')) if p)
+        bucket.objects.filter(Prefix=f"{key_prefix}/").delete()
+        return
+
+    for name in walk(prefix, storage):
+        storage.delete(name)
+
+
+def walk(prefix='', storage=None):
+    """
+    Itère récursivement sur les noms de fichiers stockés sous `prefix`,
+    en ordre lexicographique des noms complets (compatible avec un
+    ORDER BY binaire, pour les jointures triées de media_gc).
+    """
+    storage = storage or default_storage
+    try:
+        dirs, files = storage.listdir(prefix)
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    base = f"{prefix}/" if prefix else ''
+    # "a/" doit trier après "a.txt", comme dans le nom complet "a/x"
+    entries = [(f"{d}/", True) for d in dirs] + [(f, False) for f in files]
+    for name, is_dir in sorted(entries):
+        if is_dir:
+            yield from walk(base + name[:-1], storage)
+        else:
+            yield base + name
+
+
+def move(name, target, storage=None):
+    """Déplace un fichier stocké (mise en quarantaine)"""
+    storage = storage or default_storage
+    source_path = local_path(name, storage)
+    if source_path is not None:
+        target_path = local_path(target, storage)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        os.replace(source_path, target_path)
+        return target
+    with storage.open(name, 'rb') as src:
+        saved = storage.save(target, src)
+    storage.delete(name)
+    return saved
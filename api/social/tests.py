@@ -0,0 +1,128 @@
+import random
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+
+from chat.models import Conversation, MessageArchive
+from social.management.commands.media_gc import iter_orphans, iter_references
+from social.models import MediaBlob, Post, PostMedia
+from social.storage import walk
+from store.models import UserProfile
+
+
+def _covered(name, references):
+    return name in references or any(
+        ref.endswith('/') and name.startswith(ref) for ref in references
+    )
+
+
+class IterOrphansTests(TestCase):
+    """Jointure triée de media_gc: jamais un fichier référencé"""
+
+    def test_random_trees(self):
+        rng = random.Random(28)
+        parts = ['a', 'a.b', 'a-b', 'a_b', 'b', 'hls', 'z', '0', 'A']
+        for _ in range(300):
+            stored = sorted({
+                '/'.join(rng.choice(parts) for _ in range(rng.randint(1, 4))) + rng.choice(['', '.ts', '.jpg'])
+                for _ in range(rng.randint(0, 40))
+            })
+            references = set(rng.sample(stored, rng.randint(0, len(stored))))
+            # Playlists HLS: le dossier entier est référencé
+            for name in rng.sample(stored, min(3, len(stored))):
+                if '/' in name:
+                    references.add(name.rsplit('/', 1)[0] + '/')
+            references.update(f'missing/{i}' for i in range(rng.randint(0, 3)))
+
+            orphans = list(iter_orphans(iter(stored), iter(sorted(references))))
+            expected = [name for name in stored if not _covered(name, references)]
+            self.assertEqual(orphans, expected)
+
+
+class MediaGcReferencesTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+    def save(self, name):
+        self.assertEqual(default_storage.save(name, ContentFile(b'x')), name)
+
+    def test_references_are_never_orphans(self):
+        user = User.objects.create_user('gc', password='x')
+        other = User.objects.create_user('gc2', password='x')
+        UserProfile.objects.create(
+            user=user, avatar='avatars/a.jpg',
+            avatar_renditions={'96': {'webp': 'avatars/renditions/1/h_96.webp'}},
+        )
+        conversation, _ = Conversation.get_or_create_private(user, other, {user.id: 'k', other.id: 'k'})
+        MessageArchive.objects.create(
+            conversation=conversation, month='2024-01-01', path='chat/archive/2024-01.bin',
+            offset=0, length=1, seq_min=1, seq_max=1, count=1,
+        )
+        for name in ('avatars/a.jpg', 'avatars/renditions/1/h_96.webp',
+                     'chat/archive/2024-01.bin', 'avatars/orphan.jpg', 'chat/archive/2023-12.bin'):
+            self.save(name)
+
+        orphans = list(iter_orphans(walk(), iter_references(chunk_size=1)))
+        self.assertEqual(orphans, ['avatars/orphan.jpg', 'chat/archive/2023-12.bin'])
+
+
+class MediaBlobAcquireTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.post = Post.objects.create(author=User.objects.create_user('blob', password='x'))
+
+    def acquire(self, **fields):
+        upload = SimpleUploadedFile('a.jpg', b'data')
+        return MediaBlob.acquire('ab' * 32, upload, 'image', **fields)
+
+    def test_shared_blob(self):
+        first, created = self.acquire(post=self.post, order=0)
+        second, created_again = self.acquire(post=self.post, order=1)
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(second.blob.ref_count, 2)
+        self.assertEqual(first.original_file.name, first.blob.original_file.name)
+
+    def test_failed_create_releases_reference(self):
+        media, _ = self.acquire(post=self.post, order=0)
+        with self.assertRaises(IntegrityError):
+            self.acquire(post=None)
+        blob = MediaBlob.objects.get()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertEqual(PostMedia.objects.count(), 1)
+        self.assertTrue(default_storage.exists(blob.original_file.name))
+
+    def test_failed_first_upload_leaves_nothing(self):
+        with self.assertRaises(IntegrityError):
+            self.acquire(post=None)
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertEqual(list(walk()), [])
+
+    def test_propagation_reaches_media_created_while_processing(self):
+        media, _ = self.acquire(post=self.post, order=0)
+        blob = media.blob
+        blob.processing_status = 'processing'
+        blob.save()
+        late, _ = self.acquire(post=self.post, order=1)
+        self.assertEqual(late.processing_status, 'processing')
+
+        blob.processing_status = 'completed'
+        blob.width = 10
+        blob.save()
+        blob.propagate_renditions()
+        self.assertEqual(
+            set(PostMedia.objects.values_list('processing_status', 'width')), {('completed', 10)}
+        )
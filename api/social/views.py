@@ -1,7 +1,6 @@
 import json
-import os
 import logging
-import shutil
+import posixpath
 import uuid
 import mimetypes
 from threading import Thread
@@ -17,10 +16,9 @@ from django.contrib.auth.models import User
 from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.conf import settings
 
 from .models import (
-    Follow, Post, PostMedia, PostLike, PostComment,
+    Follow, Post, MediaBlob, PostLike, PostComment,
     CommentLike, Story, StoryView, Bookmark
 )
 from .serializers import (
@@ -30,7 +28,9 @@ from .serializers import (
 )
 from friends.models import Friendship
 from .feed_algorithm import LocalFeedAlgorithm
-from .media_processing import process_post_media, process_story_media
+from .media_processing import (
+    process_post_media, process_story_media, hash_uploaded_file, delete_media_prefix
+)
 
 
 MAX_PAGE_LIMIT = 100
@@ -234,20 +234,20 @@ class PublishPostView(APIView):
             else:
                 continue
             
-            # Créer le PostMedia
-            post_media = PostMedia.objects.create(
-                post=post,
-                original_file=media_file,
-                media_type=media_type,
-                order=i
-            )
+            # Blob adressé par contenu: un re-post du même fichier ne coûte
+            # qu'un passage de hash, sans nouvelle écriture ni transcodage
+            # PostMedia créé avec la référence (rendus partagés recopiés)
+            sha256 = hash_uploaded_file(media_file)
+            post_media, created = MediaBlob.acquire(sha256, media_file, media_type, post=post, order=i)
+            blob = post_media.blob
             
             # Lancer le traitement en arrière-plan (compression/HLS)
             # Note: En production, utiliser Celery ou Django-Q
-            try:
-                process_post_media(post_media)
-            except Exception as e:
-                logger.error(f"Media processing error: {e}")
+            if created or blob.processing_status == 'failed':
+                try:
+                    process_post_media(post_media)
+                except Exception as e:
+                    logger.error(f"Media processing error: {e}")
         
         return Response({
             'success': True,
@@ -324,25 +324,14 @@ class DeletePostView(APIView):
 
     def delete(self, request, post_uuid):
         post = get_object_or_404(Post, uuid=post_uuid, author=request.user)
+        post_prefix = f"posts/{post.author.id}/{post.uuid}"
         
-        # Get the post folder path before deleting
-        post_folder = os.path.join(
-            settings.MEDIA_ROOT,
-            'posts',
-            str(post.author.id),
-            str(post.uuid)
-        )
-        
-        # Hard delete the post and related data (cascades to media)
+        # Hard delete the post and related data (cascades to media).
+        # Les références aux blobs partagés sont rendues par social/signals.py
         post.delete()
         
-        # Delete the entire post folder
-        if os.path.exists(post_folder) and os.path.isdir(post_folder):
-            try:
-                shutil.rmtree(post_folder)
-                logger.info(f"Deleted post folder: {post_folder}")
-            except Exception as e:
-                logger.error(f"Error deleting post folder: {e}")
+        # Dossier propre au post (médias antérieurs à la déduplication)
+        delete_media_prefix(post_prefix)
         
         return Response({'success': True, 'message': 'Post deleted'})
 
@@ -648,9 +637,11 @@ class CreateStoryView(APIView):
             duration=min(duration, 60.0)  # Max 60 secondes
         )
 
-        # Traitement HLS pour les vidéos en arrière-plan
+        # Placeholder immédiat pour les images, HLS en arrière-plan pour les vidéos
         if media_type == 'video':
             Thread(target=process_story_media, args=(story,), daemon=True).start()
+        else:
+            process_story_media(story)
         
         return Response({
             'success': True,
@@ -758,26 +749,16 @@ class DeleteStoryView(APIView):
     def delete(self, request, story_uuid):
         story = get_object_or_404(Story, uuid=story_uuid, author=request.user)
         
-        # Delete media file from disk
+        # Delete media file from storage
         if story.media:
             try:
-                if os.path.exists(story.media.path):
-                    os.remove(story.media.path)
+                story.media.delete(save=False)
             except Exception as e:
                 logger.error(f"Error deleting story media file: {e}")
         
-        # Delete HLS files if exists
+        # Delete HLS files if exists (whole HLS directory)
         if story.hls_playlist:
-            try:
-                hls_path = story.hls_playlist.path
-                if os.path.exists(hls_path):
-                    os.remove(hls_path)
-                # Delete HLS directory
-                hls_dir = os.path.dirname(hls_path)
-                if os.path.exists(hls_dir) and os.path.isdir(hls_dir):
-                    shutil.rmtree(hls_dir)
-            except Exception as e:
-                logger.error(f"Error deleting story HLS files: {e}")
+            delete_media_prefix(posixpath.dirname(story.hls_playlist.name))
         
         story.delete()
         
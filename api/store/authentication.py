@@ -0,0 +1,88 @@
+"""
+Authentification par token en cache (REST et WebSocket)
+
+token → utilisateur dans un TieredCache (ondes_backend/tiered_cache.py):
+cache partagé (AUTH_TOKEN_CACHE_TTL) et LRU par processus contrôlée par
+génération (AUTH_TOKEN_LOCAL_TTL).
+
+Invalidé à la suppression du token et à chaque enregistrement de
+l'utilisateur, désactivation comprise (store/signals.py): un token révoqué
+ou un utilisateur désactivé est refusé par tous les workers aussitôt, pas
+à l'expiration locale. Un update() en masse ne passe pas par les signaux:
+il prend effet à l'expiration des TTL. En régime établi, authentifier
+une requête ne coûte aucune requête SQL et un GET de cache.
+
+Les clés de cache sont des empreintes SHA-256 (les tokens ne sont pas
+copiés dans Redis), et chaque appel reconstruit une instance User neuve:
+rien n'est partagé entre requêtes.
+"""
+import hashlib
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from ondes_backend.tiered_cache import TieredCache
+
+# Le hash du mot de passe ne quitte pas la base (champ différé si lu)
+USER_FIELDS = [f.attname for f in User._meta.concrete_fields if f.attname != 'password']
+
+entries = TieredCache('AUTH_TOKEN_CACHE_TTL', 'AUTH_TOKEN_LOCAL_TTL')
+
+
+def cache_key(token_key):
+    return f"auth:token:{hashlib.sha256(token_key.encode()).hexdigest()}"
+
+
+def load_entry(token_key):
+    """(champs de l'utilisateur, date du token) lus en base, None si inconnu"""
+    token = Token.objects.select_related('user').filter(key=token_key).first()
+    if token is None:
+        return None
+    return [getattr(token.user, name) for name in USER_FIELDS], token.created
+
+
+def get_entry(token_key):
+    return entries.get(cache_key(token_key), lambda: load_entry(token_key))
+
+
+def authenticate_token(token_key):
+    """
+    Returns:
+        (user, token) reconstruits depuis le cache, None si le token est inconnu
+    """
+    if not token_key:
+        return None
+    entry = get_entry(token_key)
+    if entry is None:
+        return None
+    values, created = entry
+    user = User.from_db(DEFAULT_DB_ALIAS, USER_FIELDS, values)
+    token = Token.from_db(DEFAULT_DB_ALIAS, ['key', 'user_id', 'created'], [token_key, user.pk, created])
+    token.user = user
+    return user, token
+
+
+def invalidate(token_key):
+    entries.invalidate(cache_key(token_key))
+
+
+def invalidate_user(user_id):
+    for token_key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        invalidate(token_key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication servie par le cache token → utilisateur"""
+
+    def authenticate_credentials(self, key):
+        found = authenticate_token(key)
+        if found is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        user, token = found
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return user, token
@@ -0,0 +1,52 @@
+"""
+process_avatars — Génère les rendus des avatars existants.
+
+Usage:
+    python manage.py process_avatars              # avatars sans rendus
+    python manage.py process_avatars --force      # tout régénérer
+    python manage.py process_avatars --workers 8
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from social.media_processing import process_avatar
+from store.models import UserProfile
+
+
+def _process(profile_id):
+    try:
+        profile = UserProfile.objects.get(pk=profile_id)
+        process_avatar(profile)
+    finally:
+        # Chaque thread a sa propre connexion
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Génère les rendus (48/96/256 px, WebP + JPEG) des avatars existants"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--force', action='store_true', help="Régénérer les avatars déjà traités")
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.exclude(avatar='').exclude(avatar__isnull=True)
+        if not options['force']:
+            profiles = profiles.filter(avatar_renditions={})
+        profile_ids = list(profiles.values_list('pk', flat=True))
+        self.stdout.write(f"{len(profile_ids)} avatars à traiter")
+
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(_process, pk): pk for pk in profile_ids}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"  profil {futures[future]}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(f"{done} avatars traités, {failed} échecs"))
@@ -1,18 +1,39 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db.models import Avg
 import uuid
 
 
 class UserProfile(models.Model):
+    # Tailles des rendus d'avatar (px, carrés)
+    AVATAR_SIZES = (48, 96, 256)
+
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
     bio = models.TextField(blank=True)
+    # {"96": {"webp": "avatars/renditions/<hash>_96.webp", "jpeg": "..."}, ...}
+    avatar_renditions = models.JSONField(default=dict, blank=True)
+    avatar_blurhash = models.CharField(max_length=100, blank=True)
+    avatar_dominant_color = models.CharField(max_length=7, blank=True)
     
     def __str__(self):
         return self.user.username
 
+    def avatar_rendition(self, size, fmt='jpeg'):
+        """Nom du plus petit rendu couvrant `size` px (l'original si non traité)"""
+        if self.avatar_renditions:
+            sizes = sorted(int(s) for s in self.avatar_renditions)
+            best = next((s for s in sizes if s >= size), sizes[-1])
+            return self.avatar_renditions[str(best)].get(fmt)
+        return self.avatar.name if self.avatar else None
+
+    def avatar_url(self, size, fmt='jpeg'):
+        """URL de l'avatar adaptée à une taille d'affichage (px)"""
+        name = self.avatar_rendition(size, fmt)
+        return default_storage.url(name) if name else None
+
 
 class Category(models.Model):
     """Catégories d'applications similaires à l'App Store"""
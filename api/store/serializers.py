@@ -8,7 +8,8 @@ class UserProfileSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = UserProfile
-        fields = ['username', 'avatar', 'bio']
+        fields = ['username', 'avatar', 'bio', 'avatar_renditions', 'avatar_blurhash', 'avatar_dominant_color']
+        read_only_fields = ['avatar_renditions', 'avatar_blurhash', 'avatar_dominant_color']
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -59,10 +60,11 @@ class ReviewAuthorSerializer(serializers.ModelSerializer):
     def get_avatar(self, obj):
         try:
             if obj.profile and obj.profile.avatar:
+                url = obj.profile.avatar_url(96)
                 request = self.context.get('request')
                 if request:
-                    return request.build_absolute_uri(obj.profile.avatar.url)
-                return obj.profile.avatar.url
+                    return request.build_absolute_uri(url)
+                return url
         except:
             pass
         return None
@@ -0,0 +1,29 @@
+"""
+- Invalidation du cache token → utilisateur (store/authentication.py)
+- Suppression des rendus d'avatar avec le profil
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import authentication
+from .models import UserProfile
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    authentication.invalidate(instance.key)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    """Désactivation, changement de nom...: l'utilisateur en cache est périmé"""
+    if not created:
+        authentication.invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=UserProfile)
+def profile_deleted(sender, instance, **kwargs):
+    from social.media_processing import avatar_renditions_prefix, delete_media_prefix
+    delete_media_prefix(avatar_renditions_prefix(instance))
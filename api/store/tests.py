@@ -0,0 +1,50 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+
+from ondes_backend.tiered_cache import TieredCache
+from store import authentication
+
+
+class TokenCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        authentication.entries.clear_local()
+        self.user = User.objects.create_user('auth', password='x')
+        self.token = Token.objects.create(user=self.user)
+
+    def other_worker_get(self, worker, key):
+        return worker.get(authentication.cache_key(key), lambda: authentication.load_entry(key))
+
+    def test_cached_authentication_needs_no_query(self):
+        user, token = authentication.authenticate_token(self.token.key)
+        self.assertEqual((user.pk, token.key), (self.user.pk, self.token.key))
+        with self.assertNumQueries(0):
+            user, _ = authentication.authenticate_token(self.token.key)
+        self.assertEqual(user.username, 'auth')
+
+    def test_revoked_token_refused_by_every_worker(self):
+        worker = TieredCache('AUTH_TOKEN_CACHE_TTL', 'AUTH_TOKEN_LOCAL_TTL')
+        key = self.token.key
+        self.assertIsNotNone(self.other_worker_get(worker, key))
+        self.assertIsNotNone(authentication.authenticate_token(key))
+
+        self.token.delete()
+        self.assertIsNone(authentication.authenticate_token(key))
+        # Copie locale encore fraîche dans l'autre worker: la génération la périme
+        self.assertIsNone(self.other_worker_get(worker, key))
+
+    def test_deactivated_user(self):
+        backend = authentication.CachedTokenAuthentication()
+        backend.authenticate_credentials(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            backend.authenticate_credentials(self.token.key)
+
+    def test_unknown_token(self):
+        self.assertIsNone(authentication.authenticate_token('missing'))
+        self.assertIsNone(authentication.authenticate_token(''))
@@ -79,7 +79,14 @@ class UserProfileView(APIView):
 
         serializer = UserProfileSerializer(profile, data=request.data, partial=True, context={'request': request})
         if serializer.is_valid():
-            serializer.save()
+            profile = serializer.save()
+            if 'avatar' in request.data:
+                from social.media_processing import process_avatar
+                try:
+                    process_avatar(profile)
+                except Exception as e:
+                    # L'original reste servi tant que les rendus manquent
+                    logger.error(f"Avatar processing failed for {request.user.username}: {e}")
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 